@@ -0,0 +1,188 @@
+"""Benchmark every route in-process against the memory engine, at several data sizes.
+
+Nothing needs to run besides this script: the app is built by `create_app(TestingConfig)`, so on
+the memory engine and with every hook the served app runs (compression, admission, metrics,
+consistency), and driven through Flask's test client signed in as the owner of the seeded tasks.
+The numbers measure our own code without network or database noise. Run it from the repository root:
+
+    python benchmarks/routes.py --sizes 100 1000 10000 --save-baseline benchmarks/baseline.json
+    python benchmarks/routes.py --sizes 100 1000 10000 --baseline benchmarks/baseline.json
+
+With --baseline the run fails (exit status 1) when a route's p95 latency or throughput, or the
+peak memory of a size, is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from itertools import count
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig  # noqa: E402
+from factory import create_app  # noqa: E402
+
+PASSWORD = 'benchmark'
+# The user the benchmark client is signed in as; every seeded task is theirs.
+OWNER = 'benchmark-owner'
+
+
+def make_app():
+    return create_app(TestingConfig)
+
+
+def seed(app, size):
+    """Insert `size` tasks of OWNER and `size` users; users share one hash to keep seeding fast."""
+    password = app.hasher.hash(PASSWORD)
+    task_ids = [
+        app.db.create_document('tasks', {'title': f"Task {i}", 'description': "Seeded", 'owner': OWNER})
+        for i in range(size)
+    ]
+    for i in range(size):
+        app.db.create_document('users', {'username': f"user{i}", 'password': password})
+    return task_ids
+
+
+def owner_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = OWNER
+    return client
+
+
+def scenarios(app, task_ids):
+    """Map each route to `(request, expected)`: a function issuing one request, and text its body must hold.
+
+    Every request must answer 200. Signing in and up would change the owner of the benchmark
+    client, so those go through a client of their own.
+    """
+    serial = count()
+    visitor = app.test_client()
+    # Deletes need a document of their own each time, so they work through fresh ones.
+    doomed = []
+
+    def drop(client):
+        if not doomed:
+            doomed.extend(app.db.create_document('tasks', {'title': "Doomed", 'owner': OWNER}) for _ in range(100))
+        return client.delete(f"/tasks/{doomed.pop()}/drop")
+
+    middle = task_ids[len(task_ids) // 2]
+    # New and doomed tasks soon fill the first page; any card shows the list is not empty.
+    card = 'class="card-title'
+    return {
+        'GET /': (lambda client: client.get('/'), card),
+        'GET /tasks': (lambda client: client.get('/tasks'), card),
+        'POST /tasks/create': (lambda client: client.post('/tasks/create', data={'title': "New task"}), "New task"),
+        'POST /tasks/<id>/update': (lambda client: client.post(
+            f"/tasks/{middle}/update", data={'title': f"Renamed {next(serial)}"}), "Renamed"),
+        'DELETE /tasks/<id>/drop': (drop, ""),
+        # Streamed: the time counts only once the whole body has been read.
+        'GET /tasks/all': (lambda client: client.get('/tasks/all'), "Task 0<"),
+        'GET /tasks/search': (lambda client: client.get('/tasks/search', query_string={'q': "task 1"}), "Task 1<"),
+        'GET /tasks/<id>/edit': (lambda client: client.get(f"/tasks/{middle}/edit"), f"/tasks/{middle}/update"),
+        'POST /users/login': (lambda client: visitor.post(
+            '/users/login', data={'username': 'user0', 'password': PASSWORD}), "Hello, user0!"),
+        'POST /users/signup': (lambda client: visitor.post(
+            '/users/signup', data={'username': f"new{next(serial)}", 'password': PASSWORD}), "Hello, new"),
+    }
+
+
+def percentile(latencies, fraction):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def call(client, request, expected):
+    """Issue one request, read its whole body and check it; returns the seconds taken."""
+    started = time.perf_counter()
+    # Closed as a WSGI server would, which frees the request's admission slot.
+    with request(client) as response:
+        body = response.get_data(as_text=True)
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200 or expected not in body:
+        raise RuntimeError(f"Unexpected response {response.status_code}, without {expected!r}: {body[:200]}")
+    return elapsed
+
+
+def measure(client, scenario, iterations):
+    latencies = sorted(call(client, *scenario) for _ in range(iterations))
+    return {
+        'throughput': round(iterations / sum(latencies), 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def run_size(size, iterations):
+    gc.collect()
+    tracemalloc.start()
+    app = make_app()
+    task_ids = seed(app, size)
+    client = owner_client(app)
+    requests = scenarios(app, task_ids)
+    # One untimed pass under tracemalloc: it measures peak memory and warms up templates.
+    for scenario in requests.values():
+        call(client, *scenario)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    routes = {name: measure(client, scenario, iterations) for name, scenario in requests.items()}
+    return {'peak_memory_kb': round(peak_memory / 1024), 'routes': routes}
+
+
+def run(sizes, iterations):
+    return {str(size): run_size(size, iterations) for size in sizes}
+
+
+def regressions(results, baseline, tolerance):
+    """List every measurement that is worse than its baseline by more than `tolerance` (a fraction)."""
+    found = []
+    for size, result in results.items():
+        expected = baseline.get(size)
+        if not expected:
+            continue
+        if result['peak_memory_kb'] > expected['peak_memory_kb'] * (1 + tolerance):
+            found.append(f"{size}: peak memory {result['peak_memory_kb']} KB > {expected['peak_memory_kb']} KB")
+        for route, stats in result['routes'].items():
+            reference = expected['routes'].get(route)
+            if not reference:
+                continue
+            if stats['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+                found.append(f"{size} {route}: p95 {stats['p95_ms']} ms > {reference['p95_ms']} ms")
+            if stats['throughput'] < reference['throughput'] / (1 + tolerance):
+                found.append(f"{size} {route}: throughput {stats['throughput']}/s < {reference['throughput']}/s")
+    return found
+
+
+def report(results):
+    for size, result in results.items():
+        print(f"\n{size} documents, peak memory {result['peak_memory_kb']} KB")
+        print(f"  {'route':<26}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for route, stats in result['routes'].items():
+            print(f"  {route:<26}{stats['throughput']:>10}{stats['p50_ms']:>10}"
+                  f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--baseline', help="JSON file from --save-baseline to compare against")
+    parser.add_argument('--save-baseline', help="write the results to this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.iterations)
+    report(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,51 @@
+"""Measure cold starts: import time, create_app() and the time to the first response.
+
+Every run is a fresh interpreter that imports the app, creates it and answers one request to
+/health/live through the test client, then reports `app.startup`. Run it from the repository root:
+
+    python benchmarks/startup.py --runs 10
+    STORAGE=mongodb python benchmarks/startup.py --runs 10
+
+With STORAGE=mongodb and no server reachable, create_app() still returns at once, since the
+engine connects from a background thread.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBE = """
+import json
+from factory import create_app
+app = create_app()
+app.test_client().get('/health/live')
+print(json.dumps(app.startup))
+"""
+
+
+def cold_start():
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs):
+    samples = [cold_start() for _ in range(runs)]
+    return {
+        key: {
+            'median_ms': round(statistics.median(sample[key] for sample in samples) * 1000, 1),
+            'max_ms': round(max(sample[key] for sample in samples) * 1000, 1),
+        }
+        for key in samples[0]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for step, stats in run(args.runs).items():
+        print(f"{step:<28}{stats['median_ms']:>10} ms median{stats['max_ms']:>10} ms max")
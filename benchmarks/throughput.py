@@ -0,0 +1,55 @@
+"""Measure throughput and latency of a running Task Tracker server.
+
+Compare the sync and async database paths by starting the same server twice against the same MongoDB:
+
+    STORAGE=mongodb PYTHONPATH=. flask --app __init__ run --port 5000 --with-threads
+    STORAGE=mongodb-async PYTHONPATH=. flask --app __init__ run --port 5001 --with-threads
+
+    python benchmarks/throughput.py http://localhost:5000 --concurrency 64 --requests 5000
+    python benchmarks/throughput.py http://localhost:5001 --concurrency 64 --requests 5000
+"""
+import argparse
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url):
+    started = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def percentile(latencies, fraction):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def run(base_url, paths, concurrency, requests):
+    urls = [f"{base_url}{paths[i % len(paths)]}" for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(fetch, urls))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'throughput': round(requests / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base_url')
+    parser.add_argument('--paths', nargs='+', default=['/', '/tasks', '/cancel'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    for key, value in run(args.base_url.rstrip('/'), args.paths, args.concurrency, args.requests).items():
+        print(f"{key:>12}: {value}")
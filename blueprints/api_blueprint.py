@@ -1,26 +1,33 @@
-from flask import Blueprint, render_template, request, current_app
+from flask import Blueprint, abort, render_template, request, current_app, jsonify
+
+from blueprints.component_blueprint import read_first_page
+from utils.etag import conditional
+from utils.sessions import current_owner
+from utils.streaming import Peekable, stream_page
+from utils.transfer import authorized
 
 api = Blueprint('api', __name__)
 
 
-@api.route('/users>')
-@api.route('/tasks')
+@api.route('/tasks', defaults={'collection': 'tasks'})
+@conditional()
 def list_documents(collection):
-    """List documents in a collection."""
-    component = f"{collection}/list.html"
-    documents = current_app.db.read_documents(collection)
+    """List documents in a collection, one page at a time."""
     if collection == "tasks":
+        after = request.args.get('after')
+        documents, next_cursor = current_app.db.read_page(
+            collection,
+            after=after,
+            page_size=current_app.config['PAGE_SIZE'],
+            projection=current_app.config['TASK_LIST_PROJECTION'],
+            owner=current_owner()
+        )
+        # Follow-up pages replace the scroll sentinel, so they render without the list wrapper.
+        component = f"{collection}/page.html" if after else f"{collection}/list.html"
         return render_template(
             component,
-            view={
-                'title': 'Tasks',
-                'collection': 'tasks',
-                'documents': documents
-            })
-    elif collection == "users":
-        return render_template(
-            component,
-            users=documents
+            documents=documents,
+            next_cursor=next_cursor
         )
     return render_template(
         'errors/404.html',
@@ -28,11 +35,68 @@ def list_documents(collection):
     )
 
 
+def stream_documents(collection, projection_setting):
+    """Read every document of a collection the user may see lazily, in batches, for a streamed template."""
+    return Peekable(current_app.db.iter_documents(
+        collection,
+        projection=current_app.config[projection_setting],
+        batch_size=current_app.config['STREAM_BATCH_SIZE'],
+        owner=current_owner()
+    ))
+
+
+@api.route('/users')
+def list_users():
+    """Every account, streamed, for administrators: like the export, it needs TRANSFER_TOKEN as a bearer token.
+
+    Checked before anything else, ETags included, so that anonymous callers learn nothing.
+    iter_documents is a plain generator on every engine, so the async engine uses this view too.
+    """
+    if not authorized():
+        abort(404)
+    return stream_page('users/list.html', users=stream_documents('users', 'USER_LIST_PROJECTION'))
+
+
+@api.route('/tasks/all', defaults={'collection': 'tasks'})
+@conditional()
+def list_all_documents(collection):
+    """The whole task list at once, streamed as it is read, for views that cannot page through it."""
+    return stream_page(
+        f"{collection}/list.html",
+        documents=stream_documents(collection, 'TASK_LIST_PROJECTION'),
+        next_cursor=None
+    )
+
+
+@api.route('/tasks/search', defaults={'collection': 'tasks'})
+@conditional()
+def search_documents(collection):
+    """Active search: the best matches for `q`, or the first page of the list when `q` is empty."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        documents, next_cursor = read_first_page(collection)
+        return render_template(f"{collection}/list.html", documents=documents, next_cursor=next_cursor)
+    return render_template(
+        f"{collection}/list.html",
+        documents=current_app.db.search_documents(
+            collection,
+            query,
+            limit=current_app.config['SEARCH_LIMIT'],
+            projection=current_app.config['TASK_LIST_PROJECTION'],
+            max_time_ms=current_app.config['SEARCH_MAX_TIME_MS'],
+            owner=current_owner()
+        ),
+        next_cursor=None,
+        empty_message=f"No tasks match {query}."
+    )
+
+
 @api.route('/<string:collection>/create', methods=['POST'])
 def create_document(collection):
-    """Create a new document in a collection."""
-    component = f"{collection}/list.html"
-    document = request.form.to_dict()
+    """Create a new document in a collection and return its card."""
+    document = current_app.db.client_fields(request.form.to_dict())
+    # Tasks belong to whoever creates them; an `owner` sent with the form is overwritten.
+    document.update(current_app.db.owner_filter(collection, current_owner()))
     _id = current_app.db.create_document(collection, document)
     if not _id:
         print(f"Error creating a new document in {collection}.")
@@ -41,32 +105,72 @@ def create_document(collection):
             message=f"Error creating a new document."
         )
     print(f"New document created in {collection} with ID: {_id}")
-    documents = current_app.db.read_documents(collection)
+    document['_id'] = _id
     return render_template(
-        component, documents=documents
+        f"{collection}/created.html", doc=document
     )
 
 
 @api.route('/<string:collection>/<string:document_id>/update', methods=['POST', 'PUT'])
 def update_document(collection, document_id):
-    """Update an existing document in a collection."""
-    component = f"{collection}/list.html"
+    """Update an existing document in a collection and return its card."""
     update_data = request.form.to_dict()
-    current_app.db.update_document(collection, document_id, update_data)
+    document = {'_id': document_id, **update_data}
+    if not current_app.db.update_document(collection, document_id, update_data, owner=current_owner()):
+        # Nothing was modified: either the data was unchanged or the document does not exist.
+        document = current_app.db.read_documents(collection, document_id, owner=current_owner())
+        if not document:
+            return render_template(
+                'errors/404.html',
+                message=f"Document with ID {document_id} not found in {collection}."
+            )
     return render_template(
-        component,
-        documents=current_app.db.read_documents(collection)
+        f"{collection}/card.html", doc=document
     )
 
 
 @api.route('/<string:collection>/<string:document_id>/drop', methods=['DELETE'])
 def delete_document(collection, document_id):
-    """Delete a document from a collection."""
-    component = f"{collection}/list.html"
-    current_app.db.delete_document(
-        collection, document_id
-    )
+    """Delete a document from a collection; the empty response removes its card."""
+    if not current_app.db.delete_document(collection, document_id, owner=current_owner()):
+        # Missing, someone else's, or the database failed: the error replaces the delete form instead.
+        return render_template(
+            'errors/500.html',
+            message=f"Error deleting document with ID {document_id} from {collection}."
+        )
+    return ""
+
+
+def read_bulk_request():
+    """Read bulk operations from a JSON body, or from a form with an `op`, repeated `id`s and shared fields.
+
+    A JSON body must be an object whose `operations` is a list of objects; anything else is a 400.
+    """
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        operations = payload.get('operations', []) if isinstance(payload, dict) else None
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            abort(400, description="Expected a JSON object with a list of operation objects in `operations`.")
+        return operations, bool(payload.get('ordered', True))
+    op = request.form.get('op')
+    data = {key: value for key, value in request.form.items() if key not in ('op', 'id', 'ordered')}
+    operations = [{'op': op, 'id': _id, 'data': data} for _id in request.form.getlist('id')]
+    return operations, request.form.get('ordered', 'true') != 'false'
+
+
+@api.route('/tasks/bulk', methods=['POST'], defaults={'collection': 'tasks'})
+def bulk_documents(collection):
+    """Apply a batch of creates, updates and deletes and return one fragment with the outcome of each."""
+    operations, ordered = read_bulk_request()
+    results = current_app.db.bulk_apply(collection, operations, ordered=ordered, owner=current_owner())
     return render_template(
-        component,
-        documents=current_app.db.read_documents(collection)
+        f"{collection}/bulk.html", results=results
     )
+
+
+@api.route('/cache/stats')
+def cache_stats():
+    """Report read cache hit and miss counters, in debug mode only like /debug/slow-queries."""
+    if not current_app.debug:
+        abort(404)
+    return jsonify(current_app.db.cache.stats())
@@ -0,0 +1,223 @@
+"""Async counterparts of the api, component and user views that talk to the database.
+
+They are swapped in for the sync views by `register_async_views` when STORAGE is 'mongodb-async';
+routes, endpoint names and templates stay the same.
+"""
+import logging
+from datetime import datetime
+
+from flask import current_app, render_template, request, session
+
+from blueprints.api_blueprint import read_bulk_request
+from blueprints.component_blueprint import read_first_page
+from utils.etag import conditional
+from utils.sessions import current_owner, sign_in
+
+
+# api
+
+@conditional()
+async def list_documents(collection):
+    """List documents in a collection, one page at a time."""
+    if collection == "tasks":
+        after = request.args.get('after')
+        documents, next_cursor = await current_app.db.read_page(
+            collection,
+            after=after,
+            page_size=current_app.config['PAGE_SIZE'],
+            projection=current_app.config['TASK_LIST_PROJECTION'],
+            owner=current_owner()
+        )
+        component = f"{collection}/page.html" if after else f"{collection}/list.html"
+        return render_template(
+            component,
+            documents=documents,
+            next_cursor=next_cursor
+        )
+    return render_template(
+        'errors/404.html',
+        message=f"Collection {collection} not found."
+    )
+
+
+@conditional()
+async def search_documents(collection):
+    """Active search: the best matches for `q`, or the first page of the list when `q` is empty."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        documents, next_cursor = await read_first_page(collection)
+        return render_template(f"{collection}/list.html", documents=documents, next_cursor=next_cursor)
+    return render_template(
+        f"{collection}/list.html",
+        documents=await current_app.db.search_documents(
+            collection,
+            query,
+            limit=current_app.config['SEARCH_LIMIT'],
+            projection=current_app.config['TASK_LIST_PROJECTION'],
+            max_time_ms=current_app.config['SEARCH_MAX_TIME_MS'],
+            owner=current_owner()
+        ),
+        next_cursor=None,
+        empty_message=f"No tasks match {query}."
+    )
+
+
+async def create_document(collection):
+    """Create a new document in a collection and return its card."""
+    document = current_app.db.client_fields(request.form.to_dict())
+    # Tasks belong to whoever creates them; an `owner` sent with the form is overwritten.
+    document.update(current_app.db.owner_filter(collection, current_owner()))
+    _id = await current_app.db.create_document(collection, document)
+    if not _id:
+        return render_template(
+            'errors/500.html',
+            message=f"Error creating a new document."
+        )
+    document['_id'] = _id
+    return render_template(
+        f"{collection}/created.html", doc=document
+    )
+
+
+async def update_document(collection, document_id):
+    """Update an existing document in a collection and return its card."""
+    update_data = request.form.to_dict()
+    document = {'_id': document_id, **update_data}
+    if not await current_app.db.update_document(collection, document_id, update_data, owner=current_owner()):
+        document = await current_app.db.read_documents(collection, document_id, owner=current_owner())
+        if not document:
+            return render_template(
+                'errors/404.html',
+                message=f"Document with ID {document_id} not found in {collection}."
+            )
+    return render_template(
+        f"{collection}/card.html", doc=document
+    )
+
+
+async def delete_document(collection, document_id):
+    """Delete a document from a collection; the empty response removes its card."""
+    if not await current_app.db.delete_document(collection, document_id, owner=current_owner()):
+        # Missing, someone else's, or the database failed: the error replaces the delete form instead.
+        return render_template(
+            'errors/500.html',
+            message=f"Error deleting document with ID {document_id} from {collection}."
+        )
+    return ""
+
+
+async def bulk_documents(collection):
+    """Apply a batch of creates, updates and deletes and return one fragment with the outcome of each."""
+    operations, ordered = read_bulk_request()
+    results = await current_app.db.bulk_apply(collection, operations, ordered=ordered, owner=current_owner())
+    return render_template(
+        f"{collection}/bulk.html", results=results
+    )
+
+
+# component
+
+async def home_page():
+    """Display the home page with the list of tasks."""
+    tasks, next_cursor = await read_first_page("tasks")
+    return render_template(
+        'index.html',
+        documents=tasks,
+        next_cursor=next_cursor,
+        collection="tasks"
+    )
+
+
+@conditional('tasks')
+async def cancel():
+    tasks, next_cursor = await read_first_page("tasks")
+    return render_template(
+        'tasks/list.html',
+        documents=tasks,
+        next_cursor=next_cursor
+    )
+
+
+async def show_document_form(collection, document_id, action):
+    document = await current_app.db.read_documents(collection, document_id, owner=current_owner())
+    if document:
+        return render_template(
+            f"{collection}/{action}.html",
+            document=document
+        )
+    return render_template(
+        'errors/404.html',
+        message=f"Document with ID {document_id} not found in {collection}."
+    )
+
+
+@conditional()
+async def show_edit_form(collection, document_id):
+    """Display the form to edit an existing document."""
+    return await show_document_form(collection, document_id, 'edit')
+
+
+@conditional()
+async def show_delete_form(collection, document_id):
+    """Display the form to delete an existing document."""
+    return await show_document_form(collection, document_id, 'delete')
+
+
+# user
+
+async def sign_up():
+    if request.method == 'GET':
+        return render_template('users/create.html', title="New User")
+    user_data = request.form.to_dict()
+    password = await current_app.hasher.hash_async(user_data['password'])
+    user_id = await current_app.db.create_document('users', {
+        'created_at': datetime.now(),
+        'username': user_data['username'],
+        'password': password
+    })
+    if not user_id:
+        return f"Error creating user: {user_data['username']}", 400
+    guest = sign_in(str(user_id), user_data['username'])
+    if guest:
+        await current_app.db.transfer_owner(guest, str(user_id))
+    logging.info(f"sign_up = () => {session['username']}")
+    return render_template('navbar.html')
+
+
+async def login():
+    if request.method == 'GET':
+        return render_template('users/login.html', title="Login")
+    login_data = request.form.to_dict()
+    user_data = await current_app.db.read_documents('users', login_data['username'])
+    if user_data and await current_app.hasher.verify_async(login_data['password'], user_data['password']):
+        if current_app.hasher.needs_rehash(user_data['password']):
+            await current_app.db.update_document('users', user_data['_id'], {
+                'password': await current_app.hasher.hash_async(login_data['password'])
+            })
+        guest = sign_in(str(user_data['_id']), user_data['username'])
+        if guest:
+            await current_app.db.transfer_owner(guest, str(user_data['_id']))
+        return render_template('navbar.html')
+    return "Username or password incorrect')", 400
+
+
+ASYNC_VIEWS = {
+    'api.list_documents': list_documents,
+    'api.search_documents': search_documents,
+    'api.create_document': create_document,
+    'api.update_document': update_document,
+    'api.delete_document': delete_document,
+    'api.bulk_documents': bulk_documents,
+    'component.home_page': home_page,
+    'component.cancel': cancel,
+    'component.show_edit_form': show_edit_form,
+    'component.show_delete_form': show_delete_form,
+    'user.sign_up': sign_up,
+    'user.login': login,
+}
+
+
+def register_async_views(app):
+    """Replace the sync views of the registered blueprints with their async counterparts."""
+    for endpoint, view in ASYNC_VIEWS.items():
+        app.view_functions[endpoint] = view
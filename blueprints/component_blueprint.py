@@ -2,9 +2,22 @@ import logging
 
 from flask import Blueprint, render_template, current_app, session
 
+from utils.etag import conditional
+from utils.sessions import current_owner
+
 component = Blueprint('component', __name__)
 
 
+def read_first_page(collection):
+    """Read the first page of the user's documents with the fields the list view renders."""
+    return current_app.db.read_page(
+        collection,
+        page_size=current_app.config['PAGE_SIZE'],
+        projection=current_app.config['TASK_LIST_PROJECTION'],
+        owner=current_owner()
+    )
+
+
 @component.route('/')
 def home_page():
     """Display the home page with the list of tasks."""
@@ -12,10 +25,11 @@ def home_page():
     is_logged_in = False
     if 'username' in session:
         is_logged_in = True
-    tasks = current_app.db.read_documents("tasks")
+    tasks, next_cursor = read_first_page("tasks")
     return render_template(
         'index.html',
         documents=tasks,
+        next_cursor=next_cursor,
         collection="tasks"
     )
 
@@ -28,10 +42,13 @@ def show_modal():
 
 
 @component.route('/cancel')
+@conditional('tasks')
 def cancel():
+    tasks, next_cursor = read_first_page("tasks")
     return render_template(
         'tasks/list.html',
-        documents=current_app.db.read_documents("tasks")
+        documents=tasks,
+        next_cursor=next_cursor
     )
 
 
@@ -49,10 +66,11 @@ def show_new_form(collection):
 
 
 @component.route('/<string:collection>/<string:document_id>/edit')
+@conditional()
 def show_edit_form(collection, document_id):
     """Display the form to edit an existing document."""
     edit_collection_form = f"{collection}/edit.html"
-    document = current_app.db.read_documents(collection, document_id)
+    document = current_app.db.read_documents(collection, document_id, owner=current_owner())
     if document:
         return render_template(
             edit_collection_form,
@@ -65,10 +83,11 @@ def show_edit_form(collection, document_id):
 
 
 @component.route('/<string:collection>/<string:document_id>/delete')
+@conditional()
 def show_delete_form(collection, document_id):
     """Display the form to delete an existing document."""
     delete_collection_form = f"{collection}/delete.html"
-    document = current_app.db.read_documents(collection, document_id)
+    document = current_app.db.read_documents(collection, document_id, owner=current_owner())
     if document:
         return render_template(
             delete_collection_form,
@@ -1,25 +1,37 @@
 import logging
 from datetime import datetime
 
-import bcrypt
-from flask import Blueprint, current_app, request, render_template, session
+from flask import Blueprint, abort, current_app, jsonify, request, render_template, session
+
+from utils.admission import shed_response
+from utils.passwords import HasherBusy
+from utils.sessions import sign_in
 
 user = Blueprint('user', __name__)
 
 
+@user.errorhandler(HasherBusy)
+def hasher_busy(error):
+    return shed_response(503, 'hasher', error.retry_after, "Too many sign-ins at once.")
+
+
 @user.route('/users/signup', methods=['GET', 'POST'])
 def sign_up():
     if request.method == 'GET':
         return render_template('users/create.html', title="New User")
     user_data = request.form.to_dict()
-    session['user_id'] = str(current_app.db.create_document('users', {
+    # A taken username is rejected by the unique index, so this is the only round trip.
+    user_id = current_app.db.create_document('users', {
         'created_at': datetime.now(),
         'username': user_data['username'],
-        'password': bcrypt.hashpw(user_data['password'].encode('utf-8'), bcrypt.gensalt())
-    }))
-    if not session['user_id']:
+        'password': current_app.hasher.hash(user_data['password'])
+    })
+    if not user_id:
         return f"Error creating user: {user_data['username']}", 400
-    session['username'] = user_data['username']
+    # The tasks made before signing up become the new user's.
+    guest = sign_in(str(user_id), user_data['username'])
+    if guest:
+        current_app.db.transfer_owner(guest, str(user_id))
     logging.info(f"sign_up = () => {session['username']}")
     return render_template('navbar.html')
     # TODO: return render_template('users/signup_success.html', new_user=new_user, links=links)
@@ -32,14 +44,28 @@ def login():
         return render_template('users/login.html', title="Login")
     login_data = request.form.to_dict()
     user_data = current_app.db.read_documents('users', login_data['username'])
-    if user_data and bcrypt.checkpw(login_data['password'].encode('utf-8'), user_data['password']):
-        session['user_id'] = str(user_data['_id'])
-        session['username'] = user_data['username']
+    if user_data and current_app.hasher.verify(login_data['password'], user_data['password']):
+        if current_app.hasher.needs_rehash(user_data['password']):
+            # The work factor changed since this hash was stored; the plain password is only at hand now.
+            current_app.db.update_document('users', user_data['_id'], {
+                'password': current_app.hasher.hash(login_data['password'])
+            })
+        guest = sign_in(str(user_data['_id']), user_data['username'])
+        if guest:
+            current_app.db.transfer_owner(guest, str(user_data['_id']))
         return render_template('navbar.html')
     return "Username or password incorrect')", 400
     # TODO: return render_template('users/login_fail.html')
 
 
+@user.route('/users/hasher/stats')
+def hasher_stats():
+    """Report the password hasher's queue and latency, in debug mode only like /cache/stats."""
+    if not current_app.debug:
+        abort(404)
+    return jsonify(current_app.hasher.stats())
+
+
 @user.route('/users/<string:user_id>/logout')
 def logout(user_id):
     print(f"logout = ({user_id}) => {session['username']}")
@@ -4,8 +4,128 @@ import os
 
 class Config(object):
     ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
-    STORAGE = 'mongodb'
-    SECRET_KEY = os.urandom(12).hex()
+    # Storage engine: 'mongodb', 'mongodb-async' (asyncio driver and async views, needs asgiref)
+    # or 'memory' for a single process without a database server
+    STORAGE = os.getenv('STORAGE', 'mongodb')
+    # Signs the session cookie, which also holds the id of a signed-out visitor's tasks, so it must
+    # survive restarts and be the same on every host. Without it, one is kept in the instance folder,
+    # which does for a single host. Guests' tasks are deleted by `flask expire-guests` once not
+    # changed for GUEST_LIFETIME_DAYS, as long as their session cookie lasts after their last visit.
+    SECRET_KEY = os.getenv('SECRET_KEY')
+    GUEST_LIFETIME_DAYS = int(os.getenv('GUEST_LIFETIME_DAYS', 30))
+
+    # Pagination
+    PAGE_SIZE = 25
+    TASK_LIST_PROJECTION = {'title': 1, '_rev': 1}
+
+    # Views that need a whole collection stream it: documents read per database round trip, and
+    # the size of the chunks sent (characters). Responses of at least COMPRESS_MIN_SIZE bytes, and
+    # all streamed ones, are gzipped for clients that accept it.
+    STREAM_BATCH_SIZE = 500
+    STREAM_CHUNK_SIZE = 16 * 1024
+    USER_LIST_PROJECTION = {'username': 1, 'created_at': 1}
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+
+    # NDJSON export and import (`/<collection>/export`, `/<collection>/import` and the flask commands):
+    # documents per database round trip. The endpoints, and the /users list, only exist when
+    # TRANSFER_TOKEN is set and the request carries it as a bearer token.
+    TRANSFER_TOKEN = os.getenv('TRANSFER_TOKEN')
+    EXPORT_BATCH_SIZE = 1000
+    IMPORT_BATCH_SIZE = 1000
+
+    # Search: results shown at most, and the time after which the database abandons a search
+    SEARCH_LIMIT = 20
+    SEARCH_MAX_TIME_MS = 500
+
+    # Read cache: 'memory' (per process), 'redis' (shared by all workers, needs CACHE_URL) or 'none'.
+    # The backend also keeps the collection versions behind fragment ETags, so run 'redis' with several workers.
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_URL = os.getenv('CACHE_URL')
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_TTL = 30
+    CACHE_COLLECTIONS = ('tasks',)
+
+    # Rendered fragments (task cards, the header) kept in memory, and the directory where compiled
+    # templates are stored so that new workers skip compiling them; fill it with `flask compile-templates`.
+    # By default it is templates-cache in the app's instance folder: the cache loads and runs whatever
+    # bytecode it finds, so it must not be a directory other users can write to, like one under /tmp.
+    FRAGMENT_CACHE_MAX_ENTRIES = 4096
+    TEMPLATE_BYTECODE_CACHE = True
+    TEMPLATE_BYTECODE_DIR = os.getenv('TEMPLATE_BYTECODE_DIR')
+
+    # Live updates over Server-Sent Events. Per process: streams open at once, events a stream may
+    # fall behind before it is dropped, and how often the change feed polls when the server has no
+    # change streams (standalone MongoDB, the memory engine). Each poll reads the writes made since
+    # the last one, of every worker, through the `_updated_at` index.
+    LIVE_MAX_SUBSCRIBERS = int(os.getenv('LIVE_MAX_SUBSCRIBERS', 100))
+    LIVE_QUEUE_SIZE = 64
+    LIVE_POLL_INTERVAL = 1.0
+    LIVE_HEARTBEAT = 15
+    LIVE_RETRY_MS = 3000
+
+    # Worker processes and threads per worker of the WSGI server; gunicorn.conf.py sets both.
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+    WEB_THREADS = int(os.getenv('WEB_THREADS', 8))
+
+    # MongoDB connection pool and timeouts (milliseconds). Every worker process has a pool of its
+    # own, so MONGO_MAX_CONNECTIONS, the budget of the whole server, is shared out between them.
+    MONGO_MAX_CONNECTIONS = int(os.getenv('MONGO_MAX_CONNECTIONS', 50))
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 0)) or max(MONGO_MAX_CONNECTIONS // WEB_CONCURRENCY, 1)
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    # Where list and detail reads go: 'primary' (with the writes), 'primaryPreferred', 'secondary',
+    # 'secondaryPreferred' or 'nearest', and how far behind the primary a secondary may be to serve
+    # them (seconds, at least 90; -1 for no limit). Off the primary, every request runs in a causally
+    # consistent session continued from the session cookie, so users see their own writes at once.
+    MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+    MONGO_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_MAX_STALENESS_SECONDS', -1))
+    MONGO_CONNECT_TIMEOUT_MS = 2000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = 2000
+    # Connect from a background thread, so that startup never waits for the database;
+    # /health/ready answers 503 until the connection is up.
+    DB_CONNECT_IN_BACKGROUND = True
+    # While the database is down requests fail fast (cached reads are still served), one trial
+    # request goes through every DB_BREAKER_RESET_TIMEOUT seconds and a background thread
+    # reconnects with exponential backoff up to DB_RECONNECT_BACKOFF_MAX seconds.
+    DB_BREAKER_RESET_TIMEOUT = 5.0
+    DB_BACKGROUND_RECONNECT = True
+    DB_RECONNECT_BACKOFF_MAX = 30.0
+
+    # Slow query log, off unless SLOW_QUERY_MS is set: commands slower than that are logged with
+    # the shape of their filter and the SLOW_QUERY_KEEP slowest are kept. In debug mode they are
+    # also explained, flagging collection scans, and listed at /debug/slow-queries.
+    SLOW_QUERY_MS = float(os.environ['SLOW_QUERY_MS']) if os.getenv('SLOW_QUERY_MS') else None
+    SLOW_QUERY_KEEP = 20
+
+    # Password hashing: bcrypt cost, threads doing it and how many more requests may wait for one.
+    # Stored hashes are redone with the new cost at the next login after BCRYPT_ROUNDS changes.
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    BCRYPT_WORKERS = 2
+    BCRYPT_MAX_QUEUE = 16
+
+    # Load shedding for the expensive endpoints (utils/admission.py). Requests each endpoint serves
+    # at once per process, the next ones answered 503; per-session token buckets of
+    # (requests per second, burst) per endpoint, answered 429 when empty (only the POSTs of the
+    # sign-up and login forms count); sessions remembered.
+    ADMISSION_LIMITS = {
+        'user.sign_up': 4,
+        'user.login': 4,
+        'api.list_documents': 16,
+        'api.list_all_documents': 4,
+        'api.search_documents': 16,
+    }
+    RATE_LIMITS = {
+        'user.sign_up': (0.1, 5),
+        'user.login': (0.5, 10),
+        'api.list_all_documents': (1.0, 5),
+    }
+    RATE_LIMIT_MAX_SESSIONS = 10000
+    # Signed-out browsers behind one address share a bucket this many times as large as their own.
+    RATE_LIMIT_ADDRESS_FACTOR = 10
+    ADMISSION_RETRY_AFTER = 1
+    # Proxies in front of the app that append to X-Forwarded-For (App Service, nginx): trust that many,
+    # so that the client address is the client's own rather than the proxy's, which all clients share.
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
 
     # HATEOAS Configuration
 
@@ -19,8 +139,26 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    SECRET_KEY = 'testing'
+    STORAGE = 'memory'
+    CACHE_BACKEND = 'none'
+    BCRYPT_ROUNDS = 4
+    TEMPLATE_BYTECODE_CACHE = False
+    RATE_LIMITS = {}
 
 
 class ProductionConfig(Config):
-    # Production specific settings
-    pass
+    DEBUG = False
+    TESTING = False
+    DB_NAME = 'tasktracker'
+
+
+# What `create_app()` runs with when given no config: the one of ENVIRONMENT.
+CONFIGS = {'development': DevelopmentConfig, 'testing': TestingConfig, 'production': ProductionConfig}
+
+
+def config_for(environment):
+    """The config class of an ENVIRONMENT name."""
+    if environment not in CONFIGS:
+        raise ValueError(f"Unknown ENVIRONMENT {environment}, expected one of {', '.join(CONFIGS)}.")
+    return CONFIGS[environment]
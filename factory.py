@@ -0,0 +1,190 @@
+"""Build the Flask app.
+
+`create_app(config)` is what `flask --app __init__` and WSGI servers call; without a config it
+uses the one of the ENVIRONMENT variable, development by default. Nothing connects to the
+database at import time, and with DB_CONNECT_IN_BACKGROUND the MongoDB engine connects from a
+thread, so a new process serves /health/live at once and /health/ready once the database answers.
+How long the imports, each startup step and the first response took is kept in `app.startup`,
+logged, and exported at /metrics and /health/ready.
+"""
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+import gzip  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+from contextlib import contextmanager  # noqa: E402
+
+import click  # noqa: E402
+from flask import Flask, g  # noqa: E402
+from werkzeug.middleware.proxy_fix import ProxyFix  # noqa: E402
+
+from blueprints.api_blueprint import api  # noqa: E402
+from blueprints.async_views import register_async_views  # noqa: E402
+from blueprints.component_blueprint import component  # noqa: E402
+from blueprints.user_blueprint import user  # noqa: E402
+from config import Config, config_for  # noqa: E402
+from storage import init_db, resolve  # noqa: E402
+from utils.admission import init_admission  # noqa: E402
+from utils.assets import build_assets, init_assets  # noqa: E402
+from utils.compression import init_compression  # noqa: E402
+from utils.consistency import init_consistency  # noqa: E402
+from utils.fragments import compile_templates, init_template_caches  # noqa: E402
+from utils.health import init_health  # noqa: E402
+from utils.live import init_live_updates  # noqa: E402
+from utils.metrics import init_metrics  # noqa: E402
+from utils.passwords import PasswordHasher  # noqa: E402
+from utils.sessions import init_sessions  # noqa: E402
+from utils.slow_queries import init_slow_query_log  # noqa: E402
+from utils.transfer import ExportFailed, ImportFailed, export_lines, import_lines, init_transfer  # noqa: E402
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+# The flask CLI imports this module as part of the repository's package and gunicorn on its own,
+# which would give the app two different instance folders; both use the one next to it.
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed(app, step):
+    started = time.perf_counter()
+    yield
+    app.startup[f'{step}_seconds'] = round(time.perf_counter() - started, 6)
+
+
+def create_app(config=None):
+    started = time.perf_counter()
+    config = config or config_for(Config.ENVIRONMENT)
+    app = Flask(__name__, instance_path=INSTANCE_PATH)
+    app.config.from_object(config)
+    init_sessions(app)
+    app.startup = {'import_seconds': round(IMPORT_SECONDS, 6)}
+    if app.config.get('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    with timed(app, 'templates'):
+        init_template_caches(app)
+    with timed(app, 'database'):
+        with app.app_context():
+            app.db = init_db(g, app.config)
+    app.hasher = PasswordHasher.from_config(app.config)
+
+    with timed(app, 'blueprints'):
+        app.register_blueprint(component)
+        app.register_blueprint(api)
+        app.register_blueprint(user)
+        if app.config['STORAGE'] == 'mongodb-async':
+            register_async_views(app)
+        init_assets(app)
+        init_live_updates(app)
+        init_transfer(app)
+        init_metrics(app)
+        init_admission(app)
+        init_consistency(app)
+        init_slow_query_log(app)
+        init_health(app, IMPORT_STARTED)
+        init_compression(app)
+    register_commands(app)
+
+    app.startup['create_app_seconds'] = round(time.perf_counter() - started, 6)
+    logger.info(f"App created: {app.startup}")
+    return app
+
+
+def register_commands(app):
+    @app.cli.command('index-report')
+    def index_report():
+        """Print declared indexes that are missing and indexes that are never used."""
+        print(json.dumps(resolve(app.db.index_report()), indent=2))
+
+    @app.cli.command('backfill-search-terms')
+    def backfill_search_terms():
+        """Make documents written before search existed findable by prefix."""
+        print(f"Added search terms to {resolve(app.db.backfill_search_terms())} documents")
+
+    @app.cli.command('backfill-owners')
+    @click.option('--owner', required=True, help="User id to give the tasks to.")
+    @click.option('--batch-size', type=int, default=1000, help="Documents updated per write.")
+    def backfill_owners(owner, batch_size):
+        """Give tasks created before tasks had owners one, so that owner-scoped queries find them."""
+        print(f"Added an owner to {resolve(app.db.backfill_owners(owner, batch_size))} documents")
+
+    @app.cli.command('expire-guests')
+    @click.option('--days', type=int, default=None, help="Days without changes. Default: GUEST_LIFETIME_DAYS.")
+    def expire_guests(days):
+        """Delete the tasks of guests that nobody changed for as long as their session cookie lasts."""
+        max_age = (days or app.config['GUEST_LIFETIME_DAYS']) * 24 * 3600
+        print(f"Deleted {resolve(app.db.expire_guest_documents(max_age))} documents of guests")
+
+    @app.cli.command('compile-templates')
+    def compile_templates_command():
+        """Compile every template into the bytecode cache, e.g. while building a release."""
+        cache = app.jinja_env.bytecode_cache
+        if cache is None:
+            raise click.ClickException("TEMPLATE_BYTECODE_CACHE is off; there is no cache to fill.")
+        print(f"Compiled {compile_templates(app)} templates into {cache.directory}")
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Bundle, minify, fingerprint and precompress the CSS and JS into static/dist."""
+        for name, fingerprinted in build_assets(app).items():
+            print(f"{name} -> {fingerprinted}")
+
+    @app.cli.command('export-collection')
+    @click.argument('collection')
+    @click.option('--output', '-o', default='-', help="File to write; gzipped when it ends in .gz. Default: stdout.")
+    @click.option('--batch-size', type=int, default=None, help="Documents read per round trip.")
+    def export_collection(collection, output, batch_size):
+        """Write every document of a collection as NDJSON, in constant memory."""
+        stats = {}
+        lines = export_lines(app.db, collection, batch_size or app.config['EXPORT_BATCH_SIZE'], stats)
+        try:
+            if output == '-':
+                sys.stdout.writelines(lines)
+            else:
+                opener = gzip.open if output.endswith('.gz') else open
+                with opener(output, 'wt', encoding='utf-8') as output_file:
+                    output_file.writelines(lines)
+        except ExportFailed as e:
+            if output != '-':
+                # Nobody should mistake what was written for the whole collection.
+                os.remove(output)
+            raise click.ClickException(str(e))
+        print(f"Exported {stats['documents']} documents in {stats['seconds']}s ({stats['per_second']}/s)",
+              file=sys.stderr)
+
+    @app.cli.command('import-collection')
+    @click.argument('collection')
+    @click.argument('path')
+    @click.option('--batch-size', type=int, default=None, help="Documents inserted per round trip.")
+    @click.option('--checkpoint', default=None,
+                  help="File that keeps the lines imported so far; an interrupted import resumes from it.")
+    def import_collection(collection, path, batch_size, checkpoint):
+        """Insert the documents of an NDJSON file (or .gz), skipping those that exist already."""
+        skip = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                skip = int(checkpoint_file.read().strip() or 0)
+            print(f"Resuming after line {skip}", file=sys.stderr)
+
+        def save_checkpoint(line_count):
+            with open(checkpoint, 'w') as checkpoint_file:
+                checkpoint_file.write(str(line_count))
+
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as input_file:
+            try:
+                stats = import_lines(app.db, collection, input_file, batch_size or app.config['IMPORT_BATCH_SIZE'],
+                                     skip, save_checkpoint if checkpoint else None)
+            except ImportFailed as e:
+                raise click.ClickException(f"{e} Resume after line {e.resume_from}.")
+        if checkpoint:
+            os.remove(checkpoint)
+        print(f"Imported {stats['inserted']} documents, skipped {stats['skipped']} existing, "
+              f"in {stats['seconds']}s ({stats['per_second']}/s)")
+
@@ -0,0 +1,52 @@
+"""Gunicorn settings for running the app on every core: `gunicorn` from the repository root.
+
+The app is loaded once in the master (`preload_app`) and forked into the workers, so they share
+its imported code and compiled templates. What must not be shared, the MongoDB client and its
+pool, the async engine's event loop, the bcrypt threads and the live update feeds, is rebuilt
+in each worker right after the fork (see utils/forks.py).
+
+There is one worker per core only with the cache the workers share (CACHE_BACKEND=redis).
+
+Threaded workers serve the long-lived /tasks/events streams without blocking other requests;
+each stream holds one thread, so at most half of them are given to streams.
+"""
+import multiprocessing
+import os
+
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+# create_app() picks the config of ENVIRONMENT; a server started this way runs production's.
+os.environ.setdefault('ENVIRONMENT', 'production')
+wsgi_app = 'factory:create_app()'
+bind = os.getenv('BIND', '0.0.0.0:8000')
+
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+if os.getenv('STORAGE') == 'memory':
+    # Every worker would hold different data.
+    workers = 1
+elif os.getenv('CACHE_BACKEND', 'memory') != 'redis':
+    # Every other backend, 'none' included, keeps the collection versions behind ETags in the
+    # process: a write in one worker would leave the others answering 304 to a stale page, and
+    # the memory cache would serve stale reads too. Several workers need the Redis cache.
+    if workers > 1 and 'WEB_CONCURRENCY' in os.environ:
+        raise RuntimeError(f"WEB_CONCURRENCY={workers} needs CACHE_BACKEND=redis, which all workers share.")
+    workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 8))
+preload_app = True
+
+# The app reads these while it is loaded, below, to size each worker's share of the database
+# connections and of the threads for live streams.
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['WEB_THREADS'] = str(threads)
+os.environ.setdefault('LIVE_MAX_SUBSCRIBERS', str(max(threads // 2, 1)))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then, staggered, so that slow leaks cannot build up.
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} started with pools of its own.")
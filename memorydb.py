@@ -0,0 +1,389 @@
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from bson.objectid import ObjectId
+
+from storage import (ANY_OWNER, DEFAULT_BATCH_SIZE, DEFAULT_CHANGES_LIMIT, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT,
+                     GUEST_PREFIX, StorageEngine)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MemoryDatabase(StorageEngine):
+    """Storage engine that keeps every collection in process memory.
+
+    Meant for single-node deployments, benchmarks and tests; nothing survives a restart.
+    Unique indexes declared in StorageEngine.INDEXES are enforced and double as lookup tables.
+    """
+
+    # Writes remembered per collection for `read_changes`; a poller further behind is told to reload.
+    CHANGE_LOG_SIZE = 10000
+
+    def __init__(self, cache=None, cached_collections=()):
+        super().__init__(cache, cached_collections)
+        self._lock = threading.RLock()
+        self._documents = {}
+        # Sorted `_id`s per collection, for keyset pagination without sorting on every read.
+        self._ids = {}
+        # Sorted `_id`s per owner of the owned collections, the counterpart of the `(owner, _id)` index.
+        self._owned = {}
+        # Sorted `(term, _id)` pairs per collection, the in-memory counterpart of the `_terms` index.
+        self._terms = {}
+        # The last `(sequence, _id)` written per collection, the watermarks of `read_changes`.
+        self._changes = {}
+        self._sequence = itertools.count(1)
+        # When each document was last written (monotonic seconds), for expiring those of guests.
+        self._written_at = {}
+        # {collection: {index fields: {values: _id}}} for every unique index.
+        self._unique = {
+            collection_name: {
+                tuple(index.document['key']): {} for index in indexes if index.document.get('unique')
+            }
+            for collection_name, indexes in self.INDEXES.items()
+        }
+
+    def _collection(self, collection_name):
+        if collection_name not in self._documents:
+            self._documents[collection_name] = {}
+            self._ids[collection_name] = []
+            self._owned[collection_name] = {}
+            self._terms[collection_name] = []
+            self._changes[collection_name] = deque(maxlen=self.CHANGE_LOG_SIZE)
+            self._written_at[collection_name] = {}
+            self._unique.setdefault(collection_name, {})
+        return self._documents[collection_name]
+
+    @staticmethod
+    def _project(document, projection):
+        if not projection:
+            return dict(document)
+        fields = [field for field, include in projection.items() if include]
+        projected = {field: document[field] for field in fields if field in document}
+        if projection.get('_id', 1):
+            projected['_id'] = document['_id']
+        return projected
+
+    def _unique_values(self, collection_name, document):
+        for fields, values in self._unique[collection_name].items():
+            yield values, tuple(document.get(field) for field in fields)
+
+    def _index_terms(self, collection_name, document):
+        for term in document.get('_terms', ()):
+            bisect.insort(self._terms[collection_name], (term, document['_id']))
+
+    def _unindex_terms(self, collection_name, document):
+        terms = self._terms[collection_name]
+        for term in document.get('_terms', ()):
+            index = bisect.bisect_left(terms, (term, document['_id']))
+            if index < len(terms) and terms[index] == (term, document['_id']):
+                del terms[index]
+
+    def _index_owner(self, collection_name, document):
+        if collection_name in self.OWNED:
+            bisect.insort(self._owned[collection_name].setdefault(document.get('owner'), []), document['_id'])
+
+    def _unindex_owner(self, collection_name, document):
+        if collection_name in self.OWNED:
+            ids = self._owned[collection_name][document.get('owner')]
+            del ids[bisect.bisect_left(ids, document['_id'])]
+
+    def _scoped_ids(self, collection_name, owner):
+        """The sorted `_id`s that the owner's queries go through: theirs only on owned collections."""
+        if not self.owner_filter(collection_name, owner):
+            return self._ids[collection_name]
+        return self._owned[collection_name].get(owner, [])
+
+    def _record_change(self, collection_name, _id):
+        self._changes[collection_name].append((next(self._sequence), _id))
+        self._written_at[collection_name][_id] = time.monotonic()
+
+    def _prefix_matches(self, collection_name, prefix):
+        terms = self._terms[collection_name]
+        index = bisect.bisect_left(terms, (prefix,))
+        matches = set()
+        while index < len(terms) and terms[index][0].startswith(prefix):
+            matches.add(terms[index][1])
+            index += 1
+        return matches
+
+    def create_document(self, collection_name, new_document):
+        if not isinstance(new_document, dict):
+            logger.error("Invalid document format. Document should be a dictionary.")
+            return None
+
+        with self._lock:
+            collection = self._collection(collection_name)
+            for values, key in self._unique_values(collection_name, new_document):
+                if key in values:
+                    logger.warning(f"Duplicate document rejected by {collection_name} collection: {key}")
+                    return None
+            new_document.setdefault('_id', ObjectId())
+            new_document.setdefault('_rev', 0)
+            self.add_search_terms(collection_name, new_document)
+            document = dict(new_document)
+            collection[document['_id']] = document
+            bisect.insort(self._ids[collection_name], document['_id'])
+            self._index_owner(collection_name, document)
+            self._index_terms(collection_name, document)
+            for values, key in self._unique_values(collection_name, document):
+                values[key] = document['_id']
+            self._record_change(collection_name, document['_id'])
+        self.invalidate(collection_name)
+        return document['_id']
+
+    def read_documents(self, collection_name, _id=None, owner=ANY_OWNER):
+        with self._lock:
+            collection = self._collection(collection_name)
+            if _id:
+                if collection_name == "users":
+                    _id = self._unique["users"][('username',)].get((_id,))
+                else:
+                    _id = self.process_id(_id)
+                document = collection.get(_id)
+                return dict(document) if document and self.owned_by(collection_name, document, owner) else None
+            return [dict(collection[_id]) for _id in self._scoped_ids(collection_name, owner)]
+
+    def read_page(self, collection_name, after=None, page_size=DEFAULT_PAGE_SIZE, projection=None, owner=ANY_OWNER):
+        with self._lock:
+            collection = self._collection(collection_name)
+            ids = self._scoped_ids(collection_name, owner)
+            end = len(ids)
+            if after:
+                after = self.process_id(after)
+                if not after:
+                    return [], None
+                end = bisect.bisect_left(ids, after)
+            start = max(end - page_size, 0)
+            documents = [self._project(collection[_id], projection) for _id in reversed(ids[start:end])]
+        next_cursor = str(documents[-1]['_id']) if start > 0 else None
+        return documents, next_cursor
+
+    def iter_documents(self, collection_name, projection=None, batch_size=DEFAULT_BATCH_SIZE, owner=ANY_OWNER,
+                       strict=False):
+        after = None
+        while True:
+            with self._lock:
+                collection = self._collection(collection_name)
+                ids = self._scoped_ids(collection_name, owner)
+                end = len(ids) if after is None else bisect.bisect_left(ids, after)
+                start = max(end - batch_size, 0)
+                batch = [self._project(collection[_id], projection) for _id in reversed(ids[start:end])]
+            # The lock is released between batches, so writers are never held up by a long stream.
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            after = batch[-1]['_id']
+
+    def search_documents(self, collection_name, query, limit=DEFAULT_SEARCH_LIMIT, projection=None, max_time_ms=None,
+                         owner=ANY_OWNER):
+        phrases, words = self.parse_search(query)
+        if not phrases and not words:
+            return []
+
+        field = self.SEARCHABLE.get(collection_name)
+        with self._lock:
+            collection = self._collection(collection_name)
+            candidates = None
+            for word in words:
+                matches = self._prefix_matches(collection_name, word)
+                candidates = matches if candidates is None else candidates & matches
+            ranked = []
+            for _id in (self._scoped_ids(collection_name, owner) if candidates is None else candidates):
+                if not self.owned_by(collection_name, collection[_id], owner):
+                    continue
+                text = str(collection[_id].get(field, '')).lower()
+                if all(phrase in text for phrase in phrases):
+                    # Phrase hits rank first, as the text score does; newest first otherwise.
+                    ranked.append((sum(text.count(phrase) for phrase in phrases), _id))
+            return [self._project(collection[_id], projection) for _, _id in heapq.nlargest(limit, ranked)]
+
+    def read_changes(self, collection_name, since=None, limit=DEFAULT_CHANGES_LIMIT):
+        with self._lock:
+            collection = self._collection(collection_name)
+            log = self._changes[collection_name]
+            watermark = log[-1][0] if log else since or 0
+            if since is None:
+                return [], watermark
+            if len(log) == log.maxlen and log[0][0] > since + 1:
+                # Older than the log remembers.
+                return None, watermark
+            written = itertools.takewhile(lambda change: change[0] > since, reversed(log))
+            # The latest state of each document written, in the order of its last write.
+            ids = list(dict.fromkeys(_id for _, _id in written))[::-1]
+            if len(ids) > limit:
+                return None, watermark
+            changes = []
+            for _id in ids:
+                document = collection.get(_id)
+                if document is None:
+                    changes.append(('deleted', _id, None))
+                else:
+                    changes.append(('created' if document.get('_rev', 0) == 0 else 'updated', _id, dict(document)))
+            return changes, watermark
+
+    def update_document(self, collection_name, document_id, update_data, owner=ANY_OWNER):
+        if not isinstance(update_data, dict):
+            logger.error("Invalid update data format. Data should be a dictionary.")
+            return False
+
+        document_id = self.process_id(document_id)
+        if not document_id:
+            return False
+
+        update_data = self.prepare_update(collection_name, update_data, owner)
+        with self._lock:
+            document = self._collection(collection_name).get(document_id)
+            if not document or not self.owned_by(collection_name, document, owner):
+                return False
+            updated = {**document, **update_data, '_id': document_id}
+            if updated == document:
+                return False
+            updated['_rev'] = document.get('_rev', 0) + 1
+            changed_keys = [
+                (values, old_key, new_key)
+                for (values, old_key), (_, new_key) in zip(self._unique_values(collection_name, document),
+                                                           self._unique_values(collection_name, updated))
+                if new_key != old_key
+            ]
+            if any(new_key in values for values, _, new_key in changed_keys):
+                logger.warning(f"Duplicate document rejected by {collection_name} collection: {update_data}")
+                return False
+            for values, old_key, new_key in changed_keys:
+                del values[old_key]
+                values[new_key] = document_id
+            self._unindex_terms(collection_name, document)
+            self._unindex_owner(collection_name, document)
+            document.update(updated)
+            self._index_owner(collection_name, document)
+            self._index_terms(collection_name, document)
+            self._record_change(collection_name, document_id)
+        self.invalidate(collection_name, document_id)
+        return True
+
+    def delete_document(self, collection_name, document_id, owner=ANY_OWNER):
+        document_id = self.process_id(document_id)
+        if not document_id:
+            return False
+
+        with self._lock:
+            collection = self._collection(collection_name)
+            document = collection.get(document_id)
+            if not document or not self.owned_by(collection_name, document, owner):
+                return False
+            del collection[document_id]
+            self._unindex_owner(collection_name, document)
+            ids = self._ids[collection_name]
+            del ids[bisect.bisect_left(ids, document_id)]
+            for values, key in self._unique_values(collection_name, document):
+                values.pop(key, None)
+            self._unindex_terms(collection_name, document)
+            self._record_change(collection_name, document_id)
+            del self._written_at[collection_name][document_id]
+        self.invalidate(collection_name, document_id)
+        return True
+
+    def bulk_apply(self, collection_name, operations, ordered=True, owner=ANY_OWNER):
+        results = self.prepare_bulk(collection_name, operations, ordered, owner)
+        with self._lock:
+            for position, result in enumerate(results):
+                if result['error']:
+                    continue
+                if result['op'] == 'insert':
+                    result['ok'] = self.create_document(collection_name, result['document']) is not None
+                    error = "Duplicate document."
+                elif result['op'] == 'update':
+                    document = self._collection(collection_name).get(result['_id'])
+                    unchanged = (document is not None and self.owned_by(collection_name, document, owner)
+                                 and {**document, **result['data']} == document)
+                    result['ok'] = unchanged or self.update_document(
+                        collection_name, result['_id'], result['data'], owner
+                    )
+                    error = "Document not found or update rejected."
+                else:
+                    result['ok'] = self.delete_document(collection_name, result['_id'], owner)
+                    error = "Document not found."
+                if not result['ok']:
+                    result['error'] = error
+                    if ordered:
+                        self.skip_bulk(results[position + 1:])
+                        break
+        return results
+
+    def import_documents(self, collection_name, documents):
+        inserted = skipped = 0
+        with self._lock:
+            collection = self._collection(collection_name)
+            for document in documents:
+                if document.get('_id') in collection or self.create_document(collection_name, document) is None:
+                    skipped += 1
+                else:
+                    inserted += 1
+        return inserted, skipped
+
+    def backfill_search_terms(self, batch_size=1000):
+        updated = 0
+        with self._lock:
+            for collection_name, field in self.SEARCHABLE.items():
+                for document in self._collection(collection_name).values():
+                    if '_terms' not in document:
+                        document['_terms'] = self.search_terms(document.get(field, ''))
+                        self._index_terms(collection_name, document)
+                        updated += 1
+                if updated:
+                    self.invalidate(collection_name)
+        return updated
+
+    def index_report(self):
+        # The counterparts of the indexes exist from the first write, and nothing counts their use.
+        return {}
+
+    def backfill_owners(self, owner, batch_size=1000):
+        updated = 0
+        with self._lock:
+            for collection_name in self.OWNED:
+                for document in self._collection(collection_name).values():
+                    if 'owner' not in document:
+                        self._unindex_owner(collection_name, document)
+                        document['owner'] = owner
+                        self._index_owner(collection_name, document)
+                        updated += 1
+                if updated:
+                    self.invalidate(collection_name)
+        return updated
+
+    def transfer_owner(self, from_owner, to_owner):
+        updated = 0
+        with self._lock:
+            for collection_name in self.OWNED:
+                collection = self._collection(collection_name)
+                for _id in self._owned[collection_name].pop(from_owner, ()):
+                    document = collection[_id]
+                    document['owner'] = to_owner
+                    self._index_owner(collection_name, document)
+                    self._record_change(collection_name, _id)
+                    updated += 1
+                if updated:
+                    self.invalidate(collection_name)
+        return updated
+
+    def expire_guest_documents(self, max_age, batch_size=1000):
+        deleted = 0
+        written_before = time.monotonic() - max_age
+        with self._lock:
+            for collection_name in self.OWNED:
+                self._collection(collection_name)
+                written_at = self._written_at[collection_name]
+                guests = [owner for owner in self._owned[collection_name] if str(owner).startswith(GUEST_PREFIX)]
+                for owner in guests:
+                    for _id in list(self._owned[collection_name][owner]):
+                        if written_at.get(_id, 0) < written_before:
+                            deleted += self.delete_document(collection_name, _id)
+                    if not self._owned[collection_name][owner]:
+                        del self._owned[collection_name][owner]
+        return deleted
@@ -1,52 +1,442 @@
 import atexit
 import logging
 import os
+import re
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
 
-from bson.objectid import ObjectId
-from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, PyMongoError
+from bson import decode, encode
+from bson.errors import InvalidBSON
+from bson.timestamp import Timestamp
+from pymongo import DeleteOne, InsertOne, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo.read_preferences import Nearest, PrimaryPreferred, Secondary, SecondaryPreferred
 
-from utils.connection import database_connection
+from storage import (ANY_OWNER, DEFAULT_BATCH_SIZE, DEFAULT_CHANGES_LIMIT, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT,
+                     DUPLICATE_KEY, GUEST_PREFIX, TOMBSTONES, StorageEngine)
+from utils.connection import ConnectionManager, database_connection
+from utils.forks import after_fork_in_child
+from utils.metrics import METRICS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Error code of dropping an index that does not exist.
+INDEX_NOT_FOUND = 27
+# Error codes of a standalone server asked for a change stream.
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+# Writes are stamped before they commit, and by the clocks of several processes: a poll also
+# reads this far behind its watermark, so that a write stamped earlier but committed later is seen.
+CHANGES_OVERLAP = timedelta(seconds=2)
+# What a poll re-reads of that overlap, mostly changes it returned already: these do not count
+# towards its `limit`, but a busier overlap than this ends the poll as if it had too many changes.
+CHANGES_OVERLAP_LIMIT = 1000
 
-class Database:
-    def __init__(self, database_name="tasktracker"):
+READ_PREFERENCES = {
+    'primary': None,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def make_read_preference(mode='primary', max_staleness=-1):
+    """The read preference of list and detail reads, from its name; None for the primary, where writes go."""
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGO_READ_PREFERENCE {mode}, expected one of {', '.join(READ_PREFERENCES)}.")
+    preference = READ_PREFERENCES[mode]
+    return preference(max_staleness=max_staleness) if preference else None
+
+
+def utcnow():
+    """The `_updated_at` of a write: naive UTC to the millisecond, as pymongo reads dates back."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def tombstones(collection_name, ids):
+    """Records of deleted documents, which a polled change feed reads since it cannot see deletions."""
+    deleted_at = utcnow()
+    return [{'collection': collection_name, 'document_id': _id, 'deleted_at': deleted_at} for _id in ids]
+
+
+def expired_guests(written_before):
+    """The query for documents of guests that were not written since `written_before`."""
+    # Anchored, so it is a range of the `(owner, _id)` index.
+    return {'owner': {'$regex': f"^{re.escape(GUEST_PREFIX)}"}, '_updated_at': {'$not': {'$gte': written_before}}}
+
+
+def changes_since(written, deleted, since, limit):
+    """Merge documents written and tombstones into the `(changes, watermark)` of `read_changes`.
+
+    Only the changes after `since` count towards `limit`; those re-read from the overlap before
+    it count towards CHANGES_OVERLAP_LIMIT.
+    """
+    changes = [
+        (document['_updated_at'], 'created' if document.get('_rev', 0) == 0 else 'updated', document['_id'], document)
+        for document in written
+    ]
+    changes += [(tombstone['deleted_at'], 'deleted', tombstone['document_id'], None) for tombstone in deleted]
+    changes.sort(key=lambda change: change[0])
+    fresh = sum(1 for change in changes if change[0] > since)
+    if fresh > limit or len(changes) - fresh > CHANGES_OVERLAP_LIMIT:
+        return None, utcnow()
+    watermark = max([since] + [change[0] for change in changes])
+    return [change[1:] for change in changes], watermark
+
+
+def bulk_requests(results, scope=None):
+    """Translate validated bulk results into pymongo write requests, each paired with its result index.
+
+    `scope` is the owner condition every update and delete must also match.
+    """
+    scope = scope or {}
+    updated_at = utcnow()
+    requests = []
+    for index, result in enumerate(results):
+        if result['error']:
+            continue
+        if result['op'] == 'insert':
+            result['document']['_updated_at'] = updated_at
+            requests.append((index, InsertOne(result['document'])))
+        elif result['op'] == 'update':
+            update = {'$set': {**result['data'], '_updated_at': updated_at}, '$inc': {'_rev': 1}}
+            requests.append((index, UpdateOne({'_id': result['_id'], **scope}, update)))
+        else:
+            requests.append((index, DeleteOne({'_id': result['_id'], **scope})))
+    return requests
+
+
+def bulk_targets(results):
+    """The `_id`s that the valid updates and deletes of a bulk batch are meant for."""
+    return [result['_id'] for result in results if not result['error'] and result['op'] != 'insert']
+
+
+def mark_missing(results, existing, ordered):
+    """Fail the updates and deletes whose document is not in `existing`, as the memory engine does.
+
+    bulk_write counts an update or delete that matches nothing as done, and its result only has
+    totals, so the documents are looked up first: one of another owner reads as missing too.
+    """
+    for position, result in enumerate(results):
+        if result['error'] or result['op'] == 'insert' or result['_id'] in existing:
+            continue
+        result['ok'] = False
+        result['error'] = "Document not found."
+        if ordered:
+            StorageEngine.skip_bulk(results[position + 1:])
+            return
+
+
+def record_bulk_outcome(results, requests, write_errors, ordered):
+    failed = {error['index']: error['errmsg'] for error in write_errors}
+    # An ordered batch stops at its first write error; the requests after it never ran.
+    executed = requests[:min(failed) + 1] if ordered and failed else requests
+    for position, (index, _) in enumerate(executed):
+        results[index]['error'] = failed.get(position)
+        results[index]['ok'] = position not in failed
+    StorageEngine.skip_bulk([results[index] for index, _ in requests[len(executed):]])
+
+
+def import_outcome(details):
+    """`(inserted, skipped)` of an unordered insert_many whose only errors are duplicates, else None."""
+    errors = details.get('writeErrors', [])
+    if any(error['code'] != DUPLICATE_KEY for error in errors):
+        return None
+    return details.get('nInserted', 0), len(errors)
+
+
+def search_query(phrases, words, projection=None, scope=None):
+    """Translate a parsed search into the filter, projection and sort of a find, within the `scope` condition."""
+    query = dict(scope or {})
+    if words:
+        # Anchored, case-sensitive regexes on the lowercased `_terms` are range scans of their index.
+        query['$and'] = [{'_terms': {'$regex': f'^{re.escape(word)}'}} for word in words]
+    if not phrases:
+        return query, projection, [('_id', -1)]
+    query['$text'] = {'$search': ' '.join(f'"{phrase}"' for phrase in phrases)}
+    score = {'$meta': 'textScore'}
+    return query, {**(projection or {}), 'score': score}, [('score', score), ('_id', -1)]
+
+
+class Database(StorageEngine):
+    """MongoDB storage engine.
+
+    Writes go to the primary. List and detail reads follow `read_preference`, so that with
+    secondaryPreferred the secondaries serve them, no staler than its max staleness. A request
+    that runs in a causally consistent session (`start_causal_session`) reads its own writes and
+    those of the earlier requests its token comes from, whichever member answers.
+
+    Inserts and updates stamp `_updated_at` and deletes leave a tombstone, so that a change feed
+    polling a server without change streams reads only what changed since its last poll.
+    """
+
+    def __init__(self, database_name="tasktracker", cache=None, cached_collections=(), connection=None,
+                 read_preference=None):
+        super().__init__(cache, cached_collections)
         self.db_name = database_name
         self.client = None
-        self.collections = []
-        self.initialize_db()
+        self.connection = connection or ConnectionManager()
+        self.read_preference = self.connection.read_preference = read_preference
+        self._causal_session = ContextVar(f'causal_session_{id(self)}', default=None)
+        atexit.register(self.close_connection)
+        after_fork_in_child(self.after_fork)
+        self.start()
+
+    def start(self):
+        if self.connection.connect_in_background:
+            # Startup does not wait for the server; requests fail fast until it answers.
+            self.connection.reconnect_in_background(self.default_uris(), MongoClient, self.on_connect, delay=0)
+        else:
+            self.initialize_db()
+
+    def after_fork(self):
+        # The inherited client's sockets are shared with the parent: drop it without closing
+        # them. This process opens a pool of its own, in the background or at its first operation.
+        self.client = None
+        self.connection.after_fork()
+        if self.connection.connect_in_background or self.connection.background_reconnect:
+            # Requests never connect inline while background reconnects are on: start the loop now.
+            self.connection.reconnect_in_background(self.default_uris(), MongoClient, self.on_connect, delay=0)
+
+    def default_uris(self):
+        return [
+            os.getenv('MONGO_URI'),
+            f"mongodb://localhost:27017/{self.db_name}",
+        ]
 
     def initialize_db(self, uris=None):
         if self.client:
             return self.client
 
-        if uris is None:
-            uris = [
-                os.getenv('MONGO_URI'),
-                f"mongodb://localhost:27017/{self.db_name}",
-            ]
+        uris = uris or self.default_uris()
+        client, uri = self.connection.connect(uris, MongoClient)
+        if client:
+            self.on_connect(client, uri)
+        elif self.connection.background_reconnect:
+            self.connection.reconnect_in_background(uris, MongoClient, self.on_connect)
+        return self.client
+
+    def on_connect(self, client, uri):
+        self.client = client
+        self.ensure_indexes()
+        logger.info(f"Connected to MongoDB using URI: {uri}")
+
+    def reader(self, collection_name):
+        """The collection as list and detail reads see it, on the configured read preference."""
+        if self.read_preference is None:
+            return self.client[self.db_name][collection_name]
+        return self.client.get_database(self.db_name, read_preference=self.read_preference)[collection_name]
 
-        uri = uris[0]
-        if not uri:
-            logger.warning("No valid URI found in the current attempt, trying the next option...")
-            self.initialize_db(uris[1:])
+    def causal(self):
+        """The session keyword of the operations of a request that runs in a causal session."""
+        session = self._causal_session.get()
+        # A session outlives neither a reconnect nor a fork.
+        return {'session': session} if session is not None and session.client is self.client else {}
+
+    def start_causal_session(self, token=None):
+        if not self.client:
             return
+        session = self.client.start_session(causal_consistency=True)
+        if token:
+            try:
+                session.advance_cluster_time(decode(token['cluster_time']))
+                session.advance_operation_time(Timestamp(*token['operation_time']))
+            except (KeyError, TypeError, ValueError, InvalidBSON) as e:
+                logger.warning(f"Ignoring an invalid causal consistency token: {e}")
+        self._causal_session.set(session)
+
+    def causal_token(self):
+        session = self._causal_session.get()
+        if session is None or session.operation_time is None or session.cluster_time is None:
+            return None
+        return {
+            'operation_time': [session.operation_time.time, session.operation_time.inc],
+            'cluster_time': encode(session.cluster_time),
+        }
 
+    def detach_causal_session(self):
+        session = self._causal_session.get()
+        if session is None:
+            return super().detach_causal_session()
+        self._causal_session.set(None)
+        return session.end_session
+
+    def ensure_indexes(self):
+        self.index_errors = {}
+        for collection_name, indexes in self.INDEXES.items():
+            if not indexes:
+                continue
+            collection = self.client[self.db_name][collection_name]
+            try:
+                for name in self.RETIRED_INDEXES.get(collection_name, ()):
+                    try:
+                        collection.drop_index(name)
+                    except OperationFailure as e:
+                        if e.code != INDEX_NOT_FOUND:
+                            raise
+                collection.create_indexes(indexes)
+            except PyMongoError as e:
+                logger.error(f"Error creating indexes on MongoDB {collection_name} collection: {e}")
+                self.index_errors[collection_name] = str(e)
+
+    def bury(self, collection_name, ids):
+        """Leave tombstones for deleted documents; a failure only delays the feed's reload."""
+        if not ids:
+            return
         try:
-            self.client = MongoClient(uri)
-            self.client.admin.command('ping')
-            self.collections = self.client[self.db_name].list_collection_names()
-            atexit.register(self.close_connection)
-            logger.info(f"Connected to MongoDB using URI: {uri}")
-        except ConnectionFailure:
-            logger.error(f"Failed to connect to MongoDB using URI: {uri}, trying the next option...")
-            self.initialize_db(uris[1:])
-        except IndexError:
-            logger.warning("No valid URI found in the current attempt.")
+            self.client[self.db_name][TOMBSTONES].insert_many(tombstones(collection_name, ids), ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Error recording deletions from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('bury', type(e).__name__)
+
+    @database_connection
+    def backfill_search_terms(self, batch_size=1000):
+        updated = 0
+        for collection_name, field in self.SEARCHABLE.items():
+            collection = self.client[self.db_name][collection_name]
+            try:
+                cursor = collection.find({'_terms': {'$exists': False}}, {field: 1}, batch_size=batch_size)
+                batch = []
+                for document in cursor:
+                    batch.append(UpdateOne(
+                        {'_id': document['_id']}, {'$set': {'_terms': self.search_terms(document.get(field, ''))}}
+                    ))
+                    if len(batch) == batch_size:
+                        updated += collection.bulk_write(batch, ordered=False).modified_count
+                        batch = []
+                if batch:
+                    updated += collection.bulk_write(batch, ordered=False).modified_count
+            except PyMongoError as e:
+                logger.error(f"Error adding search terms to MongoDB {collection_name} collection: {e}")
+        if updated:
+            for collection_name in self.SEARCHABLE:
+                self.invalidate(collection_name)
+        return updated
+
+    @database_connection
+    def backfill_owners(self, owner, batch_size=1000):
+        updated = 0
+        for collection_name in self.OWNED:
+            collection = self.client[self.db_name][collection_name]
+            try:
+                # Each batch is one update of the `_id`s read, so a long migration never holds one big write.
+                cursor = collection.find({'owner': {'$exists': False}}, {'_id': 1}, batch_size=batch_size)
+                batch = []
+                for document in cursor:
+                    batch.append(document['_id'])
+                    if len(batch) == batch_size:
+                        updated += self._set_owner(collection, batch, owner)
+                        batch = []
+                if batch:
+                    updated += self._set_owner(collection, batch, owner)
+            except PyMongoError as e:
+                logger.error(f"Error adding owners to MongoDB {collection_name} collection: {e}")
+            if updated:
+                self.invalidate(collection_name)
+        return updated
+
+    @staticmethod
+    def _set_owner(collection, ids, owner):
+        query = {'_id': {'$in': ids}, 'owner': {'$exists': False}}
+        return collection.update_many(query, {'$set': {'owner': owner}}).modified_count
+
+    @database_connection
+    def transfer_owner(self, from_owner, to_owner):
+        updated = 0
+        for collection_name in self.OWNED:
+            collection = self.client[self.db_name][collection_name]
+            try:
+                cursor = collection.find({'owner': from_owner}, {'_id': 1}, **self.causal())
+                ids = [document['_id'] for document in cursor]
+                if not ids:
+                    continue
+                update = {'$set': {'owner': to_owner, '_updated_at': utcnow()}}
+                result = collection.update_many({'_id': {'$in': ids}, 'owner': from_owner}, update, **self.causal())
+            except PyMongoError as e:
+                logger.error(f"Error transferring documents of MongoDB {collection_name} collection: {e}")
+                METRICS.db_errors.inc('transfer_owner', type(e).__name__)
+                continue
+            updated += result.modified_count
+            for _id in ids:
+                self.cache.delete(self.document_cache_key(collection_name, _id))
+            self.invalidate(collection_name)
+        return updated
+
+    @database_connection
+    def expire_guest_documents(self, max_age, batch_size=1000):
+        query = expired_guests(utcnow() - timedelta(seconds=max_age))
+        deleted = 0
+        for collection_name in self.OWNED:
+            collection = self.client[self.db_name][collection_name]
+            try:
+                cursor = collection.find(query, {'_id': 1}, batch_size=batch_size)
+                batch = []
+                for document in cursor:
+                    batch.append(document['_id'])
+                    if len(batch) == batch_size:
+                        deleted += self._delete_expired(collection_name, batch, query)
+                        batch = []
+                if batch:
+                    deleted += self._delete_expired(collection_name, batch, query)
+            except PyMongoError as e:
+                logger.error(f"Error expiring guest documents of MongoDB {collection_name} collection: {e}")
+                METRICS.db_errors.inc('expire_guest_documents', type(e).__name__)
+        return deleted
+
+    def _delete_expired(self, collection_name, ids, query):
+        collection = self.client[self.db_name][collection_name]
+        # The query again, so that a document written since it was read is kept.
+        result = collection.delete_many({'_id': {'$in': ids}, **query})
+        if result.deleted_count < len(ids):
+            kept = {document['_id'] for document in collection.find({'_id': {'$in': ids}}, {'_id': 1})}
+            ids = [_id for _id in ids if _id not in kept]
+        self.bury(collection_name, ids)
+        for _id in ids:
+            self.cache.delete(self.document_cache_key(collection_name, _id))
+        self.invalidate(collection_name)
+        return result.deleted_count
+
+    def watch_changes(self, collection_name, resume_after=None):
+        if not self.client:
+            raise ConnectionFailure("Database is not connected.")
+        try:
+            # Waits at most a second per try_next, so the watcher notices when nobody listens anymore.
+            return self.client[self.db_name][collection_name].watch(
+                full_document='updateLookup', max_await_time_ms=1000, resume_after=resume_after
+            )
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                logger.info(f"No change streams on this MongoDB server, polling {collection_name} instead.")
+                return None
+            raise
+
+    @database_connection
+    def index_report(self):
+        report = {}
+        for collection_name, indexes in self.INDEXES.items():
+            collection = self.client[self.db_name][collection_name]
+            try:
+                existing = collection.index_information()
+                usage = {stats['name']: stats for stats in collection.aggregate([{'$indexStats': {}}])}
+            except PyMongoError as e:
+                logger.error(f"Error reading indexes of MongoDB {collection_name} collection: {e}")
+                METRICS.db_errors.inc('index_report', type(e).__name__)
+                continue
+            report[collection_name] = {
+                'missing': [index.document['name'] for index in indexes if index.document['name'] not in existing],
+                'error': self.index_errors.get(collection_name),
+                'unused': [
+                    {'name': name, 'since': str(stats['accesses']['since'])}
+                    for name, stats in usage.items()
+                    if name != '_id_' and stats['accesses']['ops'] == 0
+                ],
+            }
+        return report
+
+    def ready(self):
+        return self.client is not None and not self.connection.breaker.is_open and super().ready()
 
     def close_connection(self):
         if self.client:
@@ -54,14 +444,6 @@ class Database:
             self.client = None
             logger.info("MongoDB connection closed.")
 
-    @staticmethod
-    def process_id(id_value):
-        try:
-            return ObjectId(id_value)
-        except Exception as e:
-            logger.error(f"Invalid ObjectId: {e}")
-            return None
-
     @database_connection
     def create_document(self, collection_name, new_document):
         if not isinstance(new_document, dict):
@@ -70,36 +452,141 @@ class Database:
 
         try:
             collection = self.client[self.db_name][collection_name]
-            if collection_name == "users":
-                user = collection.find_one({'username': new_document['username']})
-                if user:
-                    raise ValueError(f"User {new_document['username']} already exists.")
-                return collection.insert_one(new_document).inserted_id
-            return collection.insert_one(new_document).inserted_id
+            # Uniqueness (e.g. of users.username) is enforced by the indexes in StorageEngine.INDEXES.
+            new_document.setdefault('_rev', 0)
+            new_document['_updated_at'] = utcnow()
+            self.add_search_terms(collection_name, new_document)
+            inserted_id = collection.insert_one(new_document, **self.causal()).inserted_id
+            self.invalidate(collection_name)
+            return inserted_id
+        except DuplicateKeyError as e:
+            logger.warning(f"Duplicate document rejected by MongoDB {collection_name} collection: {e.details}")
+            METRICS.db_errors.inc('create_document', type(e).__name__)
         except PyMongoError as e:
             logger.error(f"Error adding document to MongoDB {collection_name} collection: {e}")
-        except ValueError as e:
-            logger.error(f"Error adding document to MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('create_document', type(e).__name__)
         return None
 
     @database_connection
-    def read_documents(self, collection_name, _id=None):
+    def read_documents(self, collection_name, _id=None, owner=ANY_OWNER):
+        cache_key = self.document_cache_key(collection_name, _id)
+        scope = self.owner_filter(collection_name, owner)
+        if _id and collection_name in self.cached_collections:
+            document = self.cache.get(cache_key)
+            if document is not None:
+                return document if self.owned_by(collection_name, document, owner) else None
+
         try:
-            collection = self.client[self.db_name][collection_name]
+            collection = self.reader(collection_name)
 
             if _id:
                 if collection_name == "users":
-                    return collection.find_one({'username': _id}) if _id else None
-                _id = self.process_id(_id)
-                return collection.find_one({'_id': _id}) if _id else None
+                    return collection.find_one({'username': _id}, **self.causal()) if _id else None
+                object_id = self.process_id(_id)
+                document = collection.find_one({'_id': object_id}, **self.causal()) if object_id else None
+                if document is not None and collection_name in self.cached_collections:
+                    # Cached whoever asked: the cache holds documents, the owner check comes after it.
+                    self.cache.set(cache_key, document)
+                return document if document is not None and self.owned_by(collection_name, document, owner) else None
 
-            return list(collection.find())
+            return list(collection.find(scope, **self.causal()))
         except PyMongoError as e:
             logger.error(f"Error retrieving document(s) from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('read_documents', type(e).__name__)
             return None if _id else []
 
     @database_connection
-    def update_document(self, collection_name, document_id, update_data):
+    def read_page(self, collection_name, after=None, page_size=DEFAULT_PAGE_SIZE, projection=None, owner=ANY_OWNER):
+        cacheable = collection_name in self.cached_collections
+        if cacheable:
+            cache_key = self.page_cache_key(collection_name, after, page_size, projection, owner)
+            page = self.cache.get(cache_key)
+            if page is not None:
+                return page[0], page[1]
+
+        query = self.owner_filter(collection_name, owner)
+        if after:
+            after = self.process_id(after)
+            if not after:
+                return [], None
+            query['_id'] = {'$lt': after}
+
+        try:
+            collection = self.reader(collection_name)
+            # Fetch one extra document to know whether another page exists without a count query.
+            documents = list(collection.find(query, projection, sort=[('_id', -1)], limit=page_size + 1,
+                                             **self.causal()))
+        except PyMongoError as e:
+            logger.error(f"Error retrieving a page from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('read_page', type(e).__name__)
+            return [], None
+
+        next_cursor = None
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            next_cursor = str(documents[-1]['_id'])
+        if cacheable:
+            self.cache.set(cache_key, [documents, next_cursor])
+        return documents, next_cursor
+
+    @database_connection
+    def iter_documents(self, collection_name, projection=None, batch_size=DEFAULT_BATCH_SIZE, owner=ANY_OWNER,
+                       strict=False):
+        collection = self.reader(collection_name)
+        query = self.owner_filter(collection_name, owner)
+        # The session is taken now, while the request's is bound; the body is read after the view returns.
+        return self._iter_documents(collection, query, projection, batch_size, self.causal(), strict)
+
+    @staticmethod
+    def _iter_documents(collection, query, projection, batch_size, causal, strict):
+        # The cursor fetches `batch_size` documents per round trip, as the consumer reaches them.
+        try:
+            with collection.find(query, projection, sort=[('_id', -1)], batch_size=batch_size, **causal) as cursor:
+                yield from cursor
+        except PyMongoError as e:
+            logger.error(f"Error streaming documents from MongoDB {collection.name} collection: {e}")
+            METRICS.db_errors.inc('iter_documents', type(e).__name__)
+            if strict:
+                raise
+
+    @database_connection
+    def search_documents(self, collection_name, query, limit=DEFAULT_SEARCH_LIMIT, projection=None, max_time_ms=None,
+                         owner=ANY_OWNER):
+        phrases, words = self.parse_search(query)
+        if not phrases and not words:
+            return []
+
+        filter_, projection, sort = search_query(phrases, words, projection, self.owner_filter(collection_name, owner))
+        try:
+            collection = self.reader(collection_name)
+            return list(collection.find(filter_, projection, sort=sort, limit=limit, max_time_ms=max_time_ms,
+                                        **self.causal()))
+        except PyMongoError as e:
+            logger.error(f"Error searching MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('search_documents', type(e).__name__)
+            return []
+
+    @database_connection
+    def read_changes(self, collection_name, since=None, limit=DEFAULT_CHANGES_LIMIT):
+        since = since or utcnow()
+        after = since - CHANGES_OVERLAP
+        try:
+            database = self.client[self.db_name]
+            written = list(database[collection_name].find(
+                {'_updated_at': {'$gt': after}}, sort=[('_updated_at', 1)], limit=limit + CHANGES_OVERLAP_LIMIT + 1
+            ))
+            deleted = list(database[TOMBSTONES].find(
+                {'deleted_at': {'$gt': after}, 'collection': collection_name}, sort=[('deleted_at', 1)],
+                limit=limit + CHANGES_OVERLAP_LIMIT + 1
+            ))
+        except PyMongoError as e:
+            logger.error(f"Error reading changes of MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('read_changes', type(e).__name__)
+            return None
+        return changes_since(written, deleted, since, limit)
+
+    @database_connection
+    def update_document(self, collection_name, document_id, update_data, owner=ANY_OWNER):
         if not isinstance(update_data, dict):
             logger.error("Invalid update data format. Data should be a dictionary.")
             return False
@@ -108,30 +595,102 @@ class Database:
         if not document_id:
             return False
 
+        update_data = self.prepare_update(collection_name, update_data, owner)
+        update_data['_updated_at'] = utcnow()
         try:
             collection = self.client[self.db_name][collection_name]
-            result = collection.update_one({'_id': document_id}, {'$set': update_data})
+            query = {'_id': document_id, **self.owner_filter(collection_name, owner)}
+            result = collection.update_one(query, {'$set': update_data, '$inc': {'_rev': 1}}, **self.causal())
+            if result.modified_count > 0:
+                self.invalidate(collection_name, document_id)
             return result.matched_count > 0 and result.modified_count > 0
         except PyMongoError as e:
             logger.error(f"Error updating document in MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('update_document', type(e).__name__)
             return False
 
     @database_connection
-    def delete_document(self, collection_name, document_id):
+    def delete_document(self, collection_name, document_id, owner=ANY_OWNER):
         document_id = self.process_id(document_id)
         if not document_id:
             return False
 
         try:
             collection = self.client[self.db_name][collection_name]
-            result = collection.delete_one({'_id': document_id})
+            query = {'_id': document_id, **self.owner_filter(collection_name, owner)}
+            result = collection.delete_one(query, **self.causal())
+            if result.deleted_count > 0:
+                self.invalidate(collection_name, document_id)
+                self.bury(collection_name, [document_id])
             return result.deleted_count > 0
         except PyMongoError as e:
             logger.error(f"Error deleting document from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('delete_document', type(e).__name__)
 
+    def _existing_ids(self, collection, ids, scope):
+        if not ids:
+            return set()
+        query = {'_id': {'$in': ids}, **scope}
+        return {document['_id'] for document in collection.find(query, {'_id': 1}, **self.causal())}
 
-def init_db(context):
-    if context and 'db' not in context:
-        load_dotenv()
-        context.db = Database()
-    return context.db
+    @database_connection
+    def bulk_apply(self, collection_name, operations, ordered=True, owner=ANY_OWNER):
+        results = self.prepare_bulk(collection_name, operations, ordered, owner)
+        scope = self.owner_filter(collection_name, owner)
+        requests = []
+        try:
+            collection = self.client[self.db_name][collection_name]
+            mark_missing(results, self._existing_ids(collection, bulk_targets(results), scope), ordered)
+            requests = bulk_requests(results, scope)
+            if not requests:
+                return results
+            counts = collection.bulk_write([request for _, request in requests], ordered=ordered,
+                                           **self.causal()).bulk_api_result
+            write_errors = []
+        except BulkWriteError as e:
+            counts, write_errors = e.details, e.details.get('writeErrors', [])
+        except PyMongoError as e:
+            logger.error(f"Error applying bulk write to MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('bulk_apply', type(e).__name__)
+            for result in results:
+                result['error'] = result['error'] or str(e)
+            return results
+
+        record_bulk_outcome(results, requests, write_errors, ordered)
+        updates = [result for result in results if result['ok'] and result['op'] == 'update']
+        updated = bulk_targets(updates)
+        if counts.get('nMatched', 0) < len(updated):
+            # A document was deleted between the lookup and the write; fail the updates that missed it.
+            try:
+                mark_missing(updates, self._existing_ids(collection, updated, scope), ordered=False)
+            except PyMongoError as e:
+                logger.error(f"Error checking bulk updates of MongoDB {collection_name} collection: {e}")
+        self.invalidate_bulk(collection_name, results)
+        deleted = [result['_id'] for result in results if result['ok'] and result['op'] == 'delete']
+        self.bury(collection_name, deleted)
+        return results
+
+    @database_connection
+    def import_documents(self, collection_name, documents):
+        documents = [self.prepare_import(collection_name, document) for document in documents]
+        updated_at = utcnow()
+        for document in documents:
+            document['_updated_at'] = updated_at
+        if not documents:
+            return 0, 0
+        try:
+            result = self.client[self.db_name][collection_name].insert_many(documents, ordered=False)
+            inserted, skipped = len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            outcome = import_outcome(e.details)
+            if outcome is None:
+                logger.error(f"Error importing into MongoDB {collection_name} collection: {e.details}")
+                METRICS.db_errors.inc('import_documents', type(e).__name__)
+                return None
+            inserted, skipped = outcome
+        except PyMongoError as e:
+            logger.error(f"Error importing into MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('import_documents', type(e).__name__)
+            return None
+        self.invalidate(collection_name)
+        return inserted, skipped
@@ -0,0 +1,476 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+
+from pymongo import AsyncMongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+
+from mongodb import (CHANGES_OVERLAP, CHANGES_OVERLAP_LIMIT, INDEX_NOT_FOUND, bulk_requests, bulk_targets,
+                     changes_since, expired_guests, import_outcome, mark_missing, record_bulk_outcome, search_query,
+                     tombstones, utcnow)
+from storage import (ANY_OWNER, DEFAULT_BATCH_SIZE, DEFAULT_CHANGES_LIMIT, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT,
+                     TOMBSTONES, StorageEngine)
+from utils.forks import after_fork_in_child
+from utils.metrics import METRICS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def on_driver_loop(func):
+    """Decorator to run a coroutine on the database's own event loop and await it from the caller's loop."""
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(func(self, *args, **kwargs), self.loop)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            METRICS.db_duration.observe(time.perf_counter() - start, func.__name__)
+    return wrapper
+
+
+class AsyncDatabase(StorageEngine):
+    """MongoDB engine on pymongo's asyncio client, with the same CRUD surface as Database.
+
+    The client lives on a private event loop thread, so a single connection pool serves every
+    caller whichever loop it awaits from (Flask runs each async view in a loop of its own).
+    """
+
+    def __init__(self, database_name="tasktracker", cache=None, cached_collections=()):
+        super().__init__(cache, cached_collections)
+        self.db_name = database_name
+        self.uri = os.getenv('MONGO_URI') or f"mongodb://localhost:27017/{database_name}"
+        self.start()
+        # Forked children have neither the loop thread nor sockets of their own: start both again.
+        after_fork_in_child(self.start)
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mongodb-async", daemon=True)
+        self._thread.start()
+        self.client = asyncio.run_coroutine_threadsafe(self._connect(), self.loop).result()
+
+    async def _connect(self):
+        # The async client connects lazily, so creating it never blocks startup on the server.
+        client = AsyncMongoClient(self.uri)
+        self.loop.create_task(self.ensure_indexes(client))
+        logger.info(f"Async MongoDB client created for URI: {self.uri}")
+        return client
+
+    async def ensure_indexes(self, client):
+        self.index_errors = {}
+        for collection_name, indexes in self.INDEXES.items():
+            if not indexes:
+                continue
+            collection = client[self.db_name][collection_name]
+            try:
+                for name in self.RETIRED_INDEXES.get(collection_name, ()):
+                    try:
+                        await collection.drop_index(name)
+                    except OperationFailure as e:
+                        if e.code != INDEX_NOT_FOUND:
+                            raise
+                await collection.create_indexes(indexes)
+            except PyMongoError as e:
+                logger.error(f"Error creating indexes on MongoDB {collection_name} collection: {e}")
+                self.index_errors[collection_name] = str(e)
+
+    async def bury(self, collection_name, ids):
+        """Leave tombstones for deleted documents; a failure only delays the feed's reload."""
+        if not ids:
+            return
+        try:
+            await self.client[self.db_name][TOMBSTONES].insert_many(tombstones(collection_name, ids), ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Error recording deletions from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('bury', type(e).__name__)
+
+    def close_connection(self):
+        if self.client:
+            asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+            self.client = None
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            logger.info("Async MongoDB connection closed.")
+
+    @on_driver_loop
+    async def create_document(self, collection_name, new_document):
+        if not isinstance(new_document, dict):
+            logger.error("Invalid document format. Document should be a dictionary.")
+            return None
+
+        try:
+            collection = self.client[self.db_name][collection_name]
+            new_document.setdefault('_rev', 0)
+            new_document['_updated_at'] = utcnow()
+            self.add_search_terms(collection_name, new_document)
+            inserted_id = (await collection.insert_one(new_document)).inserted_id
+            self.invalidate(collection_name)
+            return inserted_id
+        except DuplicateKeyError as e:
+            logger.warning(f"Duplicate document rejected by MongoDB {collection_name} collection: {e.details}")
+            METRICS.db_errors.inc('create_document', type(e).__name__)
+        except PyMongoError as e:
+            logger.error(f"Error adding document to MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('create_document', type(e).__name__)
+        return None
+
+    @on_driver_loop
+    async def read_documents(self, collection_name, _id=None, owner=ANY_OWNER):
+        cache_key = self.document_cache_key(collection_name, _id)
+        if _id and collection_name in self.cached_collections:
+            document = self.cache.get(cache_key)
+            if document is not None:
+                return document if self.owned_by(collection_name, document, owner) else None
+
+        try:
+            collection = self.client[self.db_name][collection_name]
+
+            if _id:
+                if collection_name == "users":
+                    return await collection.find_one({'username': _id})
+                object_id = self.process_id(_id)
+                document = await collection.find_one({'_id': object_id}) if object_id else None
+                if document is not None and collection_name in self.cached_collections:
+                    # Cached whoever asked: the cache holds documents, the owner check comes after it.
+                    self.cache.set(cache_key, document)
+                return document if document is not None and self.owned_by(collection_name, document, owner) else None
+
+            return await collection.find(self.owner_filter(collection_name, owner)).to_list()
+        except PyMongoError as e:
+            logger.error(f"Error retrieving document(s) from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('read_documents', type(e).__name__)
+            return None if _id else []
+
+    @on_driver_loop
+    async def read_page(self, collection_name, after=None, page_size=DEFAULT_PAGE_SIZE, projection=None,
+                        owner=ANY_OWNER):
+        cacheable = collection_name in self.cached_collections
+        if cacheable:
+            cache_key = self.page_cache_key(collection_name, after, page_size, projection, owner)
+            page = self.cache.get(cache_key)
+            if page is not None:
+                return page[0], page[1]
+
+        query = self.owner_filter(collection_name, owner)
+        if after:
+            after = self.process_id(after)
+            if not after:
+                return [], None
+            query['_id'] = {'$lt': after}
+
+        try:
+            collection = self.client[self.db_name][collection_name]
+            cursor = collection.find(query, projection, sort=[('_id', -1)], limit=page_size + 1)
+            documents = await cursor.to_list()
+        except PyMongoError as e:
+            logger.error(f"Error retrieving a page from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('read_page', type(e).__name__)
+            return [], None
+
+        next_cursor = None
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            next_cursor = str(documents[-1]['_id'])
+        if cacheable:
+            self.cache.set(cache_key, [documents, next_cursor])
+        return documents, next_cursor
+
+    def iter_documents(self, collection_name, projection=None, batch_size=DEFAULT_BATCH_SIZE, owner=ANY_OWNER,
+                       strict=False):
+        """A plain generator, so that a sync streamed response can drive it from any thread."""
+        collection = self.client[self.db_name][collection_name]
+        query = self.owner_filter(collection_name, owner)
+        cursor = collection.find(query, projection, sort=[('_id', -1)], batch_size=batch_size)
+        try:
+            while True:
+                batch = asyncio.run_coroutine_threadsafe(cursor.to_list(batch_size), self.loop).result()
+                yield from batch
+                if len(batch) < batch_size:
+                    return
+        except PyMongoError as e:
+            logger.error(f"Error streaming documents from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('iter_documents', type(e).__name__)
+            if strict:
+                raise
+        finally:
+            asyncio.run_coroutine_threadsafe(cursor.close(), self.loop).result()
+
+    @on_driver_loop
+    async def search_documents(self, collection_name, query, limit=DEFAULT_SEARCH_LIMIT, projection=None,
+                               max_time_ms=None, owner=ANY_OWNER):
+        phrases, words = self.parse_search(query)
+        if not phrases and not words:
+            return []
+
+        filter_, projection, sort = search_query(phrases, words, projection, self.owner_filter(collection_name, owner))
+        try:
+            collection = self.client[self.db_name][collection_name]
+            cursor = collection.find(filter_, projection, sort=sort, limit=limit, max_time_ms=max_time_ms)
+            return await cursor.to_list()
+        except PyMongoError as e:
+            logger.error(f"Error searching MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('search_documents', type(e).__name__)
+            return []
+
+    @on_driver_loop
+    async def read_changes(self, collection_name, since=None, limit=DEFAULT_CHANGES_LIMIT):
+        since = since or utcnow()
+        after = since - CHANGES_OVERLAP
+        try:
+            database = self.client[self.db_name]
+            written = await database[collection_name].find(
+                {'_updated_at': {'$gt': after}}, sort=[('_updated_at', 1)], limit=limit + CHANGES_OVERLAP_LIMIT + 1
+            ).to_list()
+            deleted = await database[TOMBSTONES].find(
+                {'deleted_at': {'$gt': after}, 'collection': collection_name}, sort=[('deleted_at', 1)],
+                limit=limit + CHANGES_OVERLAP_LIMIT + 1
+            ).to_list()
+        except PyMongoError as e:
+            logger.error(f"Error reading changes of MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('read_changes', type(e).__name__)
+            return None
+        return changes_since(written, deleted, since, limit)
+
+    @on_driver_loop
+    async def update_document(self, collection_name, document_id, update_data, owner=ANY_OWNER):
+        if not isinstance(update_data, dict):
+            logger.error("Invalid update data format. Data should be a dictionary.")
+            return False
+
+        document_id = self.process_id(document_id)
+        if not document_id:
+            return False
+
+        update_data = self.prepare_update(collection_name, update_data, owner)
+        update_data['_updated_at'] = utcnow()
+        try:
+            collection = self.client[self.db_name][collection_name]
+            query = {'_id': document_id, **self.owner_filter(collection_name, owner)}
+            result = await collection.update_one(query, {'$set': update_data, '$inc': {'_rev': 1}})
+            if result.modified_count > 0:
+                self.invalidate(collection_name, document_id)
+            return result.matched_count > 0 and result.modified_count > 0
+        except PyMongoError as e:
+            logger.error(f"Error updating document in MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('update_document', type(e).__name__)
+            return False
+
+    @on_driver_loop
+    async def delete_document(self, collection_name, document_id, owner=ANY_OWNER):
+        document_id = self.process_id(document_id)
+        if not document_id:
+            return False
+
+        try:
+            collection = self.client[self.db_name][collection_name]
+            result = await collection.delete_one({'_id': document_id, **self.owner_filter(collection_name, owner)})
+            if result.deleted_count > 0:
+                self.invalidate(collection_name, document_id)
+                await self.bury(collection_name, [document_id])
+            return result.deleted_count > 0
+        except PyMongoError as e:
+            logger.error(f"Error deleting document from MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('delete_document', type(e).__name__)
+            return False
+
+    @staticmethod
+    async def _existing_ids(collection, ids, scope):
+        if not ids:
+            return set()
+        cursor = collection.find({'_id': {'$in': ids}, **scope}, {'_id': 1})
+        return {document['_id'] for document in await cursor.to_list()}
+
+    @on_driver_loop
+    async def bulk_apply(self, collection_name, operations, ordered=True, owner=ANY_OWNER):
+        results = self.prepare_bulk(collection_name, operations, ordered, owner)
+        scope = self.owner_filter(collection_name, owner)
+        requests = []
+        try:
+            collection = self.client[self.db_name][collection_name]
+            mark_missing(results, await self._existing_ids(collection, bulk_targets(results), scope), ordered)
+            requests = bulk_requests(results, scope)
+            if not requests:
+                return results
+            result = await collection.bulk_write([request for _, request in requests], ordered=ordered)
+            counts = result.bulk_api_result
+            write_errors = []
+        except BulkWriteError as e:
+            counts, write_errors = e.details, e.details.get('writeErrors', [])
+        except PyMongoError as e:
+            logger.error(f"Error applying bulk write to MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('bulk_apply', type(e).__name__)
+            for result in results:
+                result['error'] = result['error'] or str(e)
+            return results
+
+        record_bulk_outcome(results, requests, write_errors, ordered)
+        updates = [result for result in results if result['ok'] and result['op'] == 'update']
+        updated = bulk_targets(updates)
+        if counts.get('nMatched', 0) < len(updated):
+            # A document was deleted between the lookup and the write; fail the updates that missed it.
+            try:
+                mark_missing(updates, await self._existing_ids(collection, updated, scope), ordered=False)
+            except PyMongoError as e:
+                logger.error(f"Error checking bulk updates of MongoDB {collection_name} collection: {e}")
+        self.invalidate_bulk(collection_name, results)
+        deleted = [result['_id'] for result in results if result['ok'] and result['op'] == 'delete']
+        await self.bury(collection_name, deleted)
+        return results
+
+    @on_driver_loop
+    async def import_documents(self, collection_name, documents):
+        documents = [self.prepare_import(collection_name, document) for document in documents]
+        updated_at = utcnow()
+        for document in documents:
+            document['_updated_at'] = updated_at
+        if not documents:
+            return 0, 0
+        try:
+            result = await self.client[self.db_name][collection_name].insert_many(documents, ordered=False)
+            inserted, skipped = len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            outcome = import_outcome(e.details)
+            if outcome is None:
+                logger.error(f"Error importing into MongoDB {collection_name} collection: {e.details}")
+                METRICS.db_errors.inc('import_documents', type(e).__name__)
+                return None
+            inserted, skipped = outcome
+        except PyMongoError as e:
+            logger.error(f"Error importing into MongoDB {collection_name} collection: {e}")
+            METRICS.db_errors.inc('import_documents', type(e).__name__)
+            return None
+        self.invalidate(collection_name)
+        return inserted, skipped
+
+    @on_driver_loop
+    async def transfer_owner(self, from_owner, to_owner):
+        updated = 0
+        for collection_name in self.OWNED:
+            collection = self.client[self.db_name][collection_name]
+            try:
+                ids = [document['_id'] async for document in collection.find({'owner': from_owner}, {'_id': 1})]
+                if not ids:
+                    continue
+                update = {'$set': {'owner': to_owner, '_updated_at': utcnow()}}
+                result = await collection.update_many({'_id': {'$in': ids}, 'owner': from_owner}, update)
+            except PyMongoError as e:
+                logger.error(f"Error transferring documents of MongoDB {collection_name} collection: {e}")
+                METRICS.db_errors.inc('transfer_owner', type(e).__name__)
+                continue
+            updated += result.modified_count
+            for _id in ids:
+                self.cache.delete(self.document_cache_key(collection_name, _id))
+            self.invalidate(collection_name)
+        return updated
+
+    @on_driver_loop
+    async def expire_guest_documents(self, max_age, batch_size=1000):
+        query = expired_guests(utcnow() - timedelta(seconds=max_age))
+        deleted = 0
+        for collection_name in self.OWNED:
+            collection = self.client[self.db_name][collection_name]
+            try:
+                batch = []
+                async for document in collection.find(query, {'_id': 1}, batch_size=batch_size):
+                    batch.append(document['_id'])
+                    if len(batch) == batch_size:
+                        deleted += await self._delete_expired(collection_name, batch, query)
+                        batch = []
+                if batch:
+                    deleted += await self._delete_expired(collection_name, batch, query)
+            except PyMongoError as e:
+                logger.error(f"Error expiring guest documents of MongoDB {collection_name} collection: {e}")
+                METRICS.db_errors.inc('expire_guest_documents', type(e).__name__)
+        return deleted
+
+    async def _delete_expired(self, collection_name, ids, query):
+        collection = self.client[self.db_name][collection_name]
+        # The query again, so that a document written since it was read is kept.
+        result = await collection.delete_many({'_id': {'$in': ids}, **query})
+        if result.deleted_count < len(ids):
+            kept = {document['_id'] async for document in collection.find({'_id': {'$in': ids}}, {'_id': 1})}
+            ids = [_id for _id in ids if _id not in kept]
+        await self.bury(collection_name, ids)
+        for _id in ids:
+            self.cache.delete(self.document_cache_key(collection_name, _id))
+        self.invalidate(collection_name)
+        return result.deleted_count
+
+    @on_driver_loop
+    async def backfill_search_terms(self, batch_size=1000):
+        updated = 0
+        for collection_name, field in self.SEARCHABLE.items():
+            collection = self.client[self.db_name][collection_name]
+            try:
+                cursor = collection.find({'_terms': {'$exists': False}}, {field: 1}, batch_size=batch_size)
+                batch = []
+                async for document in cursor:
+                    batch.append(UpdateOne(
+                        {'_id': document['_id']}, {'$set': {'_terms': self.search_terms(document.get(field, ''))}}
+                    ))
+                    if len(batch) == batch_size:
+                        updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+                        batch = []
+                if batch:
+                    updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+            except PyMongoError as e:
+                logger.error(f"Error adding search terms to MongoDB {collection_name} collection: {e}")
+        if updated:
+            for collection_name in self.SEARCHABLE:
+                self.invalidate(collection_name)
+        return updated
+
+    @on_driver_loop
+    async def backfill_owners(self, owner, batch_size=1000):
+        updated = 0
+        for collection_name in self.OWNED:
+            collection = self.client[self.db_name][collection_name]
+            try:
+                # Each batch is one update of the `_id`s read, so a long migration never holds one big write.
+                cursor = collection.find({'owner': {'$exists': False}}, {'_id': 1}, batch_size=batch_size)
+                batch = []
+                async for document in cursor:
+                    batch.append(document['_id'])
+                    if len(batch) == batch_size:
+                        updated += await self._set_owner(collection, batch, owner)
+                        batch = []
+                if batch:
+                    updated += await self._set_owner(collection, batch, owner)
+            except PyMongoError as e:
+                logger.error(f"Error adding owners to MongoDB {collection_name} collection: {e}")
+            if updated:
+                self.invalidate(collection_name)
+        return updated
+
+    @staticmethod
+    async def _set_owner(collection, ids, owner):
+        query = {'_id': {'$in': ids}, 'owner': {'$exists': False}}
+        return (await collection.update_many(query, {'$set': {'owner': owner}})).modified_count
+
+    @on_driver_loop
+    async def index_report(self):
+        report = {}
+        for collection_name, indexes in self.INDEXES.items():
+            collection = self.client[self.db_name][collection_name]
+            try:
+                existing = await collection.index_information()
+                usage = {stats['name']: stats async for stats in await collection.aggregate([{'$indexStats': {}}])}
+            except PyMongoError as e:
+                logger.error(f"Error reading indexes of MongoDB {collection_name} collection: {e}")
+                METRICS.db_errors.inc('index_report', type(e).__name__)
+                continue
+            report[collection_name] = {
+                'missing': [index.document['name'] for index in indexes if index.document['name'] not in existing],
+                'error': self.index_errors.get(collection_name),
+                'unused': [
+                    {'name': name, 'since': str(stats['accesses']['since'])}
+                    for name, stats in usage.items()
+                    if name != '_id_' and stats['accesses']['ops'] == 0
+                ],
+            }
+        return report
@@ -0,0 +1,13 @@
+(() => {
+    'use strict'
+
+    // Requests shed by the server (429 and 503 with Retry-After) come with a notice to show;
+    // htmx would otherwise drop error responses without swapping anything.
+    document.body.addEventListener('htmx:beforeSwap', event => {
+        const xhr = event.detail.xhr
+        if ((xhr.status === 429 || xhr.status === 503) && xhr.getResponseHeader('Retry-After')) {
+            event.detail.shouldSwap = true
+            event.detail.isError = false
+        }
+    })
+})()
@@ -0,0 +1,65 @@
+(() => {
+    'use strict'
+
+    // Applies the task changes streamed by the element's data-live URL to the list on the page.
+    const list = document.querySelector('[data-live]')
+    if (!list || !window.EventSource) {
+        return
+    }
+
+    const searchInput = document.querySelector('input[name="q"]')
+    const searching = () => searchInput && searchInput.value.trim() !== ''
+
+    const fromHTML = html => {
+        const template = document.createElement('template')
+        template.innerHTML = html.trim()
+        return template.content.firstElementChild
+    }
+
+    const place = event => {
+        const card = fromHTML(event.data)
+        const current = document.getElementById(card.id)
+        if (current) {
+            // Leave a card alone while it holds the edit form.
+            if (current.querySelector('form')) {
+                return
+            }
+            current.replaceWith(card)
+        } else if (event.type === 'created' && !searching() && document.getElementById('task-list')) {
+            document.getElementById('task-list').prepend(card)
+            const empty = document.getElementById('tasks-empty')
+            if (empty) {
+                empty.remove()
+            }
+        } else {
+            return
+        }
+        htmx.process(card)
+    }
+
+    // A card created on this page may arrive both from the stream and from the create response.
+    document.body.addEventListener('htmx:load', event => {
+        const element = event.detail.elt
+        if (element.id) {
+            document.querySelectorAll(`[id="${element.id}"]`).forEach(other => other !== element && other.remove())
+        }
+    })
+
+    const source = new EventSource(list.dataset.live)
+    source.addEventListener('created', place)
+    source.addEventListener('updated', place)
+    source.addEventListener('deleted', event => {
+        const card = document.getElementById(`id${event.data}`)
+        if (card) {
+            card.remove()
+        }
+    })
+    // Sent when changes may have been missed: reload what the list shows.
+    source.addEventListener('reset', () => {
+        if (searching()) {
+            htmx.trigger(searchInput, 'search')
+        } else {
+            htmx.ajax('GET', '/tasks', {target: '#tasks'})
+        }
+    })
+})()
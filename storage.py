@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import re
+from abc import ABC, abstractmethod
+
+from bson.objectid import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+from utils.cache import NullCache, make_cache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 25
+DEFAULT_SEARCH_LIMIT = 20
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CHANGES_LIMIT = 100
+# Deletions are recorded here for engines whose change feed is polled; kept for an hour.
+TOMBSTONES = 'tombstones'
+TOMBSTONE_TTL = 3600
+
+DUPLICATE_KEY = 11000
+
+# The `owner` of queries on owned collections that reaches every owner's documents, for
+# migrations, exports and the live feed. Views pass `current_owner()` instead.
+ANY_OWNER = object()
+# Owners of signed-out visitors start with this, followed by the id their browser keeps in its session.
+GUEST_PREFIX = 'guest:'
+
+
+def resolve(result):
+    """Wait for the result of an engine method, which is a coroutine on the async engine."""
+    return asyncio.run(result) if asyncio.iscoroutine(result) else result
+
+
+class StorageEngine(ABC):
+    """Operations every storage backend offers to the blueprints."""
+
+    # Indexes every engine maintains; creating an index that already exists is a no-op.
+    INDEXES = {
+        'users': [IndexModel([('username', ASCENDING)], name='username_unique', unique=True)],
+        'tasks': [
+            # Search is scoped to one owner like every task query, so both search indexes lead with it:
+            # a search scans the owner's own entries only, and a text search must name the owner.
+            # Prefix search: anchored regexes on the lowercased title words are range scans of this index.
+            IndexModel([('owner', ASCENDING), ('_terms', ASCENDING)], name='owner_terms'),
+            # Phrase search and its ranking. No language, so every word counts and nothing is stemmed.
+            IndexModel([('owner', ASCENDING), ('title', TEXT)], name='owner_title_text', default_language='none'),
+            # Every task query is scoped to one owner: lists, pages and lookups by `_id` are ranges of this index.
+            IndexModel([('owner', ASCENDING), ('_id', DESCENDING)], name='owner_id'),
+            # A polled change feed reads the documents written since its watermark as a range of this index.
+            IndexModel([('_updated_at', ASCENDING)], name='updated_at'),
+        ],
+        TOMBSTONES: [IndexModel([('deleted_at', ASCENDING)], name='deleted_at_ttl', expireAfterSeconds=TOMBSTONE_TTL)],
+    }
+    # Indexes that others have replaced, dropped when the indexes are ensured. A collection
+    # has at most one text index, so the new one cannot be built next to the old.
+    RETIRED_INDEXES = {'tasks': ('terms', 'title_text')}
+    # Fields only the engine writes; clients cannot set them through inserts or updates.
+    RESERVED_FIELDS = ('_id', '_rev', '_terms', '_updated_at')
+    # The field searched in each searchable collection; its words are kept in the `_terms` array.
+    SEARCHABLE = {'tasks': 'title'}
+    # Collections whose documents belong to the user who created them, in their `owner` field.
+    OWNED = ('tasks',)
+
+    def __init__(self, cache=None, cached_collections=()):
+        self.cache = cache if cache is not None else NullCache()
+        self.cached_collections = set(cached_collections)
+        # Collection name -> why its indexes could not be created, at the last connect.
+        self.index_errors = {}
+
+    @staticmethod
+    def process_id(id_value):
+        try:
+            return ObjectId(id_value)
+        except Exception as e:
+            logger.error(f"Invalid ObjectId: {e}")
+            return None
+
+    def collection_version(self, collection_name):
+        """Return a stamp that changes whenever a document of the collection is written."""
+        return self.cache.version(collection_name)
+
+    @staticmethod
+    def document_cache_key(collection_name, document_id):
+        return f"{collection_name}:doc:{document_id}"
+
+    def page_cache_key(self, collection_name, after, page_size, projection, owner=ANY_OWNER):
+        # The collection version is part of the key, so any write makes older pages unreachable.
+        owner = '*' if owner is ANY_OWNER else owner
+        return (f"{collection_name}:{self.cache.version(collection_name)}:page:{owner}:"
+                f"{after}:{page_size}:{sorted((projection or {}).items())}")
+
+    def owner_filter(self, collection_name, owner):
+        """The query condition that scopes a read or write to the documents of one owner."""
+        if owner is ANY_OWNER or collection_name not in self.OWNED:
+            return {}
+        return {'owner': owner}
+
+    def owned_by(self, collection_name, document, owner):
+        return all(document.get(field) == value for field, value in self.owner_filter(collection_name, owner).items())
+
+    @classmethod
+    def client_fields(cls, data):
+        """Copy a document or update sent by a client without the RESERVED_FIELDS."""
+        return {field: value for field, value in data.items() if field not in cls.RESERVED_FIELDS}
+
+    def prepare_update(self, collection_name, update_data, owner=ANY_OWNER):
+        """Copy update data with its search terms; scoped updates cannot hand a document to another owner."""
+        update_data = self.add_search_terms(collection_name, self.client_fields(update_data))
+        if self.owner_filter(collection_name, owner):
+            update_data.pop('owner', None)
+        return update_data
+
+    def invalidate(self, collection_name, document_id=None):
+        """Drop the cached copy of a document and retire every cached page of its collection."""
+        if document_id is not None:
+            self.cache.delete(self.document_cache_key(collection_name, document_id))
+        self.cache.bump(collection_name)
+
+    @staticmethod
+    def search_terms(text):
+        return sorted(set(re.findall(r'\w+', str(text).lower())))
+
+    def add_search_terms(self, collection_name, data):
+        """Set `_terms` on a document or update that writes the searchable field, and return it."""
+        field = self.SEARCHABLE.get(collection_name)
+        if field and field in data:
+            data['_terms'] = self.search_terms(data[field])
+        return data
+
+    @classmethod
+    def parse_search(cls, query):
+        """Split a search into its quoted phrases and the words outside them, all lowercased.
+
+        An unterminated quote counts as a phrase, so typing one does not change the results midway.
+        """
+        phrases = [phrase.strip().lower() for phrase in re.findall(r'"([^"]*)"?', query) if phrase.strip()]
+        words = cls.search_terms(re.sub(r'"[^"]*"?', ' ', query))
+        return phrases, words
+
+    def cached_read(self, operation, collection_name, *args, **kwargs):
+        """Answer a read from the cache alone, for when the database cannot be reached; None on a miss."""
+        if collection_name not in self.cached_collections:
+            return None
+        if operation == 'read_documents':
+            _id = args[0] if args else kwargs.get('_id')
+            if _id:
+                document = self.cache.get(self.document_cache_key(collection_name, _id))
+                if document is not None and self.owned_by(collection_name, document, kwargs.get('owner', ANY_OWNER)):
+                    return document
+        elif operation == 'read_page':
+            arguments = {**dict(zip(('after', 'page_size', 'projection'), args)), **kwargs}
+            page = self.cache.get(self.page_cache_key(
+                collection_name,
+                arguments.get('after'),
+                arguments.get('page_size', DEFAULT_PAGE_SIZE),
+                arguments.get('projection'),
+                arguments.get('owner', ANY_OWNER)
+            ))
+            if page is not None:
+                return page[0], page[1]
+        return None
+
+    def prepare_bulk(self, collection_name, operations, ordered=True, owner=ANY_OWNER):
+        """Validate bulk operations and return one result per operation.
+
+        Operations are `{'op': 'insert', 'document': {...}}`, `{'op': 'update', 'id': ..., 'data': {...}}`
+        or `{'op': 'delete', 'id': ...}`. Each result carries the operation, its `_id`, the `document`
+        to render for inserts and updates, and `ok`/`error`; invalid operations get their `error` here.
+        Inserts get their `_id` up front so that every result can name its document, and the
+        `owner` of the batch, which updates and deletes are also limited to. The RESERVED_FIELDS
+        of inserted documents and update data are dropped.
+        """
+        results = []
+        for operation in operations:
+            op = operation.get('op')
+            result = {'op': op, '_id': None, 'document': None, 'ok': False, 'error': None}
+            if op == 'insert':
+                document = operation.get('document')
+                if isinstance(document, dict):
+                    document = {**self.client_fields(document), '_id': ObjectId(), '_rev': 0}
+                    document.update(self.owner_filter(collection_name, owner))
+                    self.add_search_terms(collection_name, document)
+                    result.update(_id=document['_id'], document=document)
+                else:
+                    result['error'] = "Document should be a dictionary."
+            elif op in ('update', 'delete'):
+                result['_id'] = self.process_id(operation.get('id'))
+                data = operation.get('data')
+                if not result['_id']:
+                    result['error'] = f"Invalid id {operation.get('id')}."
+                elif op == 'update' and not isinstance(data, dict):
+                    result['error'] = "Update data should be a dictionary."
+                elif op == 'update':
+                    result['data'] = self.prepare_update(collection_name, data, owner)
+                    result['document'] = {**self.client_fields(data), '_id': result['_id']}
+            else:
+                result['error'] = f"Unknown operation {op}."
+            results.append(result)
+
+        if ordered:
+            # An ordered batch stops at its first failure, invalid operations included.
+            failed = next((index for index, result in enumerate(results) if result['error']), None)
+            if failed is not None:
+                self.skip_bulk(results[failed + 1:])
+        return results
+
+    def prepare_import(self, collection_name, document):
+        """Give an imported document what every write gives it: a `_rev` and its search terms."""
+        document.setdefault('_rev', 0)
+        return self.add_search_terms(collection_name, document)
+
+    @staticmethod
+    def skip_bulk(results):
+        for result in results:
+            if not result['error']:
+                result['error'] = "Not executed: an earlier operation in the ordered batch failed."
+
+    def invalidate_bulk(self, collection_name, results):
+        for result in results:
+            if result['ok'] and result['op'] != 'insert':
+                self.cache.delete(self.document_cache_key(collection_name, result['_id']))
+        if any(result['ok'] for result in results):
+            self.cache.bump(collection_name)
+
+    def watch_changes(self, collection_name, resume_after=None):
+        """Open a change stream on the collection, or return None when the engine has none to offer."""
+        return None
+
+    @abstractmethod
+    def backfill_search_terms(self, batch_size=1000):
+        """Add `_terms` to documents written before search existed; returns how many were updated."""
+
+    @abstractmethod
+    def backfill_owners(self, owner, batch_size=1000):
+        """Give documents of owned collections written before owners existed one; returns how many were updated."""
+
+    @abstractmethod
+    def index_report(self):
+        """List declared indexes that are missing and existing indexes that have never been used."""
+
+    def unenforced_unique_indexes(self):
+        """Collections whose unique indexes could not be created, e.g. over existing duplicates.
+
+        Their writes would accept the duplicates those indexes are there to reject.
+        """
+        return [
+            collection_name for collection_name in self.index_errors
+            if any(index.document.get('unique') for index in self.INDEXES.get(collection_name, ()))
+        ]
+
+    def ready(self):
+        """Whether the engine can serve requests now; readiness probes ask this.
+
+        Not while a unique index is missing: remove the duplicates and restart to build it.
+        """
+        return not self.unenforced_unique_indexes()
+
+    def start_causal_session(self, token=None):
+        """Run this request's operations in one causally consistent session, after those of `token`.
+
+        A no-op for engines whose reads always see every write.
+        """
+
+    def causal_token(self):
+        """What a later request needs to see everything this request's session has seen, or None."""
+        return None
+
+    def detach_causal_session(self):
+        """Unbind the request's session and return the function that ends it, to call once its cursors are done."""
+        return lambda: None
+
+    def close_connection(self):
+        pass
+
+    @abstractmethod
+    def create_document(self, collection_name, new_document):
+        """Insert a document and return its `_id`, or None if it was rejected.
+
+        Documents carry a `_rev` counter, 0 on insert and incremented by every update,
+        which rendered fragments of the document are cached on.
+        """
+
+    @abstractmethod
+    def read_documents(self, collection_name, _id=None, owner=ANY_OWNER):
+        """Return one document by `_id` (by username for users), or every document of the collection.
+
+        On owned collections, `owner` limits this and the other reads and writes below to the
+        documents of that owner; a document of someone else reads as missing.
+        """
+
+    @abstractmethod
+    def read_page(self, collection_name, after=None, page_size=DEFAULT_PAGE_SIZE, projection=None, owner=ANY_OWNER):
+        """Read one page of documents, newest first, using the `_id` of the last document seen as the cursor.
+
+        Returns a `(documents, next_cursor)` tuple; `next_cursor` is None on the last page.
+        """
+
+    @abstractmethod
+    def iter_documents(self, collection_name, projection=None, batch_size=DEFAULT_BATCH_SIZE, owner=ANY_OWNER,
+                       strict=False):
+        """Yield every document of the collection, newest first, reading `batch_size` at a time.
+
+        Only one batch is held at once, so memory stays flat however large the collection; this
+        is the read behind streamed responses. Errors end the iteration early and are logged; with
+        `strict` they are raised as well, for readers such as exports that must not pass a partial
+        read off as the whole collection.
+        """
+
+    @abstractmethod
+    def search_documents(self, collection_name, query, limit=DEFAULT_SEARCH_LIMIT, projection=None, max_time_ms=None,
+                         owner=ANY_OWNER):
+        """Find up to `limit` documents whose searchable field matches `query`, best first.
+
+        Every word of the query must start a word of the field; quoted phrases must appear as they are.
+        Results are ranked by text score when the query has phrases, and newest first otherwise.
+        """
+
+    @abstractmethod
+    def read_changes(self, collection_name, since=None, limit=DEFAULT_CHANGES_LIMIT):
+        """Read what was written to the collection after the watermark `since`, for polling for changes.
+
+        Returns `(changes, watermark)`, the changes as `(event, _id, document)` in the order they
+        were made and the watermark to pass next; `since=None` starts from now. `changes` is None
+        when there were more than `limit`, and the result None when the read failed. A change
+        may be returned by more than one call; compare `_id` and `_rev` to tell.
+        """
+
+    @abstractmethod
+    def update_document(self, collection_name, document_id, update_data, owner=ANY_OWNER):
+        """Set the given fields on a document and return whether it was modified."""
+
+    @abstractmethod
+    def delete_document(self, collection_name, document_id, owner=ANY_OWNER):
+        """Delete a document and return whether it existed."""
+
+    @abstractmethod
+    def bulk_apply(self, collection_name, operations, ordered=True, owner=ANY_OWNER):
+        """Apply a batch of inserts, updates and deletes at once; see `prepare_bulk` for the format."""
+
+    @abstractmethod
+    def transfer_owner(self, from_owner, to_owner):
+        """Give every document `from_owner` has in the owned collections to `to_owner`; returns how many.
+
+        This is how the tasks a guest created become theirs when they sign in or up.
+        """
+
+    @abstractmethod
+    def expire_guest_documents(self, max_age, batch_size=1000):
+        """Delete the documents of guests that were not written for `max_age` seconds; returns how many.
+
+        A guest's documents are only reachable through the session cookie of their browser, so
+        once it is gone nobody can see them again.
+        """
+
+    @abstractmethod
+    def import_documents(self, collection_name, documents):
+        """Insert a batch of documents as they are, `_id` included, to restore an export.
+
+        Documents that exist already (same `_id` or unique key) are skipped, so a batch can be
+        replayed after an interruption. Returns `(inserted, skipped)`, or None if the batch failed.
+        """
+
+
+def init_db(context, config=None):
+    if context and 'db' not in context:
+        load_dotenv()
+        config = config or {}
+        storage = config.get('STORAGE', 'mongodb')
+        if storage == 'memory':
+            from memorydb import MemoryDatabase
+            context.db = MemoryDatabase()
+        elif storage == 'mongodb':
+            from mongodb import Database, make_read_preference
+            from utils.connection import ConnectionManager
+            context.db = Database(
+                cache=make_cache(config),
+                cached_collections=config.get('CACHE_COLLECTIONS', ()),
+                connection=ConnectionManager.from_config(config),
+                read_preference=make_read_preference(
+                    config.get('MONGO_READ_PREFERENCE', 'primary'),
+                    config.get('MONGO_MAX_STALENESS_SECONDS', -1)
+                )
+            )
+        elif storage == 'mongodb-async':
+            from mongodb_async import AsyncDatabase
+            context.db = AsyncDatabase(
+                cache=make_cache(config),
+                cached_collections=config.get('CACHE_COLLECTIONS', ())
+            )
+        else:
+            raise ValueError(f"Unknown STORAGE {storage}, expected 'mongodb', 'mongodb-async' or 'memory'.")
+    return context.db
@@ -0,0 +1,105 @@
+import pytest
+
+from config import TestingConfig
+from factory import create_app
+from utils.admission import Admission, ConcurrencyLimiter, RateLimiter
+from utils.metrics import METRICS
+
+
+class Config(TestingConfig):
+    ADMISSION_LIMITS = {'api.list_all_documents': 1}
+    RATE_LIMITS = {'api.list_documents': (1.0, 2)}
+
+
+@pytest.fixture
+def app():
+    return create_app(Config)
+
+
+def test_rate_limiter_refills_over_time():
+    now = [0.0]
+    limiter = RateLimiter(rate=2.0, burst=2, max_keys=2, clock=lambda: now[0])
+    assert limiter.acquire('a') == 0 and limiter.acquire('a') == 0
+    assert limiter.acquire('a') == pytest.approx(0.5)
+    assert limiter.acquire('b') == 0
+    now[0] = 0.5
+    assert limiter.acquire('a') == 0
+    limiter.acquire('c')
+    assert 'b' not in limiter._buckets
+
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(1)
+    assert limiter.try_acquire() and not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def test_concurrent_requests_past_the_limit_are_shed(app):
+    client = app.test_client()
+    shed = METRICS.requests_shed.value('/tasks/all', 'concurrency')
+    streaming = client.get('/tasks/all')
+    assert streaming.is_streamed
+
+    response = client.get('/tasks/all', headers={'HX-Request': 'true'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1' and response.headers['HX-Retarget'] == '#notices'
+    assert b'busy' in response.data
+    assert METRICS.requests_shed.value('/tasks/all', 'concurrency') == shed + 1
+    assert client.get('/tasks').status_code == 200
+
+    # The slot is held until the streamed body is done.
+    streaming.close()
+    assert client.get('/tasks/all').status_code == 200
+
+
+def with_session(app, **values):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(values)
+    return client
+
+
+def test_sessions_over_their_rate_get_429(app):
+    client, other = with_session(app, browser_id='browser-a'), with_session(app, user_id='someone-else')
+    assert [client.get('/tasks').status_code for _ in range(3)] == [200, 200, 429]
+    assert int(client.get('/tasks').headers['Retry-After']) >= 1
+    assert other.get('/tasks').status_code == 200
+    assert client.get('/').status_code == 200
+    assert 'admission_in_flight_api_list_all_documents 0' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_signed_out_browsers_behind_one_address_have_buckets_of_their_own(app):
+    first, second = with_session(app, browser_id='browser-a'), with_session(app, browser_id='browser-b')
+    assert [first.get('/tasks').status_code for _ in range(3)] == [200, 200, 429]
+    assert second.get('/tasks').status_code == 200
+
+
+def test_clients_without_a_session_are_limited_by_address():
+    class ProxiedConfig(Config):
+        PROXY_FIX_X_FOR = 1
+    app = create_app(ProxiedConfig)
+
+    def cookieless(address):
+        # A new client each time: nothing carries over from the session cookie.
+        return app.test_client().get('/tasks', headers={'X-Forwarded-For': address}).status_code
+    assert [cookieless('203.0.113.1') for _ in range(3)] == [200, 200, 429]
+    assert cookieless('203.0.113.2') == 200
+
+
+def test_only_form_posts_count_against_the_rate_limit():
+    class FormConfig(Config):
+        RATE_LIMITS = {'user.login': (0.01, 2)}
+    client = create_app(FormConfig).test_client()
+    assert [client.get('/users/login').status_code for _ in range(3)] == [200, 200, 200]
+    login = {'username': 'nobody', 'password': 'wrong'}
+    assert [client.post('/users/login', data=login).status_code for _ in range(3)] == [400, 400, 429]
+
+
+def test_signed_out_browsers_share_a_bucket_of_their_address(app):
+    app.config['RATE_LIMIT_ADDRESS_FACTOR'] = 2
+    app.admission = Admission.from_config(app.config)
+    browsers = [with_session(app, browser_id=f"browser-{i}") for i in range(3)]
+    # Each fresh browser id has a full bucket of 2, but the address only has 4 between them.
+    assert [browser.get('/tasks').status_code for browser in browsers for _ in range(2)] == [200] * 4 + [429] * 2
+    assert with_session(app, user_id='someone').get('/tasks').status_code == 200
@@ -0,0 +1,61 @@
+import gzip
+import os
+import shutil
+
+import pytest
+from flask import Flask
+
+from utils.assets import BUNDLES, build_assets, init_assets, minify_css, purge_css
+
+ROOT = "/".join(__file__.split("/")[:-2])
+
+
+@pytest.fixture
+def app(tmp_path):
+    static = tmp_path / 'static'
+    for source in {source for sources in BUNDLES.values() for source in sources}:
+        os.makedirs(static / os.path.dirname(source), exist_ok=True)
+        shutil.copy(os.path.join(ROOT, 'static', source), static / source)
+    app = Flask("tasktracker", root_path=ROOT, static_folder=str(static))
+    init_assets(app)
+    return app
+
+
+def test_purge_keeps_rules_for_used_classes():
+    css = """
+    @charset "UTF-8";
+    :root { --x: 1; }
+    .card, .carousel { color: red; }
+    .btn:not(.btn-check) { margin: 0; }
+    @media (min-width: 576px) { .toast { display: none; } .card-body { padding: 0; } }
+    @keyframes spin { to { transform: rotate(1turn); } }
+    """
+    purged = purge_css(css, {'card', 'card-body', 'btn'})
+    assert minify_css(purged) == (
+        ':root{--x:1}.card{color:red}.btn:not(.btn-check){margin:0}'
+        '@media (min-width:576px){.card-body{padding:0}}@keyframes spin{to{transform:rotate(1turn)}}'
+    )
+
+
+def test_sources_are_linked_without_a_build(app):
+    with app.test_request_context():
+        urls = app.jinja_env.globals['asset_urls']('app.css')
+    assert urls[-1] == '/static/bootstrap-5.3.2-dist/css/bootstrap.css'
+
+
+def test_build_serves_fingerprinted_compressed_bundles(app):
+    manifest = build_assets(app)
+    with app.test_request_context():
+        url, = app.jinja_env.globals['asset_urls']('app.css')
+    assert url == f"/assets/{manifest['app.css']}"
+
+    plain = app.test_client().get(url)
+    assert plain.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert plain.mimetype == 'text/css'
+    assert '.modal-content{' in plain.get_data(as_text=True)
+    assert '.carousel-item{' not in plain.get_data(as_text=True)
+
+    compressed = app.test_client().get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert 'Accept-Encoding' in compressed.headers['Vary']
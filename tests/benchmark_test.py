@@ -0,0 +1,16 @@
+from benchmarks.routes import regressions, run
+
+
+def test_every_route_runs_against_the_memory_engine():
+    # More requests than the admission limits allow at once: each must be released when closed.
+    results = run([5], iterations=20)
+    assert len(results['5']['routes']) == 10
+    assert results['5']['peak_memory_kb'] > 0
+
+
+def test_regressions_are_reported():
+    baseline = {'10': {'peak_memory_kb': 100, 'routes': {'GET /': {'p95_ms': 1.0, 'throughput': 1000}}}}
+    same = {'10': {'peak_memory_kb': 110, 'routes': {'GET /': {'p95_ms': 1.2, 'throughput': 900}}}}
+    worse = {'10': {'peak_memory_kb': 200, 'routes': {'GET /': {'p95_ms': 2.0, 'throughput': 500}}}}
+    assert regressions(same, baseline, 0.25) == []
+    assert len(regressions(worse, baseline, 0.25)) == 3
@@ -0,0 +1,51 @@
+import pytest
+from bson import ObjectId
+
+from config import TestingConfig
+from factory import create_app
+
+
+@pytest.fixture
+def client():
+    app = create_app(TestingConfig)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'alice-id'
+    return client
+
+
+def test_bulk_insert_and_delete(client):
+    response = client.post('/tasks/bulk', json={'operations': [
+        {'op': 'insert', 'document': {'title': 'First'}},
+        {'op': 'delete', 'id': '507f1f77bcf86cd799439011'},
+    ], 'ordered': False})
+    assert response.status_code == 200
+    assert b'First' in response.data and b'Document not found.' in response.data
+
+
+@pytest.mark.parametrize('body', [
+    [{'op': 'insert', 'document': {'title': 'First'}}],
+    {'operations': ['insert']},
+    {'operations': {'op': 'insert'}},
+])
+def test_malformed_bulk_requests_are_rejected(client, body):
+    assert client.post('/tasks/bulk', json=body).status_code == 400
+
+
+def test_bulk_is_only_offered_for_tasks(client):
+    assert client.post('/users/bulk', json={'operations': []}).status_code == 404
+
+
+def test_bulk_ignores_reserved_fields(client):
+    response = client.post('/tasks/bulk', json={'operations': [
+        {'op': 'insert', 'document': {'_id': 'abc', '_rev': 7, '_terms': ['x'], 'title': 'First'}},
+    ]})
+    assert response.status_code == 200
+    [task] = client.application.db.read_documents('tasks', owner='alice-id')
+    assert isinstance(task['_id'], ObjectId) and task['_rev'] == 0 and task['_terms'] == ['first']
+
+    client.post('/tasks/bulk', json={'operations': [
+        {'op': 'update', 'id': str(task['_id']), 'data': {'_id': 'abc', '_rev': 0, 'title': 'Renamed'}},
+    ]})
+    task = client.application.db.read_documents('tasks', str(task['_id']), owner='alice-id')
+    assert task['title'] == 'Renamed' and task['_rev'] == 1
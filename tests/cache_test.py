@@ -0,0 +1,75 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from config import TestingConfig
+from factory import create_app
+from utils.cache import LocalCache, NullCache, RedisCache, make_cache
+
+
+@pytest.fixture
+def cache():
+    return LocalCache(max_entries=2, ttl=30)
+
+
+def test_get_set(cache):
+    cache.set("a", {"_id": 1})
+    assert cache.get("a") == {"_id": 1}
+    assert cache.get("missing") is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru_eviction(cache):
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_expiry(cache):
+    with patch("utils.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("utils.cache.time.monotonic", return_value=131.0):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_delete(cache):
+    cache.set("a", 1)
+    cache.delete("a")
+    assert cache.get("a") is None
+
+
+def test_versions_bump_per_collection():
+    cache = NullCache()
+    tasks_version = cache.version("tasks")
+    assert cache.bump("tasks") != tasks_version
+    assert cache.version("users") == NullCache.version(cache, "users")
+    assert cache.version("tasks") != tasks_version
+
+
+def test_make_cache():
+    assert isinstance(make_cache({'CACHE_BACKEND': 'memory'}), LocalCache)
+    assert type(make_cache({'CACHE_BACKEND': 'none'})) is NullCache
+    assert type(make_cache({})) is NullCache
+
+
+def test_redis_cache_counts_its_own_keys():
+    with patch.dict('sys.modules', {'redis': Mock()}):
+        cache = RedisCache("redis://localhost")
+    cache.client.scan_iter.return_value = [b"tasktracker:tasks:doc:1", b"tasktracker:version:tasks"]
+    assert len(cache) == 1
+    cache.client.scan_iter.assert_called_once_with(match="tasktracker:*", count=1000)
+    assert 'entries' not in cache.stats()
+
+
+def test_stats_endpoint_is_debug_only():
+    app = create_app(TestingConfig)
+    assert app.test_client().get('/cache/stats').status_code == 404
+    app.debug = True
+    assert app.test_client().get('/cache/stats').json['backend'] == 'NullCache'
@@ -0,0 +1,158 @@
+import os
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from pymongo.errors import ConnectionFailure
+from pymongo.hello import Hello
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.server_description import ServerDescription
+from pymongo.synchronous.settings import TopologySettings
+from pymongo.topology_description import TOPOLOGY_TYPE, TopologyDescription
+
+from mongodb import Database
+from utils.cache import LocalCache
+from utils.connection import BreakerTopologyListener, CircuitBreaker, ConnectionManager
+from utils.metrics import METRICS
+
+MONGO_CLIENT = "mongodb.MongoClient"
+
+
+@pytest.fixture(autouse=True)
+def mock_env_vars():
+    with patch.dict(os.environ, {'MONGO_URI': 'mongodb://localhost:27017/testdb'}):
+        yield
+
+
+@pytest.fixture
+def mock_mongo_client():
+    mock_collection = Mock()
+    mock_collection.find.return_value = iter([{"_id": 1, "title": "doc1"}])
+    mock_db = Mock()
+    mock_db.__getitem__ = Mock(return_value=mock_collection)
+    mock_client = Mock()
+    mock_client.__getitem__ = Mock(return_value=mock_db)
+    return mock_client
+
+
+def test_breaker_lets_one_trial_through_after_reset_timeout():
+    breaker = CircuitBreaker(reset_timeout=0.05)
+    assert breaker.allow()
+    breaker.open()
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.close()
+    assert breaker.allow()
+
+
+def test_pool_settings_come_from_config():
+    manager = ConnectionManager.from_config({'MONGO_MAX_POOL_SIZE': 10, 'MONGO_SERVER_SELECTION_TIMEOUT_MS': 500})
+    assert manager.client_options['maxPoolSize'] == 10
+    assert manager.client_options['serverSelectionTimeoutMS'] == 500
+
+
+def test_operations_fail_fast_while_disconnected():
+    with patch(MONGO_CLIENT, side_effect=ConnectionFailure("down")) as mock_client:
+        db = Database(database_name="testdb", connection=ConnectionManager(breaker=CircuitBreaker(reset_timeout=60)))
+        attempts = mock_client.call_count
+        assert db.client is None
+        assert db.read_page("tasks") == ([], None)
+        assert db.update_document("tasks", "507f1f77bcf86cd799439011", {"title": "x"}) is False
+        assert list(db.iter_documents("tasks")) == []
+        with pytest.raises(ConnectionFailure):
+            db.iter_documents("tasks", strict=True)
+        # The open breaker keeps requests from retrying the connection on every call.
+        assert mock_client.call_count == attempts
+
+
+def test_cached_reads_are_served_while_the_breaker_is_open(mock_mongo_client):
+    with patch(MONGO_CLIENT, return_value=mock_mongo_client):
+        db = Database(database_name="testdb", cache=LocalCache(), cached_collections=["tasks"],
+                      connection=ConnectionManager(breaker=CircuitBreaker(reset_timeout=60)))
+    page = db.read_page("tasks")
+    db.connection.breaker.open()
+    db.connection.read_breaker.open()
+    mock_mongo_client.__getitem__.return_value.__getitem__.return_value.find.reset_mock()
+
+    assert db.read_page("tasks") == page
+    assert db.read_page("tasks", after="507f1f77bcf86cd799439011") == ([], None)
+    mock_mongo_client.__getitem__.return_value.__getitem__.return_value.find.assert_not_called()
+
+
+def topology(writable, readable):
+    return Mock(has_writable_server=Mock(return_value=writable), has_readable_server=Mock(return_value=readable))
+
+
+def test_reads_go_on_while_only_the_primary_is_lost(mock_mongo_client):
+    preference = SecondaryPreferred()
+    with patch(MONGO_CLIENT, return_value=mock_mongo_client):
+        db = Database(database_name="testdb", read_preference=preference)
+    listener = BreakerTopologyListener(db.connection)
+    collection = Mock()
+    collection.find.return_value = []
+    mock_mongo_client.get_database.return_value.__getitem__ = Mock(return_value=collection)
+
+    listener.description_changed(Mock(previous_description=topology(True, True), new_description=topology(False, True)))
+    assert db.connection.breaker.is_open and not db.connection.read_breaker.is_open
+    assert db.read_page("tasks") == ([], None) and collection.find.called
+    assert db.update_document("tasks", "507f1f77bcf86cd799439011", {"title": "x"}) is False
+    mock_mongo_client.__getitem__.return_value.__getitem__.return_value.update_one.assert_not_called()
+
+    lost = Mock(previous_description=topology(False, True), new_description=topology(False, False))
+    listener.description_changed(lost)
+    assert db.connection.read_breaker.is_open
+    lost.new_description.has_readable_server.assert_called_with(preference)
+
+    back = Mock(previous_description=topology(False, False), new_description=topology(True, True))
+    listener.description_changed(back)
+    assert not db.connection.breaker.is_open and not db.connection.read_breaker.is_open
+
+
+def replica_set(primary=True):
+    """A replica set of a secondary and, if `primary`, a primary, as the driver describes it."""
+    members = [('b', False)] + ([('a', True)] if primary else [])
+    servers = {
+        (host, 27017): ServerDescription((host, 27017), round_trip_time=0.001, hello=Hello({
+            'ok': 1, 'setName': 'rs', 'isWritablePrimary': writable, 'secondary': not writable,
+            'hosts': ['a:27017', 'b:27017'], 'minWireVersion': 0, 'maxWireVersion': 21,
+        }))
+        for host, writable in members
+    }
+    kind = TOPOLOGY_TYPE.ReplicaSetWithPrimary if primary else TOPOLOGY_TYPE.ReplicaSetNoPrimary
+    return TopologyDescription(kind, servers, 'rs', None, None, TopologySettings())
+
+
+@pytest.mark.parametrize('preference, reads_go_on', [(None, False), (SecondaryPreferred(), True)])
+def test_breakers_follow_a_real_topology(mock_mongo_client, preference, reads_go_on):
+    with patch(MONGO_CLIENT, return_value=mock_mongo_client):
+        db = Database(database_name="testdb", read_preference=preference)
+    listener = BreakerTopologyListener(db.connection)
+
+    listener.description_changed(Mock(previous_description=replica_set(), new_description=replica_set(False)))
+    assert db.connection.breaker.is_open
+    assert db.connection.read_breaker.is_open is not reads_go_on
+    listener.description_changed(Mock(previous_description=replica_set(False), new_description=replica_set()))
+    assert not db.connection.breaker.is_open and not db.connection.read_breaker.is_open
+
+
+def test_background_reconnect_with_backoff(mock_mongo_client):
+    manager = ConnectionManager(background_reconnect=True, backoff_base=0.01, backoff_max=0.02)
+    with patch(MONGO_CLIENT, side_effect=[ConnectionFailure("down")] * 3 + [mock_mongo_client]):
+        db = Database(database_name="testdb", connection=manager)
+        assert db.client is None
+        manager._reconnect_thread.join(timeout=2)
+    assert db.client is mock_mongo_client
+    assert not manager.breaker.is_open
+
+
+def test_operations_are_timed_and_failures_counted():
+    with patch(MONGO_CLIENT, side_effect=ConnectionFailure("down")):
+        db = Database(database_name="testdb", connection=ConnectionManager(breaker=CircuitBreaker(reset_timeout=60)))
+    timed = METRICS.db_duration.count('delete_document')
+    failed = METRICS.db_errors.value('delete_document', 'unavailable')
+    db.delete_document("tasks", "507f1f77bcf86cd799439011")
+    assert METRICS.db_duration.count('delete_document') == timed + 1
+    assert METRICS.db_errors.value('delete_document', 'unavailable') == failed + 1
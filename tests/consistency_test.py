@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from config import TestingConfig
+from factory import create_app
+from memorydb import MemoryDatabase
+
+
+class Config(TestingConfig):
+    MONGO_READ_PREFERENCE = 'secondaryPreferred'
+
+
+class CausalMemoryDatabase(MemoryDatabase):
+    """Memory engine that hands out a token per write, standing in for causal sessions."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = []
+        self.ended = 0
+        self.attached = False
+        self.token = None
+
+    def start_causal_session(self, token=None):
+        self.started.append(token)
+        self.attached = True
+
+    def create_document(self, collection_name, new_document):
+        self.token = {'operation_time': [len(self.started), 1]}
+        return super().create_document(collection_name, new_document)
+
+    def causal_token(self):
+        return self.token
+
+    def detach_causal_session(self):
+        if not self.attached:
+            return super().detach_causal_session()
+        self.attached = False
+
+        def end():
+            self.ended += 1
+        return end
+
+
+@pytest.fixture
+def app():
+    app = create_app(Config)
+    app.db = CausalMemoryDatabase()
+    return app
+
+
+def test_the_next_request_continues_after_the_last_write(app):
+    client = app.test_client()
+    client.get('/tasks').close()
+    client.post('/tasks/create', data={'title': 'Mine'}).close()
+    response = client.get('/tasks/all')
+    assert app.db.started == [None, None, {'operation_time': [2, 1]}]
+    assert app.db.ended == 2
+    # The streamed list reads through its session until the body is done.
+    assert b'Mine' in response.get_data()
+    response.close()
+    assert app.db.ended == 3
+
+
+def test_primary_reads_need_no_sessions():
+    app = create_app(TestingConfig)
+    app.db = CausalMemoryDatabase()
+    app.test_client().get('/tasks')
+    assert app.db.started == []
+
+
+@pytest.mark.skipif(not os.getenv('MONGO_REPLICA_SET_URI'), reason="needs MONGO_REPLICA_SET_URI")
+def test_secondary_reads_see_own_writes():
+    """Against a replica set, e.g. `mongod --replSet rs0` initiated with one member, or more."""
+    from mongodb import Database, make_read_preference
+    from utils.connection import ConnectionManager
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('MONGO_URI', os.environ['MONGO_REPLICA_SET_URI'])
+        database = Database('tasktracker_consistency_test', connection=ConnectionManager(),
+                            read_preference=make_read_preference('secondaryPreferred', 90))
+    try:
+        database.start_causal_session()
+        _id = database.create_document('tasks', {'title': 'Written'})
+        token = database.causal_token()
+        database.detach_causal_session()()
+
+        database.start_causal_session(token)
+        assert database.read_documents('tasks', str(_id))['title'] == 'Written'
+        database.detach_causal_session()()
+    finally:
+        database.client.drop_database('tasktracker_consistency_test')
+        database.close_connection()
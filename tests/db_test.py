@@ -1,10 +1,16 @@
 import os
+from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 
 import pytest
-from pymongo.errors import ConnectionFailure, PyMongoError
+from bson import ObjectId
+from bson.timestamp import Timestamp
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo.read_preferences import SecondaryPreferred
 
-from mongodb import Database
+from mongodb import CHANGES_OVERLAP_LIMIT, Database, make_read_preference
+from storage import TOMBSTONES
+from utils.cache import LocalCache
 
 MONGO_CLIENT = "mongodb.MongoClient"
 
@@ -21,6 +27,12 @@ def test_database(mock_mongo_client):
         return Database(database_name="testdb")
 
 
+@pytest.fixture
+def cached_database(mock_mongo_client):
+    with patch(MONGO_CLIENT, return_value=mock_mongo_client):
+        return Database(database_name="testdb", cache=LocalCache(), cached_collections=["tasks"])
+
+
 @pytest.fixture
 def mock_mongo_client():
     mock_collection = Mock()
@@ -78,6 +90,41 @@ def test_create_document(test_database, mock_mongo_client):
     assert result is not None
 
 
+def test_indexes_ensured_on_connect(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    assert [call.args[0] for call in collection.create_indexes.call_args_list] == \
+        [Database.INDEXES['users'], Database.INDEXES['tasks'], Database.INDEXES[TOMBSTONES]]
+
+
+def test_retired_indexes_are_dropped(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.drop_index.reset_mock()
+    collection.drop_index.side_effect = [None, OperationFailure("index not found", code=27)]
+    test_database.ensure_indexes()
+    assert [call.args[0] for call in collection.drop_index.call_args_list] == ['terms', 'title_text']
+    assert not test_database.index_errors
+
+
+def test_create_duplicate_user(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key error")
+    result = test_database.create_document("users", {"username": "alice"})
+    assert result is None
+    collection.find_one.assert_not_called()
+
+
+def test_index_report(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.index_information.return_value = {'_id_': {}, 'stale_index': {}}
+    collection.aggregate.return_value = [
+        {'name': '_id_', 'accesses': {'ops': 0, 'since': 'now'}},
+        {'name': 'stale_index', 'accesses': {'ops': 0, 'since': 'now'}},
+    ]
+    report = test_database.index_report()
+    assert report['users']['missing'] == ['username_unique']
+    assert report['users']['unused'] == [{'name': 'stale_index', 'since': 'now'}]
+
+
 def test_read_documents(test_database, mock_mongo_client):
     collection_name = "test_collection"
     documents = test_database.read_documents(collection_name)
@@ -91,6 +138,54 @@ def test_read_documents_with_id(test_database, mock_mongo_client):
     assert document is not None
 
 
+def test_read_page(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    documents, next_cursor = test_database.read_page("test_collection", page_size=1, projection={'name': 1})
+    assert documents == [{"_id": 1, "name": "doc1"}]
+    assert next_cursor == "1"
+    collection.find.assert_called_with({}, {'name': 1}, sort=[('_id', -1)], limit=2)
+
+
+def test_read_page_last_page(test_database, mock_mongo_client):
+    after = "507f1f77bcf86cd799439011"
+    documents, next_cursor = test_database.read_page("test_collection", after=after, page_size=5)
+    assert len(documents) == 2
+    assert next_cursor is None
+
+
+def test_read_page_invalid_cursor(test_database):
+    assert test_database.read_page("test_collection", after="invalid") == ([], None)
+
+
+def test_read_page_cached(cached_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    first = cached_database.read_page("tasks")
+    assert cached_database.read_page("tasks") == first
+    assert collection.find.call_count == 1
+    assert cached_database.cache.stats()['hits'] == 1
+
+
+def test_write_invalidates_cached_reads(cached_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    document_id = "507f1f77bcf86cd799439011"
+    cached_database.read_documents("tasks", document_id)
+    cached_database.read_page("tasks")
+    cached_database.update_document("tasks", document_id, {"title": "Updated"})
+    collection.find.return_value = iter([])
+    cached_database.read_documents("tasks", document_id)
+    assert cached_database.read_page("tasks") == ([], None)
+    assert collection.find_one.call_count == 2
+    assert collection.find.call_count == 2
+
+
+def test_uncached_collection_skips_cache(cached_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    cached_database.read_documents("users", "alice")
+    cached_database.read_documents("users", "alice")
+    assert collection.find_one.call_count == 2
+    assert len(cached_database.cache) == 0
+
+
 def test_update_document(test_database, mock_mongo_client):
     collection_name = "test_collection"
     document_id = "507f1f77bcf86cd799439011"
@@ -106,6 +201,65 @@ def test_delete_document(test_database, mock_mongo_client):
     assert result
 
 
+def test_bulk_apply(cached_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    document_id = "507f1f77bcf86cd799439011"
+    collection.find.return_value = [{'_id': ObjectId(document_id)}]
+    collection.bulk_write.return_value = Mock(bulk_api_result={'nInserted': 1, 'nMatched': 1})
+    cached_database.read_documents("tasks", document_id)
+    results = cached_database.bulk_apply("tasks", [
+        {'op': 'insert', 'document': {'title': 'New'}},
+        {'op': 'update', 'id': document_id, 'data': {'title': 'Renamed'}},
+        {'op': 'delete', 'id': "invalid"},
+    ], ordered=False)
+    assert [result['ok'] for result in results] == [True, True, False]
+    assert len(collection.bulk_write.call_args.args[0]) == 2
+    assert collection.bulk_write.call_args.kwargs == {'ordered': False}
+    cached_database.read_documents("tasks", document_id)
+    assert collection.find_one.call_count == 2
+
+
+def test_bulk_apply_fails_writes_that_match_nothing(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    mine, theirs = ObjectId(), ObjectId()
+    collection.find.return_value = [{'_id': mine}]
+    collection.bulk_write.return_value = Mock(bulk_api_result={'nMatched': 1, 'nRemoved': 0})
+    results = test_database.bulk_apply("tasks", [
+        {'op': 'update', 'id': str(mine), 'data': {'title': 'Mine'}},
+        {'op': 'update', 'id': str(theirs), 'data': {'title': 'Taken'}},
+        {'op': 'delete', 'id': str(mine)},
+    ], owner='alice-id')
+    assert collection.find.call_args.args[0] == {'_id': {'$in': [mine, theirs, mine]}, 'owner': 'alice-id'}
+    assert [result['ok'] for result in results] == [True, False, False]
+    assert results[1]['error'] == "Document not found."
+    assert results[2]['error'].startswith("Not executed")
+    assert len(collection.bulk_write.call_args.args[0]) == 1
+
+
+def test_bulk_apply_fails_updates_of_documents_deleted_meanwhile(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    kept, deleted = ObjectId(), ObjectId()
+    collection.find.side_effect = [[{'_id': kept}, {'_id': deleted}], [{'_id': kept}]]
+    collection.bulk_write.return_value = Mock(bulk_api_result={'nMatched': 1})
+    results = test_database.bulk_apply("tasks", [
+        {'op': 'update', 'id': str(kept), 'data': {'title': 'Kept'}},
+        {'op': 'update', 'id': str(deleted), 'data': {'title': 'Gone'}},
+    ])
+    assert [result['ok'] for result in results] == [True, False]
+
+
+def test_bulk_apply_write_error(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.bulk_write.side_effect = BulkWriteError({'writeErrors': [{'index': 0, 'errmsg': 'E11000'}]})
+    results = test_database.bulk_apply("users", [
+        {'op': 'insert', 'document': {'username': 'alice'}},
+        {'op': 'insert', 'document': {'username': 'bob'}},
+    ])
+    assert results[0]['error'] == 'E11000'
+    assert results[1]['error'].startswith("Not executed")
+    assert not any(result['ok'] for result in results)
+
+
 def test_create_document_invalid_input(test_database):
     invalid_document = "not a dictionary"
     collection_name = "test_collection"
@@ -159,3 +313,242 @@ def test_connection_failure_handling(mock_env_vars):
 
 if __name__ == '__main__':
     pytest.main()
+
+
+def test_search_documents(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.find.return_value = iter([{"_id": 1, "title": "Quarterly report"}])
+
+    assert test_database.search_documents("tasks", 'rep "quarterly report"', limit=5, max_time_ms=100) == \
+        [{"_id": 1, "title": "Quarterly report"}]
+    query, projection = collection.find.call_args.args
+    assert query == {'$and': [{'_terms': {'$regex': '^rep'}}], '$text': {'$search': '"quarterly report"'}}
+    assert projection == {'score': {'$meta': 'textScore'}}
+    assert collection.find.call_args.kwargs == {
+        'sort': [('score', {'$meta': 'textScore'}), ('_id', -1)], 'limit': 5, 'max_time_ms': 100
+    }
+
+
+def test_title_writes_keep_search_terms(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    test_database.create_document("tasks", {"title": "Buy Milk"})
+    assert collection.insert_one.call_args.args[0]['_terms'] == ['buy', 'milk']
+    test_database.update_document("tasks", "507f1f77bcf86cd799439011", {"title": "Sell milk"})
+    update = collection.update_one.call_args.args[1]['$set']
+    assert {key: update[key] for key in ('title', '_terms')} == {"title": "Sell milk", "_terms": ['milk', 'sell']}
+
+
+def test_backfill_search_terms(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.find.return_value = iter([{"_id": i, "title": f"Old task {i}"} for i in range(3)])
+    collection.bulk_write.return_value = Mock(modified_count=2)
+
+    assert test_database.backfill_search_terms(batch_size=2) == 4
+    first_batch = collection.bulk_write.call_args_list[0].args[0]
+    assert [request._doc['$set']['_terms'] for request in first_batch] == [['0', 'old', 'task'], ['1', 'old', 'task']]
+
+
+def test_watch_changes_on_standalone_server(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.watch.side_effect = OperationFailure("not a replica set", code=40573)
+    assert test_database.watch_changes("tasks") is None
+
+    collection.watch.side_effect = OperationFailure("unauthorized", code=13)
+    with pytest.raises(OperationFailure):
+        test_database.watch_changes("tasks")
+
+
+def test_writes_are_stamped_and_deletes_leave_tombstones(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    test_database.create_document("tasks", {"title": "Buy milk"})
+    assert isinstance(collection.insert_one.call_args.args[0]['_updated_at'], datetime)
+    test_database.delete_document("tasks", "507f1f77bcf86cd799439011")
+    [tombstone] = collection.insert_many.call_args.args[0]
+    assert tombstone['collection'] == 'tasks' and tombstone['document_id'] == ObjectId("507f1f77bcf86cd799439011")
+
+
+def test_read_changes_queries_since_the_watermark(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    since = datetime(2024, 1, 1, 12)
+    created, updated, gone = ObjectId(), ObjectId(), ObjectId()
+    collection.find.side_effect = [
+        [{"_id": created, "_rev": 0, "_updated_at": since + timedelta(seconds=1)},
+         {"_id": updated, "_rev": 2, "_updated_at": since + timedelta(seconds=3)}],
+        [{"document_id": gone, "collection": "tasks", "deleted_at": since + timedelta(seconds=2)}],
+    ]
+    changes, watermark = test_database.read_changes("tasks", since, limit=5)
+    assert [(event, _id) for event, _id, _ in changes] == \
+        [('created', created), ('deleted', gone), ('updated', updated)]
+    assert watermark == since + timedelta(seconds=3)
+    written, tombstones = collection.find.call_args_list
+    assert written.args[0] == {'_updated_at': {'$gt': since - timedelta(seconds=2)}}
+    assert written.kwargs['limit'] == tombstones.kwargs['limit'] == 5 + CHANGES_OVERLAP_LIMIT + 1
+
+
+def test_read_changes_does_not_count_the_overlap(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    since = datetime(2024, 1, 1, 12)
+    # Busy writers: the overlap read again holds more changes than the limit.
+    overlap = [{"_id": i, "_rev": 1, "_updated_at": since - timedelta(milliseconds=i)} for i in range(50)]
+    fresh = {"_id": 50, "_rev": 1, "_updated_at": since + timedelta(seconds=1)}
+    collection.find.side_effect = [overlap[::-1] + [fresh], []]
+    changes, watermark = test_database.read_changes("tasks", since, limit=2)
+    assert len(changes) == 51
+    assert watermark == fresh['_updated_at']
+
+
+def test_read_changes_gives_up_beyond_the_limit(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    since = datetime(2024, 1, 1, 12)
+    written = [{"_id": i, "_rev": 1, "_updated_at": since + timedelta(seconds=1)} for i in range(3)]
+    collection.find.side_effect = [written, []]
+    changes, watermark = test_database.read_changes("tasks", since, limit=2)
+    assert changes is None and watermark > since
+
+
+def test_iter_documents_uses_a_batched_cursor(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    cursor = collection.find.return_value = Mock()
+    cursor.__enter__ = Mock(return_value=iter([{"_id": 2}, {"_id": 1}]))
+    cursor.__exit__ = Mock(return_value=False)
+
+    documents = test_database.iter_documents("tasks", projection={"title": 1}, batch_size=100)
+    collection.find.assert_not_called()
+    assert list(documents) == [{"_id": 2}, {"_id": 1}]
+    collection.find.assert_called_once_with({}, {"title": 1}, sort=[('_id', -1)], batch_size=100)
+
+
+def test_strict_iter_documents_raises_read_errors(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    cursor = collection.find.return_value = Mock()
+    cursor.__enter__ = Mock(side_effect=ConnectionFailure("connection reset"))
+    cursor.__exit__ = Mock(return_value=False)
+
+    assert list(test_database.iter_documents("tasks")) == []
+    with pytest.raises(ConnectionFailure):
+        list(test_database.iter_documents("tasks", strict=True))
+
+
+def test_import_documents_skips_duplicates(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.insert_many.side_effect = BulkWriteError({
+        'nInserted': 1, 'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'E11000'}]
+    })
+    documents = [{"_id": 1, "title": "One"}, {"_id": 2, "title": "Two"}]
+    assert test_database.import_documents("tasks", documents) == (1, 1)
+    assert collection.insert_many.call_args.kwargs == {'ordered': False}
+    assert documents[0]['_rev'] == 0 and documents[0]['_terms'] == ['one']
+
+
+def test_import_documents_failure(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.insert_many.side_effect = BulkWriteError({'nInserted': 0, 'writeErrors': [{'index': 0, 'code': 121}]})
+    assert test_database.import_documents("tasks", [{"_id": 1}]) is None
+
+
+def test_owner_scoped_queries(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.find.return_value = []
+    test_database.read_page("tasks", after="507f1f77bcf86cd799439011", owner="alice")
+    assert collection.find.call_args.args[0] == {'owner': 'alice', '_id': {'$lt': ObjectId("507f1f77bcf86cd799439011")}}
+    test_database.read_page("users", owner="alice")
+    assert collection.find.call_args.args[0] == {}
+
+    collection.find_one.return_value = {'_id': ObjectId("507f1f77bcf86cd799439011"), 'owner': 'bob'}
+    assert test_database.read_documents("tasks", "507f1f77bcf86cd799439011", owner="alice") is None
+    test_database.delete_document("tasks", "507f1f77bcf86cd799439011", owner="alice")
+    assert collection.delete_one.call_args.args[0]['owner'] == 'alice'
+    test_database.update_document("tasks", "507f1f77bcf86cd799439011", {'title': 'x', 'owner': 'alice'}, owner="alice")
+    query, update = collection.update_one.call_args.args
+    assert query['owner'] == 'alice' and 'owner' not in update['$set']
+
+
+def test_backfill_owners_in_batches(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.find.return_value = iter([{'_id': i} for i in range(5)])
+    collection.update_many.return_value.modified_count = 2
+    assert test_database.backfill_owners("alice", batch_size=2) == 6
+    assert collection.update_many.call_count == 3
+    assert collection.update_many.call_args.args == ({'_id': {'$in': [4]}, 'owner': {'$exists': False}},
+                                                     {'$set': {'owner': 'alice'}})
+
+
+def test_transfer_owner_moves_a_guests_tasks(cached_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    _id = ObjectId()
+    cached_database.cache.set(cached_database.document_cache_key("tasks", _id), {'_id': _id, 'owner': "guest:1"})
+    collection.find.return_value = [{'_id': _id}]
+    collection.update_many.return_value.modified_count = 1
+    assert cached_database.transfer_owner("guest:1", "alice") == 1
+    query, update = collection.update_many.call_args.args
+    assert query == {'_id': {'$in': [_id]}, 'owner': "guest:1"} and update['$set']['owner'] == "alice"
+    assert cached_database.cache.get(cached_database.document_cache_key("tasks", _id)) is None
+
+
+def test_expire_guest_documents_leaves_tombstones(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    ids = [ObjectId(), ObjectId()]
+    collection.find.return_value = iter([{'_id': _id} for _id in ids])
+    collection.delete_many.return_value.deleted_count = 2
+    assert test_database.expire_guest_documents(3600) == 2
+    query = collection.delete_many.call_args.args[0]
+    assert query['_id'] == {'$in': ids} and query['owner'] == {'$regex': '^guest:'}
+    assert [tombstone['document_id'] for tombstone in collection.insert_many.call_args.args[0]] == ids
+
+
+def test_make_read_preference():
+    assert make_read_preference('primary') is None
+    assert make_read_preference('secondaryPreferred', 90) == SecondaryPreferred(max_staleness=90)
+    with pytest.raises(ValueError):
+        make_read_preference('secondaries')
+
+
+def test_reads_follow_the_read_preference_and_writes_the_primary(mock_mongo_client):
+    preference = SecondaryPreferred(max_staleness=90)
+    with patch(MONGO_CLIENT, return_value=mock_mongo_client):
+        database = Database(database_name="testdb", read_preference=preference)
+    secondary = Mock()
+    mock_mongo_client.get_database.return_value.__getitem__ = Mock(return_value=secondary)
+    primary = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    secondary.find.return_value = []
+
+    database.read_page("tasks")
+    database.read_documents("tasks", "507f1f77bcf86cd799439011")
+    mock_mongo_client.get_database.assert_called_with("testdb", read_preference=preference)
+    assert secondary.find.called and secondary.find_one.called
+    database.update_document("tasks", "507f1f77bcf86cd799439011", {"title": "x"})
+    assert primary.update_one.called and not secondary.update_one.called
+
+
+def test_causal_session_carries_a_token_between_requests(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    session = mock_mongo_client.start_session.return_value
+    session.client = mock_mongo_client
+    session.operation_time = Timestamp(1700000000, 3)
+    session.cluster_time = {'clusterTime': Timestamp(1700000000, 4)}
+
+    test_database.start_causal_session()
+    test_database.delete_document("tasks", "507f1f77bcf86cd799439011")
+    assert collection.delete_one.call_args.kwargs == {'session': session}
+    token = test_database.causal_token()
+    assert token['operation_time'] == [1700000000, 3]
+    assert test_database.detach_causal_session() == session.end_session
+    assert test_database.causal() == {}
+
+    test_database.start_causal_session(token)
+    session.advance_operation_time.assert_called_with(Timestamp(1700000000, 3))
+    session.advance_cluster_time.assert_called_with({'clusterTime': Timestamp(1700000000, 4)})
+    test_database.detach_causal_session()
+
+
+def test_failed_unique_index_keeps_the_engine_unready(test_database, mock_mongo_client):
+    collection = mock_mongo_client.__getitem__.return_value.__getitem__.return_value
+    collection.create_indexes.side_effect = OperationFailure("E11000 duplicate key error")
+    test_database.ensure_indexes()
+    assert set(test_database.index_errors) == {'users', 'tasks', TOMBSTONES}
+    assert test_database.unenforced_unique_indexes() == ['users']
+    assert not test_database.ready()
+
+    collection.create_indexes.side_effect = None
+    test_database.ensure_indexes()
+    assert test_database.ready()
@@ -0,0 +1,69 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from flask import Flask
+from pymongo.errors import ConnectionFailure
+
+from mongodb import Database
+from utils.connection import CircuitBreaker, ConnectionManager
+from utils.etag import conditional
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.db = Mock()
+    app.db.collection_version.return_value = "v1"
+    app.render = Mock(return_value="<div>fragment</div>")
+
+    @app.route('/<string:collection>')
+    @conditional()
+    def fragment(collection):
+        return app.render()
+
+    return app
+
+
+def test_etag_emitted(app):
+    response = app.test_client().get('/tasks')
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_not_modified_skips_view(app):
+    client = app.test_client()
+    etag = client.get('/tasks').headers['ETag']
+    response = client.get('/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert app.render.call_count == 1
+
+
+def test_write_changes_etag(app):
+    client = app.test_client()
+    etag = client.get('/tasks').headers['ETag']
+    app.db.collection_version.return_value = "v2"
+    response = client.get('/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    app.db.collection_version.assert_called_with("tasks")
+
+
+def test_no_etag_while_the_database_is_down():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    with patch("mongodb.MongoClient", side_effect=ConnectionFailure("down")):
+        app.db = Database(database_name="testdb", connection=ConnectionManager(breaker=CircuitBreaker(60)))
+
+    @app.route('/<string:collection>')
+    @conditional()
+    def fragment(collection):
+        documents, _ = app.db.read_page(collection)
+        return f"{len(documents)} tasks"
+
+    response = app.test_client().get('/tasks')
+    assert response.data == b"0 tasks"
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-store'
@@ -0,0 +1,117 @@
+import json
+import os
+import runpy
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from mongodb import Database
+from utils.connection import ConnectionManager
+from utils.passwords import PasswordHasher
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def in_child(check):
+    """Run `check` in a forked child and return whether it passed."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if check() else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+
+def test_database_opens_its_own_client_after_fork():
+    parent_client, child_client = MagicMock(), MagicMock()
+    with patch("mongodb.MongoClient", side_effect=[parent_client, child_client]):
+        db = Database(database_name="testdb")
+        assert db.client is parent_client
+        # Without background connects the child connects at its first operation.
+        assert in_child(lambda: db.client is None and db.read_page("tasks") is not None and db.client is child_client)
+    assert db.client is parent_client
+    parent_client.close.assert_not_called()
+
+
+def test_database_reconnects_in_the_background_after_fork():
+    parent_client = MagicMock()
+    # Engines of earlier tests reconnect in the child as well, so every later client is a new one.
+    clients = iter([parent_client])
+    with patch("mongodb.MongoClient", side_effect=lambda *args, **kwargs: next(clients, None) or MagicMock()):
+        db = Database(database_name="testdb", connection=ConnectionManager(background_reconnect=True))
+
+        def reconnected():
+            db.connection._reconnect_thread.join(timeout=2)
+            return db.client is not None and db.client is not parent_client
+        assert in_child(reconnected)
+    assert db.client is parent_client
+
+
+def test_password_hasher_works_after_fork():
+    hasher = PasswordHasher(rounds=4)
+    hashed = hasher.hash("secret")
+    assert in_child(lambda: hasher.verify("secret", hashed))
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def gunicorn_settings(**env):
+    with patch.dict(os.environ, env):
+        for name in ('WEB_CONCURRENCY', 'CACHE_BACKEND', 'STORAGE'):
+            if name not in env:
+                os.environ.pop(name, None)
+        return runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+
+
+def test_gunicorn_runs_one_worker_without_a_shared_cache():
+    assert gunicorn_settings()['workers'] == 1
+    assert gunicorn_settings(CACHE_BACKEND='redis', WEB_CONCURRENCY='3')['workers'] == 3
+    for backend in ('memory', 'none'):
+        with pytest.raises(RuntimeError, match="CACHE_BACKEND=redis"):
+            gunicorn_settings(CACHE_BACKEND=backend, WEB_CONCURRENCY='3')
+
+
+def test_gunicorn_serves_from_several_workers():
+    pytest.importorskip('gunicorn')
+    # Several workers need the shared cache; nothing reads it on the health endpoints.
+    pytest.importorskip('redis')
+    port = free_port()
+    env = {
+        **os.environ, 'STORAGE': 'mongodb', 'MONGO_URI': 'mongodb://127.0.0.1:1/testdb', 'WEB_CONCURRENCY': '2',
+        'CACHE_BACKEND': 'redis', 'CACHE_URL': 'redis://127.0.0.1:1/0'
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), '--bind', f'127.0.0.1:{port}'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        pids = set()
+        deadline = time.monotonic() + 15
+        while len(pids) < 2 and time.monotonic() < deadline:
+            try:
+                # New connections each time, spread over the workers by the kernel.
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health/live', timeout=1) as response:
+                    assert response.status == 200
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health/ready', timeout=1):
+                    pass
+            except urllib.error.HTTPError as e:
+                # Not ready: there is no database, but the worker answers with its pid.
+                pids.add(json.load(e)['pid'])
+            except OSError:
+                time.sleep(0.1)
+        assert len(pids) == 2
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
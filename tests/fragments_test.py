@@ -0,0 +1,63 @@
+import pytest
+from flask import Flask
+
+from blueprints.api_blueprint import api
+from blueprints.component_blueprint import component
+from config import TestingConfig
+from memorydb import MemoryDatabase
+from utils.fragments import compile_templates, init_template_caches
+
+
+@pytest.fixture
+def app():
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    init_template_caches(app)
+    app.db = MemoryDatabase()
+    for blueprint in (component, api):
+        app.register_blueprint(blueprint)
+    return app
+
+
+def test_unchanged_cards_are_reused(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'alice-id'
+    _id = app.db.create_document('tasks', {'title': 'Cached card', 'owner': 'alice-id'})
+    client.get('/tasks')
+    assert app.fragments.stats()['misses'] == 1
+
+    client.get('/tasks')
+    assert app.fragments.stats()['hits'] == 1
+
+    client.post(f'/tasks/{_id}/update', data={'title': 'Renamed card'})
+    response = client.get('/tasks')
+    assert b'Renamed card' in response.data
+    assert b'Cached card' not in response.data
+    assert app.fragments.stats()['misses'] == 2
+
+
+def test_cards_without_revision_are_not_cached(app):
+    with app.test_request_context():
+        html = app.jinja_env.globals['fragment']('tasks/card.html', None, doc={'_id': 'x', 'title': 'Loose'})
+    assert 'Loose' in html
+    assert app.fragments.stats() == {'hits': 0, 'misses': 0, 'uncached': 1, 'hit_rate': 0.0, 'entries': 0}
+
+
+def test_compiled_templates_land_in_the_bytecode_cache(tmp_path):
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    app.config.update(TEMPLATE_BYTECODE_CACHE=True, TEMPLATE_BYTECODE_DIR=str(tmp_path))
+    init_template_caches(app)
+    assert compile_templates(app) > 0
+    assert any(tmp_path.iterdir())
+
+
+def test_bytecode_cache_defaults_to_a_private_directory_in_the_instance_folder(tmp_path):
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]), instance_path=str(tmp_path / "instance"))
+    app.config.from_object(TestingConfig)
+    app.config['TEMPLATE_BYTECODE_CACHE'] = True
+    init_template_caches(app)
+    directory = tmp_path / "instance" / "templates-cache"
+    assert app.jinja_env.bytecode_cache.directory == str(directory)
+    assert directory.stat().st_mode & 0o077 == 0
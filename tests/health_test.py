@@ -0,0 +1,34 @@
+from unittest.mock import MagicMock, patch
+
+from config import TestingConfig
+from factory import create_app
+from mongodb import Database
+from utils.connection import ConnectionManager
+
+
+def test_create_app_records_startup_and_reports_ready():
+    app = create_app(TestingConfig)
+    client = app.test_client()
+    assert client.get('/health/live').json == {'status': 'ok'}
+
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+    assert {'import_seconds', 'database_seconds', 'create_app_seconds', 'first_response_seconds'} <= \
+        set(response.json['startup'])
+    assert 'startup_first_response_seconds' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_background_connect_does_not_block_startup():
+    app = create_app(TestingConfig)
+    connected = MagicMock()
+    with patch("mongodb.MongoClient", return_value=connected) as mongo_client:
+        connection = ConnectionManager(connect_in_background=True)
+        app.db = Database(database_name="testdb", connection=connection)
+        assert not app.db.ready()
+        assert app.test_client().get('/health/ready').status_code == 503
+
+        connection._reconnect_thread.join(timeout=2)
+    assert mongo_client.called
+    assert app.db.client is connected
+    assert app.test_client().get('/health/ready').json['status'] == 'ready'
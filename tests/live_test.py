@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from flask import Flask
+
+from config import TestingConfig
+from memorydb import MemoryDatabase
+from utils.fragments import init_template_caches
+from utils.live import ChangeFeed, FeedFull, change_event, init_live_updates, sse_message
+
+
+@pytest.fixture
+def app():
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    app.config.update(LIVE_POLL_INTERVAL=0.01, LIVE_HEARTBEAT=0.05, LIVE_MAX_SUBSCRIBERS=2, LIVE_QUEUE_SIZE=2)
+    init_template_caches(app)
+    app.db = MemoryDatabase()
+    init_live_updates(app)
+    return app
+
+
+def next_message(subscription):
+    return subscription.queue.get(timeout=2)
+
+
+def test_polling_feed_streams_creates_updates_and_deletes(app):
+    _id = app.db.create_document('tasks', {'title': 'Existing'})
+    feed = app.feeds['tasks']
+    subscription = feed.subscribe()
+    # Give the first poll, which only records the current revisions, time to run.
+    time.sleep(0.1)
+
+    created = app.db.create_document('tasks', {'title': 'Fresh task'})
+    message = next_message(subscription)
+    assert message.startswith('event: created\nid: ')
+    assert 'Fresh task' in message
+
+    app.db.update_document('tasks', str(_id), {'title': 'Renamed'})
+    assert 'Renamed' in next_message(subscription)
+
+    app.db.delete_document('tasks', str(created))
+    assert next_message(subscription).endswith(f'data: {created}\n\n')
+    feed.unsubscribe(subscription)
+
+
+def test_slow_subscribers_are_dropped(app):
+    feed = app.feeds['tasks']
+    feed.poll_interval = 60
+    slow = feed.subscribe()
+    for i in range(3):
+        feed.publish('deleted', i)
+    assert slow.dropped
+    assert feed.stats() == {'subscribers': 0, 'published': 3, 'dropped': 1}
+    assert list(slow.messages(heartbeat=0.01))[-1] is None
+
+
+def test_subscribers_are_bounded(app):
+    feed = ChangeFeed(app, max_subscribers=1, poll_interval=60)
+    feed.subscribe()
+    with pytest.raises(FeedFull):
+        feed.subscribe()
+
+
+def test_events_endpoint(app):
+    client = app.test_client()
+    response = client.get('/tasks/events', headers={'Last-Event-ID': 'from-another-worker'})
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.response
+    assert next(chunks) == b'retry: 3000\n\n'
+    assert next(chunks) == b'event: reset\ndata: \n\n'
+    assert next(chunks) == b': keep-alive\n\n'
+    response.close()
+    assert app.feeds['tasks'].stats()['subscribers'] == 0
+    assert client.get('/projects/events').status_code == 404
+
+
+def test_events_endpoint_refuses_past_the_limit(app):
+    for _ in range(2):
+        app.feeds['tasks'].subscribe()
+    response = app.test_client().get('/tasks/events')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+
+
+def test_change_event():
+    document = {'_id': 1, 'title': 'Changed'}
+    assert change_event({'operationType': 'update', 'documentKey': {'_id': 1}, 'fullDocument': document}) == \
+        ('updated', 1, document)
+    assert change_event({'operationType': 'update', 'documentKey': {'_id': 1}, 'fullDocument': None}) is None
+    assert change_event({'operationType': 'delete', 'documentKey': {'_id': 1}}) == ('deleted', 1, None)
+    assert change_event({'operationType': 'drop'}) is None
+
+
+def test_sse_message_splits_lines():
+    assert sse_message('created', '<div>\n</div>', 'e-1') == 'event: created\nid: e-1\ndata: <div>\ndata: </div>\n\n'
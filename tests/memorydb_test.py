@@ -0,0 +1,183 @@
+import pytest
+
+from memorydb import MemoryDatabase
+
+
+@pytest.fixture
+def test_database():
+    return MemoryDatabase()
+
+
+@pytest.fixture
+def task_ids(test_database):
+    return [test_database.create_document("tasks", {"title": f"Task {i}", "done": False}) for i in range(5)]
+
+
+def test_create_and_read_document(test_database):
+    _id = test_database.create_document("tasks", {"title": "Test"})
+    document = {"_id": _id, "_rev": 0, "_terms": ["test"], "title": "Test"}
+    assert test_database.read_documents("tasks", str(_id)) == document
+    assert test_database.read_documents("tasks") == [document]
+
+
+def test_create_document_invalid_input(test_database):
+    assert test_database.create_document("tasks", "not a dictionary") is None
+
+
+def test_read_documents_invalid_id(test_database):
+    assert test_database.read_documents("tasks", "invalid") is None
+
+
+def test_unique_username(test_database):
+    _id = test_database.create_document("users", {"username": "alice"})
+    assert test_database.create_document("users", {"username": "alice"}) is None
+    assert test_database.read_documents("users", "alice")["_id"] == _id
+    assert test_database.read_documents("users", "bob") is None
+
+
+def test_read_page(test_database, task_ids):
+    documents, next_cursor = test_database.read_page("tasks", page_size=2, projection={'title': 1})
+    assert documents == [{"_id": task_ids[4], "title": "Task 4"}, {"_id": task_ids[3], "title": "Task 3"}]
+    assert next_cursor == str(task_ids[3])
+
+    documents, next_cursor = test_database.read_page("tasks", after=next_cursor, page_size=2)
+    assert [document["_id"] for document in documents] == [task_ids[2], task_ids[1]]
+
+    documents, next_cursor = test_database.read_page("tasks", after=next_cursor, page_size=2)
+    assert [document["_id"] for document in documents] == [task_ids[0]]
+    assert next_cursor is None
+
+
+def test_read_page_invalid_cursor(test_database, task_ids):
+    assert test_database.read_page("tasks", after="invalid") == ([], None)
+
+
+def test_update_document(test_database, task_ids):
+    assert test_database.update_document("tasks", str(task_ids[0]), {"title": "Updated"})
+    assert test_database.read_documents("tasks", str(task_ids[0]))["title"] == "Updated"
+    assert test_database.read_documents("tasks", str(task_ids[0]))["_rev"] == 1
+    assert not test_database.update_document("tasks", str(task_ids[0]), {"title": "Updated"})
+    assert not test_database.update_document("tasks", "507f1f77bcf86cd799439011", {"title": "Updated"})
+
+
+def test_update_document_keeps_usernames_unique(test_database):
+    test_database.create_document("users", {"username": "alice"})
+    bob = test_database.create_document("users", {"username": "bob"})
+    assert not test_database.update_document("users", str(bob), {"username": "alice"})
+    assert test_database.update_document("users", str(bob), {"username": "carol"})
+    assert test_database.read_documents("users", "carol")["_id"] == bob
+    assert test_database.read_documents("users", "bob") is None
+
+
+def test_delete_document(test_database, task_ids):
+    assert test_database.delete_document("tasks", str(task_ids[2]))
+    assert not test_database.delete_document("tasks", str(task_ids[2]))
+    documents, _ = test_database.read_page("tasks")
+    assert task_ids[2] not in [document["_id"] for document in documents]
+
+
+def test_writes_bump_collection_version(test_database):
+    version = test_database.collection_version("tasks")
+    test_database.create_document("tasks", {"title": "Test"})
+    assert test_database.collection_version("tasks") != version
+
+
+def test_read_changes_since_the_watermark(test_database, task_ids):
+    changes, watermark = test_database.read_changes("tasks")
+    assert changes == []
+    test_database.update_document("tasks", str(task_ids[0]), {"title": "Renamed"})
+    test_database.update_document("tasks", str(task_ids[0]), {"done": True})
+    test_database.delete_document("tasks", str(task_ids[1]))
+    created = test_database.create_document("tasks", {"title": "New"})
+    changes, watermark = test_database.read_changes("tasks", watermark)
+    assert [(event, _id) for event, _id, _ in changes] == \
+        [('updated', task_ids[0]), ('deleted', task_ids[1]), ('created', created)]
+    assert changes[0][2]['done'] and changes[0][2]['_rev'] == 2
+    assert test_database.read_changes("tasks", watermark) == ([], watermark)
+
+
+def test_read_changes_gives_up_beyond_the_limit(test_database, task_ids):
+    _, watermark = test_database.read_changes("tasks")
+    for task_id in task_ids:
+        test_database.update_document("tasks", str(task_id), {"done": True})
+    changes, _ = test_database.read_changes("tasks", watermark, limit=3)
+    assert changes is None
+
+
+def test_bulk_apply(test_database, task_ids):
+    results = test_database.bulk_apply("tasks", [
+        {'op': 'insert', 'document': {'title': 'New'}},
+        {'op': 'update', 'id': str(task_ids[0]), 'data': {'title': 'Renamed'}},
+        {'op': 'delete', 'id': str(task_ids[1])},
+    ])
+    assert [result['ok'] for result in results] == [True, True, True]
+    assert test_database.read_documents("tasks", str(results[0]['_id']))['title'] == 'New'
+    assert test_database.read_documents("tasks", str(task_ids[0]))['title'] == 'Renamed'
+    assert test_database.read_documents("tasks", str(task_ids[1])) is None
+
+
+def test_bulk_apply_ordered_stops_at_first_failure(test_database, task_ids):
+    results = test_database.bulk_apply("tasks", [
+        {'op': 'delete', 'id': str(task_ids[0])},
+        {'op': 'delete', 'id': "507f1f77bcf86cd799439011"},
+        {'op': 'delete', 'id': str(task_ids[1])},
+    ])
+    assert [result['ok'] for result in results] == [True, False, False]
+    assert results[2]['error'].startswith("Not executed")
+    assert test_database.read_documents("tasks", str(task_ids[1]))
+
+
+def test_bulk_apply_unordered_continues(test_database, task_ids):
+    results = test_database.bulk_apply("tasks", [
+        {'op': 'delete', 'id': "invalid"},
+        {'op': 'bogus'},
+        {'op': 'delete', 'id': str(task_ids[1])},
+    ], ordered=False)
+    assert [result['ok'] for result in results] == [False, False, True]
+    assert test_database.read_documents("tasks", str(task_ids[1])) is None
+
+
+def test_search_documents(test_database):
+    older = test_database.create_document("tasks", {"title": "Write the quarterly report"})
+    newer = test_database.create_document("tasks", {"title": "Report bug in reporting tool"})
+    test_database.create_document("tasks", {"title": "Buy milk"})
+
+    assert [doc["_id"] for doc in test_database.search_documents("tasks", "rep")] == [newer, older]
+    assert [doc["_id"] for doc in test_database.search_documents("tasks", "QUARTER rep")] == [older]
+    assert [doc["_id"] for doc in test_database.search_documents("tasks", '"bug in"')] == [newer]
+    assert test_database.search_documents("tasks", '"in bug"') == []
+    assert len(test_database.search_documents("tasks", "rep", limit=1)) == 1
+    assert test_database.search_documents("tasks", "  ") == []
+
+
+def test_search_follows_updates_and_deletes(test_database, task_ids):
+    test_database.update_document("tasks", str(task_ids[0]), {"title": "Renamed entirely"})
+    assert [doc["_id"] for doc in test_database.search_documents("tasks", "renamed")] == [task_ids[0]]
+    test_database.delete_document("tasks", str(task_ids[0]))
+    assert test_database.search_documents("tasks", "renamed") == []
+
+
+def test_iter_documents_reads_in_batches(test_database, task_ids):
+    documents = list(test_database.iter_documents("tasks", projection={'title': 1}, batch_size=2))
+    assert [document["_id"] for document in documents] == task_ids[::-1]
+    assert documents[0] == {"_id": task_ids[4], "title": "Task 4"}
+
+
+def test_owner_scoped_queries(test_database):
+    mine = [test_database.create_document("tasks", {"title": f"Mine {i}", "owner": "me"}) for i in range(3)]
+    theirs = test_database.create_document("tasks", {"title": "Theirs", "owner": "them"})
+    documents, next_cursor = test_database.read_page("tasks", page_size=2, owner="me")
+    assert [doc["_id"] for doc in documents] == mine[:0:-1]
+    assert test_database.read_page("tasks", after=next_cursor, owner="me")[0][0]["_id"] == mine[0]
+    assert [doc["_id"] for doc in test_database.iter_documents("tasks", owner="them")] == [theirs]
+    assert test_database.search_documents("tasks", "theirs", owner="me") == []
+    assert test_database.read_documents("tasks", str(theirs), owner="me") is None
+    assert not test_database.update_document("tasks", str(theirs), {"title": "Taken"}, owner="me")
+    assert not test_database.delete_document("tasks", str(theirs), owner="me")
+    assert len(test_database.read_documents("tasks")) == 4
+
+
+def test_backfill_owners_moves_documents_to_the_owner(test_database, task_ids):
+    assert test_database.backfill_owners("me") == 5
+    assert [doc["_id"] for doc in test_database.iter_documents("tasks", owner="me")] == task_ids[::-1]
+    assert test_database.read_page("tasks", owner=None) == ([], None)
@@ -0,0 +1,54 @@
+import pytest
+from flask import Flask
+
+from blueprints.api_blueprint import api
+from blueprints.component_blueprint import component
+from config import TestingConfig
+from memorydb import MemoryDatabase
+from utils.fragments import init_template_caches
+from utils.metrics import METRICS, Counter, Histogram, init_metrics
+
+
+@pytest.fixture
+def client():
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    init_template_caches(app)
+    app.db = MemoryDatabase()
+    for blueprint in (component, api):
+        app.register_blueprint(blueprint)
+    init_metrics(app)
+    return app.test_client()
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.1, '/a')
+    histogram.observe(3, '/a')
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 3.15',
+        'latency_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_counter_escapes_labels():
+    counter = Counter('errors_total', 'Errors.', ('reason',))
+    counter.inc('say "hi"')
+    assert counter.render()[-1] == 'errors_total{reason="say \\"hi\\""} 1'
+
+
+def test_requests_and_templates_are_timed(client):
+    before = METRICS.request_duration.count('POST', '/<string:collection>/create', '200')
+    client.post('/tasks/create', data={'title': 'Measured'})
+    assert METRICS.request_duration.count('POST', '/<string:collection>/create', '200') == before + 1
+    assert METRICS.render_duration.count('tasks/created.html') > 0
+    assert METRICS.response_size.count('/<string:collection>/create') > 0
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    assert b'http_request_duration_seconds_bucket{method="POST",route="/<string:collection>/create"' in response.data
+    assert b'cache_hits' in response.data
@@ -0,0 +1,189 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from flask import Flask
+from pymongo.errors import DuplicateKeyError
+
+from blueprints.api_blueprint import api
+from blueprints.async_views import register_async_views
+from blueprints.component_blueprint import component
+from blueprints.user_blueprint import user
+from config import TestingConfig
+from memorydb import MemoryDatabase
+from mongodb_async import AsyncDatabase
+from utils.assets import init_assets
+from utils.fragments import init_template_caches
+from utils.passwords import PasswordHasher
+
+
+@pytest.fixture
+def mock_collection():
+    collection = MagicMock()
+    collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id="new_id"))
+    collection.find_one = AsyncMock(return_value={"_id": 1, "title": "doc1"})
+    collection.update_one = AsyncMock(return_value=MagicMock(matched_count=1, modified_count=1))
+    collection.delete_one = AsyncMock(return_value=MagicMock(deleted_count=1))
+    collection.create_indexes = AsyncMock()
+    collection.insert_many = AsyncMock()
+    collection.find.return_value.to_list = AsyncMock(return_value=[{"_id": 2}, {"_id": 1}])
+    return collection
+
+
+@pytest.fixture
+def test_database(mock_collection):
+    client = MagicMock()
+    client.__getitem__.return_value.__getitem__.return_value = mock_collection
+    client.close = AsyncMock()
+    with patch("mongodb_async.AsyncMongoClient", return_value=client):
+        database = AsyncDatabase(database_name="testdb")
+    yield database
+    database.close_connection()
+
+
+def test_crud(test_database, mock_collection):
+    async def scenario():
+        assert await test_database.create_document("tasks", {"title": "Test"}) == "new_id"
+        assert await test_database.read_documents("tasks", "507f1f77bcf86cd799439011") == {"_id": 1, "title": "doc1"}
+        assert await test_database.update_document("tasks", "507f1f77bcf86cd799439011", {"title": "Updated"})
+        assert await test_database.delete_document("tasks", "507f1f77bcf86cd799439011")
+        return await test_database.read_page("tasks", page_size=1)
+
+    assert asyncio.run(scenario()) == ([{"_id": 2}], "2")
+    mock_collection.find.assert_called_with({}, None, sort=[('_id', -1)], limit=2)
+
+
+def test_awaitable_from_several_loops(test_database):
+    # Flask runs every async view in a fresh event loop; the client must not be bound to any of them.
+    for _ in range(3):
+        assert asyncio.run(test_database.read_documents("tasks", "507f1f77bcf86cd799439011"))
+
+
+def test_create_duplicate_user(test_database, mock_collection):
+    mock_collection.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key error")
+    assert asyncio.run(test_database.create_document("users", {"username": "alice"})) is None
+
+
+def test_bulk_apply_fails_writes_that_match_nothing(test_database, mock_collection):
+    found, missing = ObjectId(), ObjectId()
+    mock_collection.find.return_value.to_list = AsyncMock(return_value=[{'_id': found}])
+    mock_collection.bulk_write = AsyncMock(return_value=MagicMock(bulk_api_result={'nRemoved': 1}))
+    results = asyncio.run(test_database.bulk_apply("tasks", [
+        {'op': 'delete', 'id': str(found)},
+        {'op': 'delete', 'id': str(missing)},
+    ], ordered=False))
+    assert [result['ok'] for result in results] == [True, False]
+    assert len(mock_collection.bulk_write.call_args.args[0]) == 1
+
+
+class AsyncCursor:
+    """The async iteration of a find or aggregate cursor over `documents`."""
+
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def test_backfill_owners_in_batches(test_database, mock_collection):
+    mock_collection.find.return_value = AsyncCursor([{'_id': i} for i in range(5)])
+    mock_collection.update_many = AsyncMock(return_value=MagicMock(modified_count=2))
+    assert asyncio.run(test_database.backfill_owners("alice", batch_size=2)) == 6
+    assert mock_collection.update_many.call_args.args == ({'_id': {'$in': [4]}, 'owner': {'$exists': False}},
+                                                          {'$set': {'owner': 'alice'}})
+
+
+def test_backfill_search_terms(test_database, mock_collection):
+    mock_collection.find.return_value = AsyncCursor([{'_id': 1, 'title': "Buy milk"}])
+    mock_collection.bulk_write = AsyncMock(return_value=MagicMock(modified_count=1))
+    assert asyncio.run(test_database.backfill_search_terms()) == 1
+    [request] = mock_collection.bulk_write.call_args.args[0]
+    assert request._doc == {'$set': {'_terms': ['buy', 'milk']}}
+
+
+def test_index_report(test_database, mock_collection):
+    mock_collection.index_information = AsyncMock(return_value={'_id_': {}, 'username_unique': {}})
+    mock_collection.aggregate = AsyncMock(return_value=AsyncCursor([
+        {'name': 'username_unique', 'accesses': {'ops': 0, 'since': '2024-01-01'}},
+    ]))
+    report = asyncio.run(test_database.index_report())
+    assert report['users'] == {
+        'missing': [], 'error': None, 'unused': [{'name': 'username_unique', 'since': '2024-01-01'}]
+    }
+    assert 'owner_id' in report['tasks']['missing']
+
+
+class AsyncMemoryDatabase(MemoryDatabase):
+    """Memory engine with coroutine methods, standing in for AsyncDatabase in view tests."""
+
+    async def create_document(self, *args, **kwargs):
+        return super().create_document(*args, **kwargs)
+
+    async def read_documents(self, *args, **kwargs):
+        return super().read_documents(*args, **kwargs)
+
+    async def read_page(self, *args, **kwargs):
+        return super().read_page(*args, **kwargs)
+
+    async def search_documents(self, *args, **kwargs):
+        return super().search_documents(*args, **kwargs)
+
+    async def update_document(self, *args, **kwargs):
+        return super().update_document(*args, **kwargs)
+
+    async def delete_document(self, *args, **kwargs):
+        return super().delete_document(*args, **kwargs)
+
+    async def transfer_owner(self, *args, **kwargs):
+        return super().transfer_owner(*args, **kwargs)
+
+
+@pytest.fixture
+def client():
+    pytest.importorskip("asgiref")
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    init_template_caches(app)
+    init_assets(app)
+    app.db = AsyncMemoryDatabase()
+    app.hasher = PasswordHasher.from_config(app.config)
+    for blueprint in (component, api, user):
+        app.register_blueprint(blueprint)
+    register_async_views(app)
+    return app.test_client()
+
+
+def test_async_views(client):
+    response = client.post('/tasks/create', data={'title': 'Async task'})
+    assert b'Async task' in response.data
+    assert b'Async task' in client.get('/').data
+    assert client.get('/tasks').headers['ETag']
+
+
+def test_async_sign_up_and_login(client):
+    assert client.post('/users/signup', data={'username': 'alice', 'password': 'secret'}).status_code == 200
+    assert client.post('/users/login', data={'username': 'alice', 'password': 'secret'}).status_code == 200
+    assert client.post('/users/login', data={'username': 'alice', 'password': 'wrong'}).status_code == 400
+
+
+def test_async_login_takes_the_guests_tasks(client):
+    client.post('/tasks/create', data={'title': 'Guest task'})
+    client.post('/users/signup', data={'username': 'alice', 'password': 'secret'})
+    with client.session_transaction() as session:
+        user_id = session['user_id']
+    [task] = asyncio.run(client.application.db.read_documents('tasks'))
+    assert task['owner'] == user_id
+
+
+def test_async_search(client):
+    client.post('/tasks/create', data={'title': 'Findable task'})
+    assert b'Findable task' in client.get('/tasks/search?q=find').data
+    assert b'No tasks match nothing.' in client.get('/tasks/search?q=nothing').data
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+import factory
+from config import TestingConfig
+from factory import create_app
+from utils.sessions import instance_secret_key
+
+
+@pytest.fixture
+def app():
+    return create_app(TestingConfig)
+
+
+def signed_in(app, user_id):
+    client = app.test_client()
+    if user_id:
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+    return client
+
+
+def test_users_only_see_their_own_tasks(app):
+    alice, bob = signed_in(app, 'alice-id'), signed_in(app, 'bob-id')
+    alice.post('/tasks/create', data={'title': 'Alice task', 'owner': 'bob-id'})
+    bob.post('/tasks/create', data={'title': 'Bob task'})
+    [task] = app.db.read_documents('tasks', owner='alice-id')
+    assert task['owner'] == 'alice-id'
+
+    assert b'Alice task' in alice.get('/tasks').data and b'Bob task' not in alice.get('/tasks').data
+    assert b'Alice task' not in bob.get('/tasks/all').data
+    assert b'Alice task' not in bob.get('/tasks/search?q=task').data
+    assert b'Alice task' not in signed_in(app, None).get('/').data
+    assert alice.get('/tasks').headers['ETag'] != bob.get('/tasks').headers['ETag']
+
+
+def test_signed_out_visitors_only_see_their_own_tasks(app):
+    first, second = signed_in(app, None), signed_in(app, None)
+    first.post('/tasks/create', data={'title': 'First visitor task'})
+    assert b'First visitor task' in first.get('/tasks').data
+    assert b'First visitor task' not in second.get('/tasks').data
+    assert b'First visitor task' not in second.get('/tasks/search?q=first').data
+    [task] = app.db.read_documents('tasks')
+    assert task['owner'].startswith('guest:')
+
+
+def test_users_cannot_change_tasks_of_others(app):
+    alice, bob = signed_in(app, 'alice-id'), signed_in(app, 'bob-id')
+    alice.post('/tasks/create', data={'title': 'Alice task'})
+    _id = str(app.db.read_documents('tasks')[0]['_id'])
+
+    assert b'Not Found' in bob.get(f'/tasks/{_id}/edit').data
+    assert b'Not Found' in bob.post(f'/tasks/{_id}/update', data={'title': 'Taken'}).data
+    assert b'Error deleting' in bob.delete(f'/tasks/{_id}/drop').data
+    alice.post(f'/tasks/{_id}/update', data={'title': 'Renamed', 'owner': 'bob-id'})
+    assert app.db.read_documents('tasks', _id, owner='alice-id')['title'] == 'Renamed'
+    assert alice.delete(f'/tasks/{_id}/drop').data == b''
+
+
+def test_backfill_owners(app):
+    app.db.create_document('tasks', {'title': 'Legacy'})
+    result = app.test_cli_runner().invoke(args=['backfill-owners', '--owner', 'alice-id'])
+    assert 'Added an owner to 1 documents' in result.output
+    assert [task['title'] for task in app.db.read_documents('tasks', owner='alice-id')] == ['Legacy']
+    assert app.db.backfill_owners('bob-id') == 0
+    assert app.test_cli_runner().invoke(args=['backfill-owners']).exit_code == 2
+
+
+@pytest.mark.parametrize('route', ['/users/signup', '/users/login'])
+def test_guest_tasks_become_the_users_on_signing_in(app, route):
+    app.db.create_document('users', {'username': 'alice', 'password': app.hasher.hash('secret')})
+    visitor = signed_in(app, None)
+    visitor.post('/tasks/create', data={'title': 'Made as a guest'})
+    username = 'alice' if route == '/users/login' else 'bob'
+    assert visitor.post(route, data={'username': username, 'password': 'secret'}).status_code == 200
+    with visitor.session_transaction() as session:
+        user_id = session['user_id']
+    assert [task['title'] for task in app.db.read_documents('tasks', owner=user_id)] == ['Made as a guest']
+    assert b'Made as a guest' in visitor.get('/tasks').data
+
+
+def test_expire_guests(app):
+    visitor = signed_in(app, None)
+    visitor.post('/tasks/create', data={'title': 'Guest task'})
+    signed_in(app, 'alice-id').post('/tasks/create', data={'title': 'Alice task'})
+    assert 'Deleted 0 documents' in app.test_cli_runner().invoke(args=['expire-guests']).output
+    assert app.db.expire_guest_documents(max_age=-1) == 1
+    assert [task['title'] for task in app.db.read_documents('tasks')] == ['Alice task']
+
+
+def test_secret_key_outlives_the_app(tmp_path, monkeypatch):
+    class Config(TestingConfig):
+        SECRET_KEY = None
+
+    monkeypatch.setattr(factory, 'INSTANCE_PATH', str(tmp_path))
+    key = create_app(Config).config['SECRET_KEY']
+    assert key and create_app(Config).config['SECRET_KEY'] == key
+    assert instance_secret_key(str(tmp_path)) == key
+    assert os.stat(tmp_path / 'secret_key').st_mode & 0o777 == 0o600
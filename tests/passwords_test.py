@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from blueprints.user_blueprint import user
+from config import TestingConfig
+from memorydb import MemoryDatabase
+from utils.passwords import HasherBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(rounds=4, workers=1, max_queue=1)
+
+
+@pytest.fixture
+def app():
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    app.db = MemoryDatabase()
+    app.hasher = PasswordHasher.from_config(app.config)
+    app.register_blueprint(user)
+    return app
+
+
+def test_hash_and_verify(hasher):
+    hashed = hasher.hash("secret")
+    assert hasher.verify("secret", hashed)
+    assert not hasher.verify("wrong", hashed)
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(rounds=5).needs_rehash(hashed)
+    assert hasher.stats()['latency_samples'] == 3
+
+
+def test_full_queue_is_rejected(hasher):
+    release = threading.Event()
+    running = [hasher.submit(release.wait), hasher.submit(release.wait)]
+    with pytest.raises(HasherBusy):
+        hasher.submit(release.wait)
+    assert hasher.stats()['rejected'] == 1
+    release.set()
+    for future in running:
+        future.result()
+    assert hasher.stats()['in_flight'] == 0
+
+
+def test_busy_hasher_answers_503(app):
+    app.hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+    release = threading.Event()
+    running = app.hasher.submit(release.wait)
+    response = app.test_client().post('/users/signup', data={'username': 'alice', 'password': 'secret'})
+    release.set()
+    running.result()
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+
+def test_login_rehashes_with_new_cost(app):
+    client = app.test_client()
+    client.post('/users/signup', data={'username': 'alice', 'password': 'secret'})
+    app.hasher = PasswordHasher(rounds=5)
+
+    assert client.post('/users/login', data={'username': 'alice', 'password': 'secret'}).status_code == 200
+    stored = app.db.read_documents('users', 'alice')['password']
+    assert stored.startswith(b'$2b$05$')
+    assert client.post('/users/login', data={'username': 'alice', 'password': 'secret'}).status_code == 200
+
+
+def test_hasher_stats_only_in_debug_mode(app):
+    client = app.test_client()
+    assert client.get('/users/hasher/stats').status_code == 404
+    app.debug = True
+    assert client.get('/users/hasher/stats').json['in_flight'] == 0
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from pymongo.errors import ConnectionFailure
+
+from blueprints.api_blueprint import api
+from blueprints.component_blueprint import component
+from config import TestingConfig
+from memorydb import MemoryDatabase
+from mongodb import Database
+from utils.connection import CircuitBreaker, ConnectionManager
+from utils.fragments import init_template_caches
+
+
+@pytest.fixture
+def app():
+    app = Flask("tasktracker", root_path="/".join(__file__.split("/")[:-2]))
+    app.config.from_object(TestingConfig)
+    init_template_caches(app)
+    app.db = MemoryDatabase()
+    for blueprint in (component, api):
+        app.register_blueprint(blueprint)
+    return app
+
+
+def test_search_renders_matching_cards(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'alice-id'
+    app.db.create_document('tasks', {'title': 'Water the plants', 'owner': 'alice-id'})
+    app.db.create_document('tasks', {'title': 'Walk the dog', 'owner': 'alice-id'})
+    response = client.get('/tasks/search?q=wat')
+    assert b'Water the plants' in response.data
+    assert b'Walk the dog' not in response.data
+    assert b'Walk the dog' in client.get('/tasks/search?q=').data
+
+
+def test_search_answers_while_the_database_is_down(app):
+    with patch("mongodb.MongoClient", side_effect=ConnectionFailure("down")):
+        app.db = Database(database_name="testdb", connection=ConnectionManager(breaker=CircuitBreaker(60)))
+        assert app.db.search_documents('tasks', 'milk') == []
+        response = app.test_client().get('/tasks/search?q=milk')
+    assert response.status_code == 200
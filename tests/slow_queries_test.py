@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock, Mock
+
+from flask import Flask
+
+from memorydb import MemoryDatabase
+from utils.connection import ConnectionManager
+from utils.slow_queries import SlowQueryListener, init_slow_query_log, query_shape
+
+
+def command_events(request_id, command_name, command, duration_ms):
+    ids = {'connection_id': ('localhost', 27017), 'request_id': request_id}
+    started = Mock(command_name=command_name, database_name='testdb', command=command, **ids)
+    succeeded = Mock(command_name=command_name, duration_micros=int(duration_ms * 1000), **ids)
+    return started, succeeded
+
+
+def run(listener, request_id, command_name, command, duration_ms):
+    started, succeeded = command_events(request_id, command_name, command, duration_ms)
+    listener.started(started)
+    listener.succeeded(succeeded)
+
+
+def test_query_shape_hides_values():
+    assert query_shape({'_id': {'$lt': 5}, 'tags': ['a', 'b'], 'title': 'x'}) == \
+        {'_id': {'$lt': '?'}, 'tags': ['?'], 'title': '?'}
+
+
+def test_keeps_the_slowest_queries():
+    listener = SlowQueryListener(threshold_ms=10, keep=2)
+    run(listener, 1, 'find', {'find': 'tasks', 'filter': {'title': 'a'}}, 50)
+    run(listener, 2, 'find', {'find': 'tasks', 'filter': {}}, 5)
+    run(listener, 3, 'update', {'update': 'tasks', 'updates': [{'q': {'_id': 1}}]}, 20)
+    run(listener, 4, 'delete', {'delete': 'tasks', 'deletes': [{'q': {'_id': 1}}]}, 30)
+    run(listener, 5, 'insert', {'insert': 'tasks'}, 500)
+
+    worst = listener.worst()
+    assert [(entry['command'], entry['duration_ms']) for entry in worst] == [('find', 50), ('delete', 30)]
+    assert worst[0]['shape'] == '{"title": "?"}'
+    assert worst[0]['collection'] == 'tasks'
+
+
+def test_explain_flags_collection_scans():
+    listener = SlowQueryListener(threshold_ms=10, explain=True)
+    listener.client = MagicMock()
+    listener.client.__getitem__.return_value.command.return_value = {
+        'queryPlanner': {'winningPlan': {'stage': 'LIMIT', 'inputStage': {'stage': 'COLLSCAN'}}}
+    }
+    run(listener, 1, 'find', {'find': 'tasks', 'filter': {'title': 'a'}, 'lsid': {}}, 50)
+    listener._explainer.shutdown(wait=True)
+
+    assert listener.worst()[0]['plan'] == 'COLLSCAN'
+    explained = listener.client.__getitem__.return_value.command.call_args
+    assert explained.args == ('explain', {'find': 'tasks', 'filter': {'title': 'a'}})
+
+
+def test_listener_is_opt_in():
+    assert ConnectionManager.from_config({}).slow_queries is None
+    assert ConnectionManager.from_config({'SLOW_QUERY_MS': 50, 'DEBUG': True}).slow_queries.explain
+
+
+def test_endpoint_is_debug_only():
+    app = Flask(__name__)
+    app.db = MemoryDatabase()
+    init_slow_query_log(app)
+    assert app.test_client().get('/debug/slow-queries').status_code == 404
+    app.debug = True
+    assert app.test_client().get('/debug/slow-queries').json == []
@@ -0,0 +1,99 @@
+import gzip
+
+import pytest
+
+from config import TestingConfig
+from factory import create_app
+from utils.streaming import Peekable, buffered
+
+
+class Config(TestingConfig):
+    TRANSFER_TOKEN = 'secret'
+    STREAM_BATCH_SIZE = 10
+    STREAM_CHUNK_SIZE = 256
+
+
+ADMIN = {'Authorization': f"Bearer {Config.TRANSFER_TOKEN}"}
+
+
+@pytest.fixture
+def app():
+    return create_app(Config)
+
+
+def alice(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'alice-id'
+    return client
+
+
+def test_first_chunk_goes_out_before_the_collection_is_read(app):
+    for i in range(1000):
+        app.db.create_document('tasks', {'title': f"Task {i}", 'owner': 'alice-id'})
+    read = []
+    iter_documents = app.db.iter_documents
+
+    def counting(*args, **kwargs):
+        for document in iter_documents(*args, **kwargs):
+            read.append(document)
+            yield document
+    app.db.iter_documents = counting
+
+    response = alice(app).get('/tasks/all')
+    assert response.is_streamed
+    next(response.response)
+    assert len(read) <= 2 * Config.STREAM_BATCH_SIZE
+    body = b''.join(response.response)
+    assert len(read) == 1000
+    assert b'Task 999' in body and b'Task 0<' in body
+    response.close()
+
+
+def test_streamed_responses_are_gzipped(app):
+    for i in range(50):
+        app.db.create_document('tasks', {'title': f"Task {i}", 'owner': 'alice-id'})
+    response = alice(app).get('/tasks/all', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert b'Task 49' in gzip.decompress(response.data)
+
+
+def test_small_responses_are_not_compressed(app):
+    response = app.test_client().get('/health/live', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.json == {'status': 'ok'}
+
+
+def test_empty_stream_renders_the_empty_message(app):
+    assert b'No tasks' in app.test_client().get('/tasks/all').data
+    users = app.test_client().get('/users', headers=ADMIN).data
+    assert b'No users' in users
+
+
+def test_user_list_leaves_out_passwords(app):
+    app.db.create_document('users', {'username': 'alice', 'password': b'hash'})
+    body = app.test_client().get('/users', headers=ADMIN).data
+    assert b'alice' in body and b'hash' not in body and b'No users' not in body
+
+
+def test_user_list_is_for_administrators_only(app):
+    app.db.create_document('users', {'username': 'alice', 'password': b'hash'})
+    client = app.test_client()
+    assert client.get('/users').status_code == 404
+    assert client.get('/users', headers={'Authorization': 'Bearer guess'}).status_code == 404
+    etag = client.get('/users', headers=ADMIN).headers.get('ETag')
+    assert client.get('/users', headers={'If-None-Match': etag or '*'}).status_code == 404
+
+
+def test_peekable():
+    empty = Peekable(iter(()))
+    assert not empty and list(empty) == []
+    items = Peekable(iter([1, 2]))
+    assert items and list(items) == [1, 2] and items
+    unpeeked = Peekable(iter([3]))
+    assert list(unpeeked) == [3] and unpeeked
+
+
+def test_buffered_sends_the_first_chunk_at_once():
+    assert list(buffered(['<html>', 'a', 'b', 'c', 'd'], 2)) == ['<html>', 'ab', 'cd']
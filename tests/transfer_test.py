@@ -0,0 +1,114 @@
+import gzip
+import json
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import ConnectionFailure
+
+from config import TestingConfig
+from factory import create_app
+from utils.transfer import ExportFailed, ImportFailed, export_lines, import_lines
+
+TOKEN = {'Authorization': 'Bearer secret'}
+
+
+class Config(TestingConfig):
+    TRANSFER_TOKEN = 'secret'
+    EXPORT_BATCH_SIZE = 7
+    IMPORT_BATCH_SIZE = 10
+
+
+@pytest.fixture
+def app():
+    app = create_app(Config)
+    for i in range(25):
+        app.db.create_document('tasks', {'title': f"Task {i}"})
+    return app
+
+
+def test_export_and_import_round_trip(app):
+    response = app.test_client().get('/tasks/export', headers=TOKEN)
+    assert response.is_streamed and response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 25
+    assert '_terms' not in json.loads(lines[0]) and '$oid' in lines[0]
+
+    target = create_app(Config)
+    response = target.test_client().post('/tasks/import', data='\n'.join(lines), headers=TOKEN)
+    assert response.json['inserted'] == 25 and response.json['lines'] == 25
+    def by_id(documents):
+        return sorted(documents, key=lambda document: document['_id'])
+    assert by_id(target.db.read_documents('tasks')) == by_id(app.db.read_documents('tasks'))
+    assert target.db.search_documents('tasks', 'task 1')
+
+
+def test_gzip_export_imports_back(app):
+    response = app.test_client().get('/tasks/export?format=ndjson.gz', headers=TOKEN)
+    assert response.mimetype == 'application/gzip' and 'Content-Encoding' not in response.headers
+    body = response.get_data()
+    assert len(gzip.decompress(body).splitlines()) == 25
+
+    response = app.test_client().post('/tasks/import', data=body, content_type='application/gzip', headers=TOKEN)
+    assert (response.json['inserted'], response.json['skipped']) == (0, 25)
+
+
+def test_import_resumes_from_checkpoint(app):
+    lines = list(export_lines(app.db, 'tasks', 5))
+    lines.insert(12, 'not json\n')
+    target = create_app(Config)
+    checkpoints = []
+    with pytest.raises(ImportFailed) as failure:
+        import_lines(target.db, 'tasks', lines, 5, on_checkpoint=checkpoints.append)
+    assert checkpoints == [5, 10] and failure.value.resume_from == 10
+
+    del lines[12]
+    stats = import_lines(target.db, 'tasks', lines, 5, skip=failure.value.resume_from)
+    assert stats['inserted'] == 15 and stats['lines'] == 25
+    assert len(target.db.read_documents('tasks')) == 25
+
+
+def test_import_skips_existing_documents(app):
+    _id = ObjectId()
+    lines = [json.dumps({'_id': {'$oid': str(_id)}, 'title': 'Again'})] * 2
+    assert import_lines(app.db, 'tasks', lines, 10)['skipped'] == 1
+    assert app.db.read_documents('tasks', str(_id))['title'] == 'Again'
+
+
+def test_endpoints_need_the_token(app):
+    client = app.test_client()
+    assert client.get('/tasks/export').status_code == 404
+    assert client.post('/tasks/import', data='', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    assert create_app(TestingConfig).test_client().get('/tasks/export', headers=TOKEN).status_code == 404
+
+
+def failing_midway(iter_documents):
+    def iter_then_fail(*args, **kwargs):
+        documents = iter_documents(*args, **kwargs)
+        yield next(documents)
+        raise ConnectionFailure("connection reset")
+    return iter_then_fail
+
+
+def test_export_fails_instead_of_ending_early(app, tmp_path):
+    app.db.iter_documents = failing_midway(app.db.iter_documents)
+    response = app.test_client().get('/tasks/export', headers=TOKEN)
+    with pytest.raises(ExportFailed, match="after 1 documents"):
+        response.get_data()
+
+    path = tmp_path / 'tasks.ndjson'
+    result = app.test_cli_runner().invoke(args=['export-collection', 'tasks', '--output', str(path)])
+    assert result.exit_code == 1 and "after 1 documents" in result.output
+    assert not path.exists()
+
+
+def test_cli_export_and_import(app, tmp_path):
+    path = tmp_path / 'tasks.ndjson.gz'
+    result = app.test_cli_runner().invoke(args=['export-collection', 'tasks', '--output', str(path)])
+    assert result.exit_code == 0, result.output
+    target = create_app(Config)
+    checkpoint = tmp_path / 'checkpoint'
+    checkpoint.write_text('20')
+    result = target.test_cli_runner().invoke(args=['import-collection', 'tasks', str(path),
+                                                   '--checkpoint', str(checkpoint)])
+    assert result.exit_code == 0, result.output
+    assert len(target.db.read_documents('tasks')) == 5 and not checkpoint.exists()
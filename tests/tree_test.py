@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from utils.tree import IgnoreMatcher, print_file_tree, walk_tree, write_tree
+
+
+@pytest.mark.parametrize('patterns, path, is_dir, ignored', [
+    (['*.log'], 'a/b/debug.log', False, True),
+    (['*.log', '!keep.log'], 'a/keep.log', False, False),
+    (['!keep.log', '*.log'], 'a/keep.log', False, True),
+    (['/build'], 'build', True, True),
+    (['/build'], 'src/build', True, None),
+    (['docs/'], 'a/docs', True, True),
+    (['docs/'], 'a/docs', False, None),
+    (['logs/*'], 'logs', True, None),
+    (['a/**/z'], 'a/b/c/z', False, True),
+    (['a/**/z'], 'a/z', False, True),
+    (['**/cache'], 'x/cache', True, True),
+    (['out/**'], 'out', True, None),
+    (['out/**'], 'out/x.js', False, True),
+    (['file[0-9].txt'], 'file7.txt', False, True),
+    (['file[!0-9].txt'], 'file7.txt', False, None),
+    (['\\#notes'], '#notes', False, True),
+    (['# comment', ''], 'comment', False, None),
+])
+def test_ignore_matcher(patterns, path, is_dir, ignored):
+    assert IgnoreMatcher(patterns).match(path, is_dir) is ignored
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / '.gitignore').write_text('*.pyc\n/dist/\nlogs/*\n!logs/keep.txt\n')
+    (tmp_path / '.git').mkdir()
+    (tmp_path / '.git' / 'HEAD').write_text('ref')
+    for path in ['app.py', 'app.pyc', 'dist/bundle.js', 'src/dist/x.py', 'logs/a.txt', 'logs/keep.txt',
+                 'pkg/.gitignore', 'pkg/secret.txt', 'pkg/mod.py']:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text('')
+    (tmp_path / 'pkg' / '.gitignore').write_text('secret.txt\n')
+    return tmp_path
+
+
+def test_walk_tree(project):
+    assert [entry.relative_path for entry in walk_tree(project)] == [
+        '.gitignore', 'app.py', 'logs', 'logs/keep.txt', 'pkg', 'pkg/.gitignore', 'pkg/mod.py',
+        'src', 'src/dist', 'src/dist/x.py',
+    ]
+
+
+def test_write_tree_styles(project):
+    output = io.StringIO()
+    assert write_tree(output, project, 'tree') == 10
+    assert output.getvalue().splitlines()[3] == '|   |-- ./logs/keep.txt'
+
+    output = io.StringIO()
+    write_tree(output, project, as_json=True)
+    tree = json.loads(output.getvalue())
+    assert tree[2] == {'name': 'logs', 'type': 'directory', 'children': [{'name': 'keep.txt', 'type': 'file'}]}
+
+
+def test_print_file_tree_to_log(project, tmp_path_factory):
+    log_path = tmp_path_factory.mktemp('out') / 'file_tree.log'
+    assert print_file_tree(project, 'indent', log_path) == 10
+    assert log_path.read_text().splitlines()[1] == '~/app.py'
@@ -0,0 +1,201 @@
+"""Shed load on the expensive endpoints instead of letting it queue behind the cheap ones.
+
+Two checks run before the views named in the config, cheapest first:
+
+- RATE_LIMITS, `{endpoint: (requests per second, burst)}`: a token bucket per session (the
+  signed-in user, else the browser's id from its session cookie, else the client address as
+  PROXY_FIX_X_FOR reads it) and endpoint. An empty bucket is answered 429 with the time until
+  its next token. On routes that serve a form and take its POST, like sign-up and login, only
+  the POST counts. A browser id costs nothing to replace, so for signed-out visitors it is
+  advisory: they also draw on a bucket of their address, RATE_LIMIT_ADDRESS_FACTOR times as
+  large, shared by every browser behind it.
+- ADMISSION_LIMITS, `{endpoint: requests}`: how many requests of the endpoint this process
+  serves at once. The next one is answered 503 right away rather than holding a worker thread
+  while it waits; the slot is freed when the response is closed, after the last chunk of a
+  streamed body.
+
+Both answers carry Retry-After and the errors/busy.html notice, which static/js/busy.js has
+htmx swap into `#notices`. Every refused request is counted in `http_requests_shed_total`.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, make_response, render_template, request, session
+
+from utils.forks import after_fork_in_child
+from utils.metrics import METRICS
+from utils.sessions import BROWSER_ID
+
+
+class ConcurrencyLimiter:
+    """Counts the requests in progress and refuses, without waiting, one past `limit`."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.start()
+        after_fork_in_child(self.start)
+
+    def start(self):
+        # Also run in forked children, which inherit the parent's count but none of its requests.
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class RateLimiter:
+    """Token buckets per key, refilled lazily when the key is seen again.
+
+    Only the `max_keys` most recently seen keys are kept; a forgotten key starts with a full bucket.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.start()
+        after_fork_in_child(self.start)
+
+    def start(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def acquire(self, key):
+        """Take a token for `key`; returns 0 if there was one, else the seconds until there is."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class Admission:
+    def __init__(self, concurrency=None, rates=None, max_sessions=10000, retry_after=1, address_factor=10):
+        self.limiters = {endpoint: ConcurrencyLimiter(limit) for endpoint, limit in (concurrency or {}).items()}
+        self.rate_limiters = {
+            endpoint: RateLimiter(rate, burst, max_sessions) for endpoint, (rate, burst) in (rates or {}).items()
+        }
+        self.address_limiters = {
+            endpoint: RateLimiter(rate * address_factor, burst * address_factor, max_sessions)
+            for endpoint, (rate, burst) in (rates or {}).items()
+        }
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            concurrency=config.get('ADMISSION_LIMITS'),
+            rates=config.get('RATE_LIMITS'),
+            max_sessions=config.get('RATE_LIMIT_MAX_SESSIONS', 10000),
+            retry_after=config.get('ADMISSION_RETRY_AFTER', 1),
+            address_factor=config.get('RATE_LIMIT_ADDRESS_FACTOR', 10)
+        )
+
+    def admit(self, endpoint, session_key, address=None, rate_limited=True):
+        """Return None and hold a slot of the endpoint, or `(status, reason, retry_after)` to refuse.
+
+        With an `address`, the request also takes a token from the bucket of that address.
+        """
+        rate_limiter = self.rate_limiters.get(endpoint)
+        if rate_limiter and rate_limited:
+            wait = rate_limiter.acquire((endpoint, session_key))
+            if address is not None:
+                wait = max(wait, self.address_limiters[endpoint].acquire((endpoint, address)))
+            if wait:
+                return 429, 'rate', math.ceil(wait)
+        limiter = self.limiters.get(endpoint)
+        if limiter and not limiter.try_acquire():
+            return 503, 'concurrency', self.retry_after
+        return None
+
+    def release(self, endpoint):
+        self.limiters[endpoint].release()
+
+    def stats(self):
+        return {
+            f"in_flight_{endpoint.replace('.', '_')}": limiter.in_flight for endpoint, limiter in self.limiters.items()
+        }
+
+
+def session_key():
+    # Behind a proxy every client has the proxy's address, so the address is the last resort: for
+    # clients that send no session cookie, which would get a new browser id with every request.
+    return session.get('user_id') or session.get(BROWSER_ID) or request.remote_addr
+
+
+def counts_against_rate_limit():
+    """Whether the request does the endpoint's work: on a route that also takes a POST, only the POST does."""
+    return request.method == 'POST' or 'POST' not in request.url_rule.methods
+
+
+def shed_response(status, reason, retry_after, message=None):
+    """A fast refusal: the busy notice, Retry-After, and a count of what was shed and why."""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    METRICS.requests_shed.inc(route, reason)
+    response = make_response(render_template(
+        'errors/busy.html',
+        message=message or ("Too many requests, please slow down." if status == 429 else "The server is busy."),
+        retry_after=retry_after
+    ), status)
+    response.headers['Retry-After'] = str(retry_after)
+    # htmx does not swap error responses by itself; busy.js lets these through, into the notices.
+    response.headers['HX-Retarget'] = '#notices'
+    response.headers['HX-Reswap'] = 'innerHTML'
+    return response
+
+
+def admit_request():
+    endpoint = request.endpoint
+    if endpoint not in current_app.admission.limiters and endpoint not in current_app.admission.rate_limiters:
+        return None
+    # Signed-out visitors can mint browser ids at will, but not addresses.
+    address = None if session.get('user_id') else request.remote_addr
+    refused = current_app.admission.admit(endpoint, session_key(), address, counts_against_rate_limit())
+    if refused:
+        return shed_response(*refused)
+    if endpoint in current_app.admission.limiters:
+        g.admitted_endpoint = endpoint
+    return None
+
+
+def release_on_close(response):
+    endpoint = g.pop('admitted_endpoint', None)
+    if endpoint:
+        # Not at teardown, which comes before a streamed body is even started.
+        admission = current_app.admission
+        response.call_on_close(lambda: admission.release(endpoint))
+    return response
+
+
+def release_request(exception=None):
+    # The view failed before it had a response to wait for.
+    endpoint = g.pop('admitted_endpoint', None)
+    if endpoint:
+        current_app.admission.release(endpoint)
+
+
+def init_admission(app):
+    app.admission = Admission.from_config(app.config)
+    app.before_request(admit_request)
+    app.after_request(release_on_close)
+    app.teardown_request(release_request)
@@ -0,0 +1,221 @@
+"""Build and serve the CSS and JS bundles.
+
+`flask build-assets` concatenates the files of each bundle, drops the Bootstrap rules whose
+classes no template uses, minifies, names the result after its content hash and writes gzip
+(and brotli, when the `brotli` package is installed) variants next to it in static/dist.
+Templates link bundles with `asset_urls(name)`: the fingerprinted file when a build exists,
+otherwise the source files, so development needs no build step.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BOOTSTRAP = 'bootstrap-5.3.2-dist'
+BUNDLES = {
+    'app.css': ['css/style.css', 'css/index.css', f'{BOOTSTRAP}/css/bootstrap.css'],
+    'app.js': ['js/htmx.min.js', f'{BOOTSTRAP}/js/bootstrap.bundle.min.js', 'js/theme.js', 'js/live.js', 'js/busy.js'],
+}
+# Purged from unused rules: the Bootstrap stylesheet is written for every component there is.
+PURGED = {f'{BOOTSTRAP}/css/bootstrap.css'}
+# Classes no template spells out: added by Bootstrap's and htmx's scripts, or built in a template expression.
+SAFELIST = {
+    'active', 'show', 'showing', 'hiding', 'fade', 'collapse', 'collapsing', 'modal-open', 'modal-backdrop',
+    'modal-static', 'disabled', 'dropdown-menu-end', 'was-validated', 'alert-success', 'alert-warning',
+    'alert-danger', 'htmx-request', 'htmx-indicator', 'htmx-settling', 'htmx-swapping', 'htmx-added',
+}
+MAX_AGE = 365 * 24 * 3600
+MANIFEST = 'manifest.json'
+
+CLASS_PATTERN = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+NOT_PATTERN = re.compile(r':not\([^)]*\)')
+
+
+def used_classes(*directories):
+    """Every word of the templates and app scripts; a superset of the class names they use."""
+    words = set(SAFELIST)
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(('.html', '.js')) and not name.endswith('.min.js'):
+                    with open(os.path.join(root, name), encoding='utf-8') as source:
+                        words.update(re.findall(r'[\w-]+', source.read()))
+    return words
+
+
+def strip_comments(css):
+    return re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+
+
+def find_outside_strings(css, characters, start):
+    quote = None
+    for index in range(start, len(css)):
+        character = css[index]
+        if quote:
+            if character == quote:
+                quote = None
+        elif character in '"\'':
+            quote = character
+        elif character in characters:
+            return index
+    return len(css)
+
+
+def closing_brace(css, start):
+    depth = 1
+    index = start
+    while depth:
+        index = find_outside_strings(css, '{}', index + 1)
+        if index == len(css):
+            return index
+        depth += 1 if css[index] == '{' else -1
+    return index
+
+
+def split_selectors(prelude):
+    selectors, depth, current = [], 0, ''
+    for character in prelude:
+        depth += character == '('
+        depth -= character == ')'
+        if character == ',' and not depth:
+            selectors.append(current)
+            current = ''
+        else:
+            current += character
+    return selectors + [current]
+
+
+def purge_css(css, used):
+    """Drop the selectors that need a class outside `used`, and the rules left without selectors."""
+    kept, index = [], 0
+    while index < len(css):
+        brace = find_outside_strings(css, '{;', index)
+        if brace == len(css):
+            break
+        prelude = css[index:brace].strip()
+        if css[brace] == ';':
+            # @charset is only valid first in a file, and bundles are UTF-8 anyway.
+            if not prelude.startswith('@charset'):
+                kept.append(prelude + ';')
+            index = brace + 1
+            continue
+        end = closing_brace(css, brace)
+        body = css[brace + 1:end]
+        if prelude.startswith(('@media', '@supports', '@layer', '@container')):
+            inner = purge_css(body, used)
+            if inner.strip():
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            kept.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [
+                selector for selector in split_selectors(prelude)
+                if set(CLASS_PATTERN.findall(NOT_PATTERN.sub('', selector))) <= used
+            ]
+            if selectors:
+                kept.append(f"{','.join(selector.strip() for selector in selectors)}{{{body}}}")
+        index = end + 1
+    return '\n'.join(kept)
+
+
+def minify_css(css):
+    css = strip_comments(css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    # Without a JS parser only layout is safe to drop: indentation, blank lines and whole-line comments.
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def build_bundle(static_folder, name, sources, used):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as source_file:
+            content = source_file.read()
+        if source in PURGED:
+            content = purge_css(strip_comments(content), used)
+        if name.endswith('.css'):
+            parts.append(minify_css(content))
+        else:
+            # Source maps are not published, so drop the comments pointing at them.
+            content = re.sub(r'^//# sourceMappingURL=.*$', '', content, flags=re.M)
+            parts.append(content if source.endswith('.min.js') else minify_js(content))
+    # A newline between scripts keeps a missing semicolon at the end of one from joining it to the next.
+    return ('\n' if name.endswith('.js') else '').join(parts).encode('utf-8')
+
+
+def build_assets(app):
+    """Write every bundle, its compressed variants and the manifest to static/dist; return the manifest."""
+    dist = os.path.join(app.static_folder, 'dist')
+    os.makedirs(dist, exist_ok=True)
+    used = used_classes(os.path.join(app.root_path, app.template_folder), os.path.join(app.static_folder, 'js'))
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        content = build_bundle(app.static_folder, name, sources, used)
+        stem, extension = os.path.splitext(name)
+        fingerprinted = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+        variants = {'': content, '.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            variants['.br'] = brotli.compress(content, quality=11)
+        for suffix, data in variants.items():
+            with open(os.path.join(dist, fingerprinted + suffix), 'wb') as output:
+                output.write(data)
+        manifest[name] = fingerprinted
+    with open(os.path.join(dist, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    app.asset_manifest = manifest
+    return manifest
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(app.static_folder, 'dist', MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_urls(name):
+    """URLs to link for a bundle: its fingerprinted build, or its source files when there is none."""
+    fingerprinted = current_app.asset_manifest.get(name)
+    if fingerprinted:
+        return [url_for('asset', filename=fingerprinted)]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted bundle, precompressed when the client accepts it; its name never changes content."""
+    dist = os.path.join(current_app.static_folder, 'dist')
+    mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+    encoding = next(
+        (encoding for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+         if request.accept_encodings[encoding] and os.path.exists(os.path.join(dist, filename + suffix))),
+        None
+    )
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+    response = send_from_directory(dist, filename + suffix, mimetype=mimetype, max_age=MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    app.asset_manifest = load_manifest(app)
+    app.jinja_env.globals['asset_urls'] = asset_urls
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import bson
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class NullCache:
+    """Cache that stores nothing but still keeps per-collection version counters."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # A random epoch keeps versions from one process lifetime from matching those of another.
+        self._epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._versions_lock = threading.Lock()
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def version(self, collection_name):
+        return f"{self._epoch}.{self._versions.get(collection_name, 0)}"
+
+    def bump(self, collection_name):
+        with self._versions_lock:
+            self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+        return self.version(collection_name)
+
+    def __len__(self):
+        return 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LocalCache(NullCache):
+    """In-process LRU cache with a per-entry TTL, bounded by number of entries.
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(NullCache):
+    """Cache shared by every worker through Redis, so writes in one worker invalidate reads in all of them.
+
+    Hit and miss counters are per process.
+    """
+
+    def __init__(self, url, ttl=30, prefix="tasktracker:"):
+        super().__init__()
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND 'redis' requires the redis package.") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bson.decode(raw)['v']
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, bson.encode({'v': value}), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def version(self, collection_name):
+        # Version keys have no TTL; they only change when a write bumps them.
+        return (self.client.get(f"{self.prefix}version:{collection_name}") or b"0").decode()
+
+    def bump(self, collection_name):
+        return str(self.client.incr(f"{self.prefix}version:{collection_name}"))
+
+    def __len__(self):
+        # The Redis database may be shared: count only this cache's entries, not its version keys.
+        versions = f"{self.prefix}version:".encode()
+        return sum(1 for key in self.client.scan_iter(match=f"{self.prefix}*", count=1000)
+                   if not key.startswith(versions))
+
+    def stats(self):
+        # Counting the entries walks the keyspace, too slow for every /metrics scrape.
+        stats = super().stats()
+        del stats['entries']
+        return stats
+
+
+def make_cache(config):
+    backend = config.get('CACHE_BACKEND', 'none')
+    if backend == 'memory':
+        return LocalCache(config.get('CACHE_MAX_ENTRIES', 1024), config.get('CACHE_TTL', 30))
+    if backend == 'redis':
+        return RedisCache(config['CACHE_URL'], config.get('CACHE_TTL', 30))
+    if backend not in (None, 'none'):
+        logger.warning(f"Unknown CACHE_BACKEND {backend}, caching disabled.")
+    return NullCache()
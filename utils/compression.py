@@ -0,0 +1,54 @@
+"""Gzip responses for clients that accept it, streamed responses included.
+
+Buffered responses are compressed whole once they are at least COMPRESS_MIN_SIZE bytes.
+Streamed ones are compressed chunk by chunk, with a sync flush after each chunk, so every
+chunk reaches the client as soon as it is produced instead of waiting in the compressor.
+Event streams and files served by `send_file` (the prebuilt assets have their own .gz) are
+left alone.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+COMPRESSIBLE = {'text/html', 'text/plain', 'text/css', 'text/csv', 'application/json', 'application/x-ndjson'}
+
+
+def gzip_stream(chunks, level, close=None):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # Closing the original iterable runs its cleanup, such as `stream_with_context` teardown.
+        if close:
+            close()
+
+
+def compress_response(response, min_size, level):
+    if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    if response.is_streamed:
+        original = response.response
+        response.response = gzip_stream(response.iter_encoded(), level, getattr(original, 'close', None))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_compression(app):
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    level = app.config.get('COMPRESS_LEVEL', 6)
+    app.after_request(lambda response: compress_response(response, min_size, level))
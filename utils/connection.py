@@ -1,15 +1,236 @@
 import logging
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context
+from pymongo import ReadPreference, monitoring
+from pymongo.errors import ConnectionFailure
+
+from utils.metrics import METRICS
+from utils.slow_queries import SlowQueryListener
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# What each operation returns when the database is not reachable; anything not listed returns None.
+FAILURE_RESULTS = {
+    'update_document': False,
+    'read_page': ([], None),
+    'bulk_apply': [],
+    'iter_documents': (),
+    'search_documents': [],
+}
+# Operations that follow the engine's read preference, so a readable server is all they need.
+READS = ('read_documents', 'read_page', 'iter_documents', 'search_documents')
+
+
+class CircuitBreaker:
+    """Fails calls fast while the database is known to be down.
+
+    While open, one trial call is let through every `reset_timeout` seconds.
+    """
+
+    def __init__(self, reset_timeout=5.0):
+        self.reset_timeout = reset_timeout
+        self.opened_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def open(self):
+        with self._lock:
+            if self.opened_at is None:
+                self.opened_at = time.monotonic()
+                logger.warning("Database circuit breaker opened, failing fast until it recovers.")
+
+    def close(self):
+        with self._lock:
+            if self.opened_at is not None:
+                self.opened_at = None
+                logger.info("Database circuit breaker closed.")
+
+
+class BreakerTopologyListener(monitoring.TopologyListener):
+    """Keeps the breakers of a ConnectionManager in step with the servers the driver can reach.
+
+    The write breaker opens when the last writable server is lost and the read breaker when the
+    last server that the read preference allows is, so reads go on while a replica set elects
+    a new primary; each closes when such a server is back.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def opened(self, event):
+        pass
+
+    @staticmethod
+    def follow(breaker, available, was_available):
+        if available:
+            breaker.close()
+        elif was_available:
+            breaker.open()
+
+    def description_changed(self, event):
+        new, previous = event.new_description, event.previous_description
+        self.follow(self.manager.breaker, new.has_writable_server(), previous.has_writable_server())
+        # None stands for the primary, as in Database.reader, but the driver wants it spelled out.
+        preference = self.manager.read_preference or ReadPreference.PRIMARY
+        self.follow(
+            self.manager.read_breaker, new.has_readable_server(preference), previous.has_readable_server(preference)
+        )
+
+    def closed(self, event):
+        pass
+
+
+class ConnectionManager:
+    """Creates the MongoClient with the pool settings from Config and reconnects in the background.
+
+    With `background_reconnect`, a failed connect starts a thread that retries every URI with
+    exponential backoff while requests fail fast; without it, requests retry inline whenever
+    the breaker lets a trial call through. With `connect_in_background` the first connect
+    happens in that thread too, so creating the engine never waits for the server.
+
+    `breaker` guards writes and `read_breaker` the READS, which only need a server that
+    `read_preference` (the engine's; None for the primary) allows.
+    """
+
+    def __init__(self, client_options=None, breaker=None, background_reconnect=False,
+                 backoff_base=0.5, backoff_max=30.0, slow_queries=None, connect_in_background=False,
+                 read_preference=None):
+        self.breaker = breaker or CircuitBreaker()
+        self.read_breaker = CircuitBreaker(self.breaker.reset_timeout)
+        self.read_preference = read_preference
+        self.connect_in_background = connect_in_background
+        self.slow_queries = slow_queries
+        self.client_options = client_options or {}
+        self.background_reconnect = background_reconnect
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._reconnect_thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            client_options={
+                'maxPoolSize': config.get('MONGO_MAX_POOL_SIZE', 100),
+                'minPoolSize': config.get('MONGO_MIN_POOL_SIZE', 0),
+                'connectTimeoutMS': config.get('MONGO_CONNECT_TIMEOUT_MS', 20000),
+                'serverSelectionTimeoutMS': config.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000),
+            },
+            breaker=CircuitBreaker(config.get('DB_BREAKER_RESET_TIMEOUT', 5.0)),
+            background_reconnect=config.get('DB_BACKGROUND_RECONNECT', False),
+            connect_in_background=config.get('DB_CONNECT_IN_BACKGROUND', False),
+            backoff_max=config.get('DB_RECONNECT_BACKOFF_MAX', 30.0),
+            slow_queries=SlowQueryListener(
+                threshold_ms=config['SLOW_QUERY_MS'],
+                keep=config.get('SLOW_QUERY_KEEP', 20),
+                explain=config.get('DEBUG', False)
+            ) if config.get('SLOW_QUERY_MS') is not None else None,
+        )
+
+    def connect(self, uris, client_class):
+        """Try each URI once and return `(client, uri)` for the first that answers a ping."""
+        for uri in uris:
+            if not uri:
+                logger.warning("No valid URI found in the current attempt, trying the next option...")
+                continue
+            client = None
+            listeners = [BreakerTopologyListener(self)]
+            if self.slow_queries:
+                listeners.append(self.slow_queries)
+            try:
+                client = client_class(uri, event_listeners=listeners, **self.client_options)
+                client.admin.command('ping')
+                if self.slow_queries:
+                    self.slow_queries.client = client
+                self.breaker.close()
+                self.read_breaker.close()
+                return client, uri
+            except Exception as e:
+                logger.error(f"Failed to connect to MongoDB using URI: {uri} ({e}), trying the next option...")
+                if client:
+                    client.close()
+        self.breaker.open()
+        self.read_breaker.open()
+        return None, None
+
+    def after_fork(self):
+        """Forget the parent's connection state; threads and locks do not carry over a fork."""
+        self.breaker = CircuitBreaker(self.breaker.reset_timeout)
+        self.read_breaker = CircuitBreaker(self.breaker.reset_timeout)
+        self._reconnect_thread = None
+        if self.slow_queries:
+            self.slow_queries.client = None
+
+    def should_retry_inline(self):
+        return not self.background_reconnect and self.breaker.allow()
+
+    def reconnect_in_background(self, uris, client_class, on_connect, delay=None):
+        if self._reconnect_thread and self._reconnect_thread.is_alive():
+            return
+        self._reconnect_thread = threading.Thread(
+            target=self._reconnect, args=(uris, client_class, on_connect, delay), name="mongodb-reconnect", daemon=True
+        )
+        self._reconnect_thread.start()
+
+    def _reconnect(self, uris, client_class, on_connect, delay=None):
+        delay = self.backoff_base if delay is None else delay
+        while True:
+            time.sleep(delay)
+            client, uri = self.connect(uris, client_class)
+            if client:
+                on_connect(client, uri)
+                return
+            delay = min(max(delay * 2, self.backoff_base), self.backoff_max)
+            logger.info(f"Reconnecting to MongoDB in {delay:.1f}s.")
+
+
 def database_connection(func):
-    """Decorator to ensure database connection before operation."""
+    """Decorator to ensure database connection before operation.
+
+    While the database is unreachable the operation fails fast: reads are answered from the
+    cache when possible, everything else returns its FAILURE_RESULTS value, or raises
+    ConnectionFailure when called with `strict=True`. Either way the request is marked as
+    degraded, so that what it renders is not cached as if it were current.
+    """
+    @wraps(func)
     def wrapper(self, *args, **kwargs):
-        if not self.client:
-            self.initialize_db()
-            if not self.client:
-                logger.error("Operation failed: Database is not connected.")
-                return None if func.__name__ != 'update_document' else False
-        return func(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            breaker = self.connection.read_breaker if func.__name__ in READS else self.connection.breaker
+            if not self.client and self.connection.should_retry_inline():
+                self.initialize_db()
+            if self.client and (not breaker.is_open or breaker.allow()):
+                return func(self, *args, **kwargs)
+            logger.error(f"Operation {func.__name__} failed: Database is not connected.")
+            METRICS.db_errors.inc(func.__name__, 'unavailable')
+            if has_request_context():
+                g.database_degraded = True
+            if kwargs.get('strict'):
+                raise ConnectionFailure("Database is not connected.")
+            cached = self.cached_read(func.__name__, *args, **kwargs)
+            return cached if cached is not None else FAILURE_RESULTS.get(func.__name__)
+        finally:
+            METRICS.db_duration.observe(time.perf_counter() - start, func.__name__)
     return wrapper
+
+
+def degraded():
+    """Whether the current request got an answer that did not come from the database."""
+    return has_request_context() and g.get('database_degraded', False)
@@ -0,0 +1,38 @@
+"""Read-your-writes for users whose reads are served by secondaries.
+
+With MONGO_READ_PREFERENCE off the primary, each request runs in a causally consistent session
+of the storage engine. The session starts from the token kept in the Flask session, so its
+reads wait until the member that answers has caught up with the user's last write. Requests
+that may write (anything but GET and HEAD) store the new token back. The token holds the
+operation and cluster times, about a hundred bytes of the signed session cookie.
+"""
+from flask import current_app, request, session
+
+CAUSAL_TOKEN = 'causal'
+
+
+def start_causal_session():
+    current_app.db.start_causal_session(session.get(CAUSAL_TOKEN))
+
+
+def save_causal_token(response):
+    if request.method not in ('GET', 'HEAD'):
+        token = current_app.db.causal_token()
+        if token and token != session.get(CAUSAL_TOKEN):
+            session[CAUSAL_TOKEN] = token
+    # A streamed body still reads through the session after the view returns.
+    response.call_on_close(current_app.db.detach_causal_session())
+    return response
+
+
+def end_causal_session(exception=None):
+    # Ends the session if the request failed before it had a response; otherwise there is none left.
+    current_app.db.detach_causal_session()()
+
+
+def init_consistency(app):
+    if app.config.get('MONGO_READ_PREFERENCE', 'primary') == 'primary':
+        return
+    app.before_request(start_causal_session)
+    app.after_request(save_causal_token)
+    app.teardown_request(end_causal_session)
@@ -0,0 +1,56 @@
+import hashlib
+import inspect
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from utils.connection import degraded
+from utils.sessions import current_owner
+
+
+def collection_etag(collection_name):
+    """Compute the ETag of the current request from its path, the collection version and the user.
+
+    Task lists only show the tasks of their owner, so the same path differs from user to user.
+    """
+    version = current_app.db.collection_version(collection_name)
+    return hashlib.sha1(f"{version}:{current_owner()}:{request.full_path}".encode('utf-8')).hexdigest()[:20]
+
+
+def tag_response(rv, etag):
+    response = make_response(rv)
+    if degraded():
+        # Stale or empty while the database is down: a 304 later would keep it past the outage.
+        response.headers['Cache-Control'] = 'no-store'
+    elif response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        # Let the browser keep the fragment but revalidate it on every request.
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional(collection_name=None):
+    """Decorator to answer `If-None-Match` with 304 while the collection is unchanged.
+
+    The collection comes from the view's `collection` argument unless given explicitly.
+    Only the version counter is consulted, so a 304 never touches the database or the templates.
+    Works for sync and async views.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                etag = collection_etag(collection_name or kwargs['collection'])
+                if request.if_none_match.contains_weak(etag):
+                    return tag_response(current_app.response_class(status=304), etag)
+                return tag_response(await func(*args, **kwargs), etag)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = collection_etag(collection_name or kwargs['collection'])
+            if request.if_none_match.contains_weak(etag):
+                return tag_response(current_app.response_class(status=304), etag)
+            return tag_response(func(*args, **kwargs), etag)
+        return wrapper
+    return decorator
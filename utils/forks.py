@@ -0,0 +1,20 @@
+"""Rebuild per-process state in the children of a pre-fork server.
+
+Threads do not survive a fork and sockets must not be shared with the parent, so objects
+owning either register a method that runs in each child right after the fork. Only a weak
+reference is kept, so registering does not keep the object alive.
+"""
+import os
+import weakref
+
+
+def after_fork_in_child(method):
+    """Call the bound `method` in every process forked from this one, while its object is alive."""
+    method_ref = weakref.WeakMethod(method)
+
+    def hook():
+        bound = method_ref()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=hook)
@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, Undefined
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """LRU cache of rendered template fragments.
+
+    Templates call `fragment(template_name, key, **context)`. The fragment is rendered from
+    `context` alone (plus the Jinja globals), so `key` must name everything its output depends
+    on, such as `(doc._id, doc._rev)` for a document card. A key that is None or has an
+    undefined part, like a document without `_rev`, is rendered without caching.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    @staticmethod
+    def cacheable(key):
+        parts = key if isinstance(key, tuple) else (key,)
+        return key is not None and not any(isinstance(part, Undefined) for part in parts)
+
+    def render(self, template_name, key=None, **context):
+        if not self.cacheable(key):
+            with self._lock:
+                self.uncached += 1
+            return Markup(current_app.jinja_env.get_template(template_name).render(**context))
+
+        entry_key = (template_name, key)
+        with self._lock:
+            html = self._entries.get(entry_key)
+            if html is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = Markup(current_app.jinja_env.get_template(template_name).render(**context))
+        with self._lock:
+            self._entries[entry_key] = html
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncached': self.uncached,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'entries': len(self._entries),
+            }
+
+
+def init_template_caches(app):
+    """Give the app a fragment cache and, unless TEMPLATE_BYTECODE_CACHE is off, a bytecode cache on disk.
+
+    The bytecode cache lets new workers load compiled templates instead of compiling them again;
+    it has to be set before the first template is loaded. It lives in TEMPLATE_BYTECODE_DIR, by
+    default templates-cache in the instance folder, created readable by this user only.
+    """
+    app.fragments = FragmentCache(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 4096))
+    app.jinja_env.globals['fragment'] = app.fragments.render
+    if app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+        directory = app.config.get('TEMPLATE_BYTECODE_DIR') or os.path.join(app.instance_path, 'templates-cache')
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def compile_templates(app):
+    """Load every template once so that the bytecode cache holds all of them; returns how many."""
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
@@ -0,0 +1,41 @@
+"""Liveness and readiness endpoints, and the time to the first response.
+
+/health/live answers as soon as the process serves requests. /health/ready answers 503 until the
+storage engine can serve them, so that load balancers and orchestrators hold traffic back from a
+process that is still connecting, has lost its database, or could not build a unique index that
+its writes rely on (listed under `index_errors`).
+"""
+import os
+import time
+
+from flask import current_app, jsonify
+
+
+def live():
+    return jsonify(status='ok')
+
+
+def ready():
+    is_ready = current_app.db.ready()
+    body = {
+        'status': 'ready' if is_ready else 'starting',
+        'storage': current_app.config['STORAGE'],
+        'pid': os.getpid(),
+        'startup': current_app.startup,
+    }
+    index_errors = getattr(current_app.db, 'index_errors', None)
+    if index_errors:
+        body['index_errors'] = index_errors
+    return jsonify(body), 200 if is_ready else 503
+
+
+def init_health(app, process_started):
+    """Serve the health checks and record, once, how long after `process_started` the first response went out."""
+    app.add_url_rule('/health/live', 'health_live', live)
+    app.add_url_rule('/health/ready', 'health_ready', ready)
+
+    @app.after_request
+    def record_first_response(response):
+        if 'first_response_seconds' not in app.startup:
+            app.startup['first_response_seconds'] = round(time.perf_counter() - process_started, 6)
+        return response
@@ -0,0 +1,288 @@
+"""Push task changes to browsers as Server-Sent Events.
+
+One `ChangeFeed` per process watches a collection and fans every change out to the open
+`/<collection>/events` streams. The feed follows a MongoDB change stream when the server has one
+(replica sets and sharded clusters) and otherwise polls the engine's `read_changes`, which also
+serves the memory engine: each poll reads only what was written since the one before, a range of
+the `_updated_at` index on MongoDB, so an idle collection costs one index probe per poll.
+Each change is rendered once, with the fragment cache, whatever the number of subscribers, and
+sent to the subscribers who own the document: a stream only carries the tasks of the user who
+opened it. Deletions carry nothing but the `_id` and go to everyone.
+
+Fan-out is bounded both ways: at most LIVE_MAX_SUBSCRIBERS streams are open at once, and a
+subscriber that falls LIVE_QUEUE_SIZE events behind is dropped. Its stream then ends with a
+`reset` event, telling the page to reload the list and reconnect, so memory never grows
+with a slow client. A poll that finds more changes than that, as after an import, sends every
+subscriber a `reset` instead of rendering them one by one.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import Response, current_app, request, stream_with_context
+
+from storage import ANY_OWNER, resolve
+from utils.forks import after_fork_in_child
+from utils.sessions import current_owner
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHANGE_OPS = {'insert': 'created', 'update': 'updated', 'replace': 'updated', 'delete': 'deleted'}
+RESET = 'reset'
+# Changes a polling feed remembers, so that those read again by the next poll are not sent twice:
+# more than an engine re-reads from before the watermark (CHANGES_OVERLAP_LIMIT on MongoDB).
+RECENT_CHANGES = 2000
+
+
+class FeedFull(Exception):
+    """Raised when a process already streams to as many subscribers as it allows."""
+
+    def __init__(self, retry_after=5):
+        super().__init__("Too many live subscribers.")
+        self.retry_after = retry_after
+
+
+def sse_message(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in str(data).splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+
+def change_event(change):
+    """Translate a change stream document into `(event, _id, document)`, or None for other operations."""
+    event = CHANGE_OPS.get(change.get('operationType'))
+    if not event:
+        return None
+    document = change.get('fullDocument')
+    if event == 'updated' and document is None:
+        # Deleted before the update could be looked up; a delete event follows.
+        return None
+    return event, change['documentKey']['_id'], document
+
+
+class Subscription:
+    def __init__(self, max_queue, owner=ANY_OWNER):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.owner = owner
+        self.dropped = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def messages(self, heartbeat):
+        """Yield queued messages, a comment line every `heartbeat` seconds of silence, and `None` once dropped."""
+        while True:
+            try:
+                yield self.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+            if self.dropped and self.queue.empty():
+                yield None
+                return
+
+
+class ChangeFeed:
+    """Watch one collection in a background thread that runs only while somebody subscribes."""
+
+    def __init__(self, app, collection_name='tasks', max_subscribers=100, max_queue=64, poll_interval=1.0):
+        self.app = app
+        self.collection_name = collection_name
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.start()
+        after_fork_in_child(self.start)
+        self.published = 0
+        self.dropped = 0
+        self.mode = None
+
+    def start(self):
+        # Also run in forked children: the watcher thread and the subscribers stay with the parent.
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Event ids are unique to this feed and process, so a client reconnecting with an id
+        # from before a restart, or from another worker, knows it may have missed changes.
+        self._epoch = uuid.uuid4().hex[:8]
+        self._sequence = itertools.count(1)
+        self.last_event_id = None
+
+    @classmethod
+    def from_config(cls, app, collection_name='tasks'):
+        config = app.config
+        return cls(
+            app,
+            collection_name,
+            max_subscribers=config.get('LIVE_MAX_SUBSCRIBERS', 100),
+            max_queue=config.get('LIVE_QUEUE_SIZE', 64),
+            poll_interval=config.get('LIVE_POLL_INTERVAL', 1.0)
+        )
+
+    def subscribe(self, owner=ANY_OWNER):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise FeedFull()
+            subscription = Subscription(self.max_queue, owner)
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"live-{self.collection_name}", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def watching(self):
+        with self._lock:
+            if self._subscribers:
+                return True
+            self._thread = None
+            return False
+
+    def publish(self, event, _id, document=None):
+        """Render a change once and queue it for its owner's subscribers, dropping those whose queue is full."""
+        owner = ANY_OWNER
+        if event == 'deleted':
+            data = str(_id)
+        else:
+            owner = document.get('owner')
+            with self.app.app_context():
+                data = self.app.fragments.render(
+                    f"{self.collection_name}/card.html", (document['_id'], document.get('_rev')), doc=document
+                )
+        self.last_event_id = f"{self._epoch}-{next(self._sequence)}"
+        self.broadcast(sse_message(event, data, self.last_event_id), owner)
+        self.published += 1
+
+    def broadcast(self, message, owner=ANY_OWNER):
+        with self._lock:
+            subscribers = [
+                subscription for subscription in self._subscribers
+                if owner is ANY_OWNER or subscription.owner is ANY_OWNER or subscription.owner == owner
+            ]
+        for subscription in subscribers:
+            if not subscription.put(message):
+                self.dropped += 1
+                self.unsubscribe(subscription)
+
+    def _run(self):
+        db = self.app.db
+        resume_token = None
+        while self.watching():
+            try:
+                stream = db.watch_changes(self.collection_name, resume_after=resume_token)
+            except Exception as e:
+                logger.warning(f"Cannot open a change stream on {self.collection_name}, retrying: {e}")
+                if resume_token:
+                    # The changes since the token may be gone; start afresh and have every page reload.
+                    resume_token = None
+                    self.broadcast(sse_message(RESET, ''))
+                time.sleep(self.poll_interval)
+                continue
+            if stream is None:
+                self.mode = 'poll'
+                self._poll(db)
+                return
+            self.mode = 'change_stream'
+            try:
+                with stream:
+                    while self.watching():
+                        change = stream.try_next()
+                        event = change_event(change) if change else None
+                        if event:
+                            self.publish(*event)
+                        resume_token = stream.resume_token
+            except Exception as e:
+                logger.warning(f"Change stream on {self.collection_name} interrupted, reopening: {e}")
+                time.sleep(self.poll_interval)
+
+    def _poll(self, db):
+        watermark, started = None, False
+        recent = OrderedDict()
+        while self.watching():
+            try:
+                result = resolve(db.read_changes(self.collection_name, watermark, self.max_queue))
+            except Exception as e:
+                logger.warning(f"Polling {self.collection_name} for changes failed: {e}")
+                result = None
+            if result is not None:
+                changes, watermark = result
+                if changes is None:
+                    # More than a subscriber can queue: reloading the list is cheaper than streaming them.
+                    self.broadcast(sse_message(RESET, ''))
+                else:
+                    # The first poll only finds where to start.
+                    self.publish_new(changes, recent, publish=started)
+                started = True
+            time.sleep(self.poll_interval)
+
+    def publish_new(self, changes, recent, publish=True):
+        """Publish the changes not in `recent`, which remembers them by `_id` and `_rev`."""
+        for event, _id, document in changes:
+            key = (_id, document.get('_rev') if document else None)
+            if key in recent:
+                continue
+            recent[key] = True
+            if len(recent) > RECENT_CHANGES:
+                recent.popitem(last=False)
+            if publish:
+                self.publish(event, _id, document)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            'subscribers': subscribers,
+            'published': self.published,
+            'dropped': self.dropped,
+        }
+
+
+def events_view(collection):
+    """Stream the changes of a collection; a client that may have missed some first gets a `reset`."""
+    feed = current_app.feeds.get(collection)
+    if not feed:
+        return f"Collection {collection} has no live updates.", 404
+    try:
+        subscription = feed.subscribe(owner=current_owner())
+    except FeedFull as e:
+        return "Too many live connections, please try again.", 503, {'Retry-After': str(e.retry_after)}
+    heartbeat = current_app.config.get('LIVE_HEARTBEAT', 15)
+    last_seen = request.headers.get('Last-Event-ID')
+
+    def stream():
+        try:
+            yield f"retry: {int(current_app.config.get('LIVE_RETRY_MS', 3000))}\n\n"
+            if last_seen and last_seen != feed.last_event_id:
+                yield sse_message(RESET, '')
+            for message in subscription.messages(heartbeat):
+                if message is None:
+                    yield sse_message(RESET, '')
+                    return
+                yield message
+        finally:
+            feed.unsubscribe(subscription)
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep proxies such as nginx from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def init_live_updates(app):
+    app.feeds = {'tasks': ChangeFeed.from_config(app, 'tasks')}
+    app.add_url_rule('/<string:collection>/events', 'events', events_view)
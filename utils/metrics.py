@@ -0,0 +1,173 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, before_render_template, current_app, g, request, template_rendered
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observing is one bisect and a few additions under a lock."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def count(self, *labels):
+        counts = self._values.get(labels)
+        return sum(counts[0]) if counts else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    label_text = format_labels(self.labelnames, labels, [('le', bound)])
+                    lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+                label_text = format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {total}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Every metric the app exports; one registry per process."""
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time spent handling a request.', ('method', 'route', 'status'))
+        self.response_size = Histogram(
+            'http_response_size_bytes', 'Size of response bodies.', ('route',), buckets=SIZE_BUCKETS)
+        self.render_duration = Histogram(
+            'template_render_duration_seconds', 'Time spent rendering a template.', ('template',))
+        self.db_duration = Histogram(
+            'db_operation_duration_seconds', 'Time spent in a storage engine operation.', ('operation',))
+        self.db_errors = Counter(
+            'db_operation_errors_total', 'Storage engine operations that failed.', ('operation', 'reason'))
+        self.requests_shed = Counter(
+            'http_requests_shed_total', 'Requests refused by admission control or rate limits.', ('route', 'reason'))
+
+    def render(self, gauges=()):
+        lines = []
+        for metric in (self.request_duration, self.response_size, self.render_duration,
+                       self.db_duration, self.db_errors, self.requests_shed):
+            lines.extend(metric.render())
+        for name, documentation, value in gauges:
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def stats_gauges(prefix, stats):
+    return [
+        (f"{prefix}_{key}", f"{prefix.replace('_', ' ').capitalize()} {key.replace('_', ' ')}.", value)
+        for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    METRICS.request_duration.observe(
+        time.perf_counter() - started, request.method, route, str(response.status_code))
+    # Streamed bodies have no length up front and are left out.
+    if response.content_length is not None:
+        METRICS.response_size.observe(response.content_length, route)
+    return response
+
+
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+
+def record_render(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        METRICS.render_duration.observe(time.perf_counter() - started.pop(), template.name or 'string')
+
+
+def metrics_view():
+    gauges = stats_gauges('cache', current_app.db.cache.stats())
+    hasher = getattr(current_app, 'hasher', None)
+    if hasher:
+        gauges += stats_gauges('password_hasher', hasher.stats())
+    fragments = getattr(current_app, 'fragments', None)
+    if fragments:
+        gauges += stats_gauges('fragment_cache', fragments.stats())
+    for collection_name, feed in getattr(current_app, 'feeds', {}).items():
+        gauges += stats_gauges(f'live_{collection_name}', feed.stats())
+    admission = getattr(current_app, 'admission', None)
+    if admission:
+        gauges += stats_gauges('admission', admission.stats())
+    gauges += stats_gauges('startup', getattr(current_app, 'startup', {}))
+    return Response(METRICS.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """Time every request and template of the app and serve the registry at /metrics."""
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(record_render, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,107 @@
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from utils.forks import after_fork_in_child
+
+
+class HasherBusy(Exception):
+    """Raised when the password hashing queue is full; the request should be retried later."""
+
+    retry_after = 1
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small bounded thread pool.
+
+    Hashing is deliberately slow, so a burst of logins must not take every request worker.
+    At most `workers` hashes run at once and `max_queue` more may wait; past that `submit`
+    raises HasherBusy right away instead of queueing without bound.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_queue=16):
+        self.rounds = rounds
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.rejected = 0
+        self.latencies = deque(maxlen=1024)
+        self.start()
+        after_fork_in_child(self.start)
+
+    def start(self):
+        """Create the thread pool; run again in forked children, where the parent's threads are gone."""
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            rounds=config.get('BCRYPT_ROUNDS', 12),
+            workers=config.get('BCRYPT_WORKERS', 2),
+            max_queue=config.get('BCRYPT_MAX_QUEUE', 16)
+        )
+
+    def submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy("Too many password checks in progress.")
+        with self._lock:
+            self.in_flight += 1
+        return self._executor.submit(self._timed, func, *args)
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    @staticmethod
+    def _verify(password, hashed):
+        return bcrypt.checkpw(password.encode('utf-8'), hashed)
+
+    def hash(self, password):
+        return self.submit(self._hash, password).result()
+
+    def verify(self, password, hashed):
+        return self.submit(self._verify, password, hashed).result()
+
+    async def hash_async(self, password):
+        return await asyncio.wrap_future(self.submit(self._hash, password))
+
+    async def verify_async(self, password, hashed):
+        return await asyncio.wrap_future(self.submit(self._verify, password, hashed))
+
+    def needs_rehash(self, hashed):
+        """Whether a stored hash was made with a different cost than the configured one."""
+        # bcrypt hashes look like $2b$<cost>$<salt and checksum>.
+        return int(hashed.split(b'$')[2]) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'rounds': self.rounds,
+                'in_flight': self.in_flight,
+                'capacity': self.capacity,
+                'rejected': self.rejected,
+                'latency_samples': len(latencies),
+            }
+        if latencies:
+            stats['latency_p50'] = statistics.median(latencies)
+            stats['latency_p95'] = latencies[int(0.95 * (len(latencies) - 1))]
+        return stats
@@ -0,0 +1,68 @@
+"""Who a request is for: the signed-in user, or else the browser that sent it.
+
+A visitor who has not signed in gets a random id in the session cookie the first time one is
+needed, so that what they create stays theirs instead of being shared by every signed-out
+visitor. The cookie then lasts GUEST_LIFETIME_DAYS after their last visit, and their tasks as
+long after their last change, when `flask expire-guests` deletes them. Signing in or up hands
+the tasks to the user; signing out clears the id with the rest of the session.
+
+The cookie is signed with SECRET_KEY, so guests only keep their tasks across restarts and
+workers if it stays the same: without one in the environment, `init_sessions` keeps one in the
+instance folder.
+"""
+import os
+import secrets
+from datetime import timedelta
+
+from flask import session
+
+from storage import GUEST_PREFIX
+
+BROWSER_ID = 'browser_id'
+SECRET_KEY_FILE = 'secret_key'
+
+
+def browser_id():
+    """A random id of this browser, kept in its session cookie from the first request that asks."""
+    if BROWSER_ID not in session:
+        session[BROWSER_ID] = secrets.token_hex(16)
+        session.permanent = True
+    return session[BROWSER_ID]
+
+
+def current_owner():
+    """The owner of the tasks a request works on: the signed-in user, or a guest of this browser's own."""
+    return session.get('user_id') or f"{GUEST_PREFIX}{browser_id()}"
+
+
+def sign_in(user_id, username):
+    """Start the session of a user; returns the guest owner whose tasks are now theirs, or None."""
+    guest = session.pop(BROWSER_ID, None)
+    session['user_id'] = user_id
+    session['username'] = username
+    return f"{GUEST_PREFIX}{guest}" if guest else None
+
+
+def instance_secret_key(instance_path):
+    """Read the secret key kept in the instance folder, creating it if this is the first process to ask."""
+    os.makedirs(instance_path, mode=0o700, exist_ok=True)
+    path = os.path.join(instance_path, SECRET_KEY_FILE)
+    if not os.path.exists(path):
+        draft = f"{path}.{os.getpid()}"
+        with open(os.open(draft, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as key_file:
+            key_file.write(secrets.token_hex(32))
+        try:
+            # Every worker starting at once writes a draft; the first one linked is the key of all.
+            os.link(draft, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(draft)
+    with open(path) as key_file:
+        return key_file.read().strip()
+
+
+def init_sessions(app):
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = instance_secret_key(app.instance_path)
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=app.config['GUEST_LIFETIME_DAYS'])
@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, current_app, jsonify
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Commands that take a filter worth explaining, and where that filter sits in the command.
+QUERY_COMMANDS = {
+    'find': lambda command: command.get('filter', {}),
+    'count': lambda command: command.get('query', {}),
+    'distinct': lambda command: command.get('query', {}),
+    'findAndModify': lambda command: command.get('query', {}),
+    'update': lambda command: command['updates'][0].get('q', {}) if command.get('updates') else {},
+    'delete': lambda command: command['deletes'][0].get('q', {}) if command.get('deletes') else {},
+    'aggregate': lambda command: next(
+        (stage['$match'] for stage in command.get('pipeline', []) if '$match' in stage), {}),
+}
+
+
+def query_shape(value):
+    """Replace the values of a filter by '?' and keep its fields and operators."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(item) for item in value[:1]]
+    return '?'
+
+
+def plan_stages(plan):
+    stages = [plan.get('stage')]
+    for child in plan.get('inputStages', []) + [plan.get('inputStage', {})]:
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Logs commands slower than `threshold_ms` with the shape of their filter.
+
+    The `keep` slowest are kept for the debug endpoint. With `explain`, every slow query is
+    explained on a background thread and flagged when its winning plan scans the collection.
+    """
+
+    def __init__(self, threshold_ms=100, keep=20, explain=False):
+        self.threshold_ms = threshold_ms
+        self.keep = keep
+        self.explain = explain
+        self.client = None
+        self._started = {}
+        self._worst = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain") if explain else None
+
+    def started(self, event):
+        if event.command_name in QUERY_COMMANDS:
+            with self._lock:
+                self._started[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < self.threshold_ms:
+            return
+        database_name, command = started
+        filter_ = QUERY_COMMANDS[event.command_name](command)
+        entry = {
+            'command': event.command_name,
+            'collection': command.get(event.command_name),
+            'shape': json.dumps(query_shape(filter_), sort_keys=True, default=str),
+            'duration_ms': duration_ms,
+            'at': time.time(),
+            'plan': None,
+        }
+        logger.warning(f"Slow {entry['command']} on {entry['collection']} took {duration_ms:.1f} ms: {entry['shape']}")
+        self.record(entry)
+        if self._explainer and self.client:
+            self._explainer.submit(self.explain_query, database_name, event.command_name, command, entry)
+
+    def failed(self, event):
+        with self._lock:
+            self._started.pop((event.connection_id, event.request_id), None)
+
+    def record(self, entry):
+        with self._lock:
+            item = (entry['duration_ms'], next(self._sequence), entry)
+            if len(self._worst) < self.keep:
+                heapq.heappush(self._worst, item)
+            else:
+                heapq.heappushpop(self._worst, item)
+
+    def explain_query(self, database_name, command_name, command, entry):
+        explained = {key: value for key, value in command.items() if key not in ('lsid', '$db', '$clusterTime')}
+        try:
+            result = self.client[database_name].command('explain', explained, verbosity='queryPlanner')
+        except PyMongoError as e:
+            logger.error(f"Error explaining slow {command_name}: {e}")
+            return
+        stages = plan_stages(result.get('queryPlanner', {}).get('winningPlan', {}))
+        entry['plan'] = 'COLLSCAN' if 'COLLSCAN' in stages else '>'.join(stage for stage in stages if stage)
+        if entry['plan'] == 'COLLSCAN':
+            logger.warning(f"Slow {command_name} on {entry['collection']} scans the whole collection: {entry['shape']}")
+
+    def worst(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._worst, key=lambda item: item[0], reverse=True)]
+
+
+def slow_queries_view():
+    listener = getattr(getattr(current_app.db, 'connection', None), 'slow_queries', None)
+    if not current_app.debug:
+        abort(404)
+    return jsonify(listener.worst() if listener else [])
+
+
+def init_slow_query_log(app):
+    """Serve the slowest queries at /debug/slow-queries, in debug mode only."""
+    app.add_url_rule('/debug/slow-queries', 'slow_queries', slow_queries_view)
@@ -0,0 +1,60 @@
+"""Streamed template responses.
+
+`stream_page(template_name, **context)` renders a template chunk by chunk as the client reads
+it, so the first bytes go out before the last document is read. Pass documents as
+`Peekable(db.iter_documents(...))`: templates can test it like a list (`{% if documents %}`),
+before or after looping over it, and it is never read more than one document ahead.
+"""
+import itertools
+
+from flask import current_app, stream_template
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+class Peekable:
+    """Iterate an iterator once, while templates test it like a list: true when it has any item."""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._peeked = []
+        self._any = None
+
+    def __bool__(self):
+        if self._any is None:
+            self._peeked = list(itertools.islice(self._iterator, 1))
+            self._any = bool(self._peeked)
+        return self._any
+
+    def __iter__(self):
+        peeked, self._peeked = self._peeked, []
+        for item in itertools.chain(peeked, self._iterator):
+            self._any = True
+            yield item
+        if self._any is None:
+            self._any = False
+
+
+def buffered(chunks, size):
+    """Join the many small strings Jinja yields into chunks of about `size` characters.
+
+    The first chunk goes out as soon as it is ready, so the client starts on the page at once.
+    """
+    buffer, length, first = [], 0, True
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if first or length >= size:
+            yield ''.join(buffer)
+            buffer, length, first = [], 0, False
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    size = current_app.config.get('STREAM_CHUNK_SIZE', STREAM_CHUNK_SIZE)
+    response = current_app.response_class(buffered(stream_template(template_name, **context), size),
+                                          mimetype='text/html')
+    # Proxies such as nginx would otherwise hold the chunks back until the end.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,164 @@
+"""Export a collection as NDJSON and import it back, in constant memory.
+
+Each line is one document in MongoDB relaxed Extended JSON, so ObjectIds and dates survive
+the round trip. Exports stream from a batched cursor (`iter_documents`), gzipped on the fly
+for `.ndjson.gz`; imports read the body or file line by line and insert IMPORT_BATCH_SIZE
+documents at a time with `import_documents`. Only one batch is ever held in memory.
+
+Documents already present are skipped, so an interrupted import is resumed by running it
+again from its checkpoint: the number of lines fully imported, reported after every batch
+(`skip=` for the endpoint, `--checkpoint` for `flask import-collection`).
+
+An export that cannot read the collection to the end fails loudly: the command exits non-zero
+and the endpoint breaks off the response without its final chunk, so a client never takes a
+truncated export for a whole one.
+
+The endpoints expose every field, password hashes included, so they only exist when
+TRANSFER_TOKEN is set and expect it as a bearer token.
+"""
+import gzip
+import hmac
+import logging
+import time
+
+from bson import json_util
+from flask import Response, current_app, jsonify, request, stream_with_context
+from pymongo.errors import PyMongoError
+
+from storage import resolve
+from utils.compression import gzip_stream
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMATS = {'ndjson': 'application/x-ndjson', 'ndjson.gz': 'application/gzip'}
+# Derived from the searchable field and rebuilt on import.
+DERIVED_FIELDS = ('_terms',)
+
+
+class ImportFailed(Exception):
+    """Raised when a line cannot be parsed or a batch cannot be written; `resume_from` is the checkpoint."""
+
+    def __init__(self, message, resume_from, status=400):
+        super().__init__(message)
+        self.resume_from = resume_from
+        self.status = status
+
+
+class ExportFailed(Exception):
+    """Raised when the collection cannot be read to the end; the lines already written are incomplete."""
+
+
+def throughput(stats, started):
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['per_second'] = round(stats['documents'] / stats['seconds'], 1) if stats['seconds'] else None
+    return stats
+
+
+def export_lines(db, collection_name, batch_size, stats=None):
+    """Yield one NDJSON line per document; `stats` is filled in as the export goes.
+
+    Raises ExportFailed if the database fails before the last document, rather than ending
+    as if the collection were complete.
+    """
+    stats = stats if stats is not None else {}
+    stats['documents'] = 0
+    started = time.perf_counter()
+    try:
+        for document in db.iter_documents(collection_name, batch_size=batch_size, strict=True):
+            for field in DERIVED_FIELDS:
+                document.pop(field, None)
+            yield json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS) + '\n'
+            stats['documents'] += 1
+    except PyMongoError as e:
+        logger.error(f"Exporting {collection_name} failed after {stats['documents']} documents: {e}")
+        raise ExportFailed(f"Reading {collection_name} failed after {stats['documents']} documents: {e}") from e
+    throughput(stats, started)
+    logger.info(f"Exported {collection_name}: {stats}")
+
+
+def import_lines(db, collection_name, lines, batch_size, skip=0, on_checkpoint=None):
+    """Insert the documents of NDJSON lines in batches, after skipping the first `skip` lines.
+
+    `on_checkpoint(line_count)` is called after every batch. Returns the stats of the import;
+    raises ImportFailed, with the checkpoint to resume from, on a bad line or a failed batch.
+    """
+    stats = {'documents': 0, 'inserted': 0, 'skipped': 0, 'lines': skip}
+    started = time.perf_counter()
+    batch, line_count = [], 0
+
+    def flush():
+        result = resolve(db.import_documents(collection_name, batch)) if batch else (0, 0)
+        if result is None:
+            raise ImportFailed(f"Writing the batch ending at line {line_count} failed.", stats['lines'], 503)
+        stats['inserted'] += result[0]
+        stats['skipped'] += result[1]
+        stats['documents'] += len(batch)
+        stats['lines'] = line_count
+        batch.clear()
+        if on_checkpoint:
+            on_checkpoint(line_count)
+
+    try:
+        for line_count, line in enumerate(lines, 1):
+            if line_count <= skip or not line.strip():
+                continue
+            try:
+                batch.append(json_util.loads(line))
+            except ValueError as e:
+                raise ImportFailed(f"Line {line_count} is not a JSON document: {e}", stats['lines']) from e
+            if len(batch) >= batch_size:
+                flush()
+    except (OSError, EOFError) as e:
+        # A truncated or corrupt gzip body, or a file that cannot be read any further.
+        raise ImportFailed(f"Reading after line {line_count} failed: {e}", stats['lines']) from e
+    flush()
+    throughput(stats, started)
+    logger.info(f"Imported {collection_name}: {stats}")
+    return stats
+
+
+def authorized():
+    """Whether the request carries TRANSFER_TOKEN, which the views exposing every user's data require."""
+    token = current_app.config.get('TRANSFER_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+
+def export_view(collection):
+    if not authorized():
+        return "Not found.", 404
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in FORMATS:
+        return f"Unknown format {export_format}; use one of {', '.join(FORMATS)}.", 400
+    lines = export_lines(current_app.db, collection, current_app.config.get('EXPORT_BATCH_SIZE', 1000))
+    chunks = (line.encode() for line in lines)
+    if export_format == 'ndjson.gz':
+        chunks = gzip_stream(chunks, current_app.config.get('COMPRESS_LEVEL', 6))
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{collection}.{export_format}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def import_view(collection):
+    if not authorized():
+        return "Not found.", 404
+    try:
+        skip = max(int(request.args.get('skip', 0)), 0)
+    except ValueError:
+        return "skip must be a number of lines.", 400
+    body = request.stream
+    if request.mimetype == 'application/gzip' or request.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.GzipFile(fileobj=body, mode='rb')
+    try:
+        stats = import_lines(current_app.db, collection, body, current_app.config.get('IMPORT_BATCH_SIZE', 1000), skip)
+    except ImportFailed as e:
+        logger.error(f"Importing into {collection} failed: {e}")
+        return jsonify(error=str(e), resume_from=e.resume_from), e.status
+    return jsonify(stats)
+
+
+def init_transfer(app):
+    app.add_url_rule('/<string:collection>/export', 'export_collection', export_view)
+    app.add_url_rule('/<string:collection>/import', 'import_collection', import_view, methods=['POST'])
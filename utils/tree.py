@@ -1,83 +1,238 @@
-import fnmatch
+"""Print the project tree, leaving out what .gitignore ignores.
+
+    python utils/tree.py [root] [--style indent|tree] [--json] [--output file_tree.log]
+
+The tree is walked with `os.scandir` and an explicit stack, so each entry costs one directory
+read and no extra `stat` calls, and deep trees cannot exhaust the recursion limit. The
+patterns of every .gitignore met on the way are compiled into one regular expression per file,
+with git's rules: the last matching pattern wins, `!` re-includes, a slash anchors a pattern
+to its .gitignore's directory and a trailing slash matches directories only. Ignored
+directories are not entered at all. Symlinked directories are listed but not followed.
+"""
+import argparse
+import json
 import os
+import re
+import sys
+from collections import namedtuple
 from pathlib import Path
 
-
-def read_gitignore(root_directory):
-    gitignore_path = os.path.join(root_directory, '.gitignore')
-    if os.path.isfile(gitignore_path):
-        with open(gitignore_path, 'r') as gitignore_file:
-            patterns = [line.strip() for line in gitignore_file if line.strip() and not line.startswith('#')]
-            directory_patterns = [pattern for pattern in patterns if pattern.endswith('/')]
-            file_patterns = [pattern for pattern in patterns if not pattern.endswith('/')]
-            return directory_patterns, file_patterns
-    return [], []
-
-
-def should_ignore(path, directory_patterns, file_patterns, ignore_git_folder):
-    if ignore_git_folder and '.git' in path.split(os.sep):
-        return True
-    for pattern in directory_patterns:
-        if path.endswith('/') and fnmatch.fnmatch(path, pattern):
-            return True
-    for pattern in file_patterns:
-        if not path.endswith('/') and fnmatch.fnmatch(path, pattern):
-            return True
+TreeEntry = namedtuple('TreeEntry', 'path relative_path depth is_dir')
+
+
+def translate_glob(glob):
+    """Translate a gitignore glob into a regular expression over '/'-separated paths."""
+    parts, index = [], 0
+    while index < len(glob):
+        at_segment_start = index == 0 or glob[index - 1] == '/'
+        if glob.startswith('**/', index) and at_segment_start:
+            parts.append('(?:.*/)?')
+            index += 3
+        elif glob.startswith('/**', index) and index + 3 == len(glob):
+            # Everything inside, but not the directory itself.
+            parts.append('/.+')
+            index += 3
+        elif glob == '**':
+            parts.append('.*')
+            index += 2
+        elif glob[index] == '*':
+            parts.append('[^/]*')
+            index += 1
+        elif glob[index] == '?':
+            parts.append('[^/]')
+            index += 1
+        elif glob[index] == '[' and ']' in glob[index + 2:]:
+            end = glob.index(']', index + 2)
+            members = glob[index + 1:end].replace('\\', '\\\\').replace('[', '\\[')
+            if members.startswith('!'):
+                members = '^' + members[1:]
+            parts.append(f"[{members}]")
+            index = end + 1
+        elif glob[index] == '\\' and index + 1 < len(glob):
+            parts.append(re.escape(glob[index + 1]))
+            index += 2
+        else:
+            parts.append(re.escape(glob[index]))
+            index += 1
+    return ''.join(parts)
+
+
+def compile_alternatives(patterns):
+    """One regular expression for `(regex, negated)` patterns, and which alternatives are negations.
+
+    The alternatives are in reverse file order, so the one that matches is the last matching
+    pattern, which git says decides.
+    """
+    patterns = patterns[::-1]
+    if not patterns:
+        return None, []
+    expression = re.compile('|'.join(f'({regex})' for regex, _ in patterns))
+    return expression, [negated for _, negated in patterns]
+
+
+class IgnoreMatcher:
+    """The patterns of one .gitignore, compiled into a single regular expression per kind of entry.
+
+    Paths are relative to the .gitignore's directory and '/'-separated. Directories are matched
+    against every pattern, files against those without a trailing slash.
+    """
+
+    def __init__(self, lines):
+        patterns = []
+        for line in lines:
+            line = line.rstrip('\n')
+            # Trailing spaces are ignored unless escaped.
+            line = re.sub(r'(?<!\\) +$', '', line)
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated or line.startswith(('\\!', '\\#')):
+                line = line[1:]
+            directory_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            # A slash at the start or in the middle anchors the pattern; otherwise it matches at any depth.
+            prefix = '' if '/' in line else '(?:.*/)?'
+            patterns.append((f"{prefix}{translate_glob(line.lstrip('/'))}", negated, directory_only))
+        self._directories = compile_alternatives([(regex, negated) for regex, negated, _ in patterns])
+        self._files = compile_alternatives([(regex, negated) for regex, negated, only in patterns if not only])
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path, encoding='utf-8') as gitignore_file:
+                return cls(gitignore_file)
+        except OSError:
+            return None
+
+    def match(self, relative_path, is_dir=False):
+        """True if the path is ignored, False if a `!` pattern re-includes it, None if no pattern matches."""
+        expression, negated = self._directories if is_dir else self._files
+        found = expression.fullmatch(relative_path) if expression else None
+        if not found:
+            return None
+        return not negated[found.lastindex - 1]
+
+
+def is_ignored(relative_path, is_dir, matchers):
+    """Ask the .gitignore files from the deepest to the root; the first that matches decides."""
+    for base, matcher in reversed(matchers):
+        decision = matcher.match(relative_path[len(base):], is_dir)
+        if decision is not None:
+            return decision
     return False
 
 
-def print_file_tree(current_directory,
-                    root_directory,
-                    directory_patterns, file_patterns,
-                    output_style='indent',
-                    indent_level=0,
-                    write_to_file=False,
-                    log_file_path=None,
-                    ignore_git_folder=True):
-
-    prefix = '    ' * indent_level if output_style == 'indent' else '|   ' * indent_level + '|-- ' if indent_level > 0 else ''
-
-    for item in os.listdir(current_directory):
-        path = os.path.join(current_directory, item)
-        relative_path = os.path.relpath(path, root_directory) + ('/' if os.path.isdir(path) else '')
-
-        if should_ignore(relative_path, directory_patterns, file_patterns, ignore_git_folder):
+def read_gitignore(root_directory):
+    return IgnoreMatcher.from_file(os.path.join(root_directory, '.gitignore'))
+
+
+def walk_tree(root_directory, ignore_git_folder=True, use_gitignore=True):
+    """Yield a TreeEntry for every file and directory under the root that is not ignored, depth first.
+
+    Entries of a directory come in name order, each directory right before its contents.
+    """
+    root_directory = os.path.abspath(root_directory)
+    root_matchers = []
+    if use_gitignore:
+        matcher = read_gitignore(root_directory)
+        if matcher:
+            root_matchers.append(('', matcher))
+    # Each frame holds a directory's entries still to visit, reversed, and the .gitignore files that apply.
+    stack = [(list_directory(root_directory, '', 0, root_matchers, ignore_git_folder), root_matchers)]
+    while stack:
+        entries, matchers = stack[-1]
+        if not entries:
+            stack.pop()
             continue
-
-        masked_path = path.replace(root_directory, "~", 1) if output_style == 'indent' else path.replace(root_directory,
-                                                                                                         '.', 1)
-        output_line = f"{prefix}{masked_path}"
-
-        if write_to_file:
-            print(f"Logging {output_line} to {log_file_path}")
-            with open(log_file_path, 'a') as log_file:
-                log_file.write(output_line + '\n')
-        else:
-            print(output_line)
-
-        if os.path.isdir(path):
-            print_file_tree(path, root_directory, directory_patterns, file_patterns, output_style,
-                            indent_level + 1, write_to_file, log_file_path, ignore_git_folder)
+        entry = entries.pop()
+        yield entry
+        if entry.is_dir:
+            child_matchers = matchers
+            if use_gitignore:
+                matcher = IgnoreMatcher.from_file(os.path.join(entry.path, '.gitignore'))
+                if matcher:
+                    child_matchers = matchers + [(entry.relative_path + '/', matcher)]
+            stack.append((list_directory(entry.path, entry.relative_path + '/', entry.depth + 1, child_matchers,
+                                         ignore_git_folder), child_matchers))
+
+
+def list_directory(path, prefix, depth, matchers, ignore_git_folder):
+    entries = []
+    try:
+        with os.scandir(path) as scanned:
+            for item in scanned:
+                if ignore_git_folder and item.name == '.git':
+                    continue
+                try:
+                    is_dir = item.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                item_relative_path = prefix + item.name
+                if not is_ignored(item_relative_path, is_dir, matchers):
+                    entries.append(TreeEntry(item.path, item_relative_path, depth, is_dir))
+    except OSError as e:
+        print(f"Cannot read {path}: {e}", file=sys.stderr)
+    entries.sort(key=lambda entry: entry.relative_path, reverse=True)
+    return entries
+
+
+def format_entry(entry, root_directory, output_style='indent'):
+    if output_style == 'indent':
+        return f"{'    ' * entry.depth}{entry.path.replace(root_directory, '~', 1)}"
+    prefix = '|   ' * entry.depth + '|-- ' if entry.depth > 0 else ''
+    return f"{prefix}{entry.path.replace(root_directory, '.', 1)}"
+
+
+def tree_as_json(entries):
+    """Nest the entries into `{'name', 'type', 'children'}` objects under a root list."""
+    root = []
+    parents = [root]
+    for entry in entries:
+        del parents[entry.depth + 1:]
+        node = {'name': os.path.basename(entry.path), 'type': 'directory' if entry.is_dir else 'file'}
+        parents[entry.depth].append(node)
+        if entry.is_dir:
+            node['children'] = []
+            parents.append(node['children'])
+    return root
+
+
+def write_tree(output, root_directory, output_style='indent', as_json=False, **walk_options):
+    """Write the tree to one open text handle; returns the number of entries written."""
+    root_directory = os.path.abspath(root_directory)
+    entries = walk_tree(root_directory, **walk_options)
+    if as_json:
+        entries = list(entries)
+        json.dump(tree_as_json(entries), output, indent=2)
+        output.write('\n')
+        return len(entries)
+    count = 0
+    for entry in entries:
+        output.write(format_entry(entry, root_directory, output_style) + '\n')
+        count += 1
+    return count
+
+
+def print_file_tree(root_directory, output_style='indent', log_file_path=None, as_json=False,
+                    ignore_git_folder=True):
+    """Print the tree, or write it to `log_file_path` through a single buffered handle."""
+    if not log_file_path:
+        return write_tree(sys.stdout, root_directory, output_style, as_json, ignore_git_folder=ignore_git_folder)
+    with open(log_file_path, 'w', encoding='utf-8', buffering=1024 * 1024) as log_file:
+        count = write_tree(log_file, root_directory, output_style, as_json, ignore_git_folder=ignore_git_folder)
+    print(f"Logged {count} entries to {log_file_path}")
+    return count
 
 
 if __name__ == '__main__':
-
-    project_root_directory = f"{Path(__file__).resolve().parent.parent}"
-    dir_patterns, f_patterns = read_gitignore(project_root_directory)
-    log_path = os.path.join(os.getcwd(), 'file_tree.log')
-
-    logging_enabled = False
-    style = 'tree'
-
-    if logging_enabled:
-        with open(log_path, 'w'):
-            pass
-
-    print_file_tree(
-        project_root_directory,
-        project_root_directory,
-        dir_patterns, f_patterns,
-        output_style=style,
-        write_to_file=logging_enabled,
-        log_file_path=log_path
-    )
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', nargs='?', default=f"{Path(__file__).resolve().parent.parent}")
+    parser.add_argument('--style', choices=['indent', 'tree'], default='tree')
+    parser.add_argument('--json', action='store_true', help="write the tree as nested JSON objects")
+    parser.add_argument('--output', help="write to this file, e.g. file_tree.log, instead of the terminal")
+    parser.add_argument('--include-git', action='store_true', help="list the .git folder too")
+    args = parser.parse_args()
+
+    print_file_tree(args.root, args.style, args.output, args.json, ignore_git_folder=not args.include_git)